@@ -1,13 +1,14 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 import io
-import sqlite3
+import itertools
 import os
 import tempfile
 import unicodedata
-from utils import analisar_todos_os_alunos
+from utils import analisar_todos_os_alunos, png_radar_blocos
+from cache_local import hash_bytes
+from banco_ahsd import conectar, preparar_esquema, ids_por_nome, pontuar_respostas
 from relatorios import gerar_relatorio_pdf, gerar_relatorio_completo_unificado
 from datetime import datetime
 from blocos_ahsd import blocos
@@ -19,91 +20,167 @@ from reportlab.lib.utils import simpleSplit
 def normalizar_texto(texto):
     return unicodedata.normalize("NFKD", texto.strip()).encode("ASCII", "ignore").decode("utf-8")
 
+def preparar_banco():
+    """Cria as tabelas que faltam ou migra um arquivo antigo (guardando uma cópia); só na 1ª vez do processo."""
+    if preparar_esquema():
+        st.toast("Banco de respostas migrado para o novo formato.", icon="✅")
+
 def init_db():
 
     if st.checkbox("🎓 Gerenciar alunos cadastrados"):
         gerenciar_alunos()
         st.divider()
 
-    
-    conn = sqlite3.connect("respostas_ahsd.db")
-    c = conn.cursor()
-
-    # Cria a tabela de respostas se não existir
-    c.execute('''CREATE TABLE IF NOT EXISTS respostas (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    aluno TEXT,
-                    perfil TEXT,
-                    pergunta TEXT,
-                    resposta TEXT,
-                    data_envio TEXT,
-                    bloco TEXT
-                )''')
-
-    # Cria a tabela de alunos se não existir
-    c.execute('''CREATE TABLE IF NOT EXISTS alunos (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    nome TEXT UNIQUE
-                )''')
-
-    # Cria a tabela de profissionais se não existir
-    c.execute('''CREATE TABLE IF NOT EXISTS profissionais (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    nome TEXT,
-                    perfil TEXT,
-                    disciplina TEXT,
-                    UNIQUE(nome, perfil)
-                )''')
-
-    conn.commit()
-    conn.close()
+# colunas do respondente (nome, disciplina/área) conforme o perfil
+COLUNAS_RESPONDENTE = {
+    "Professor": ("Nome do(a) Professor(a)", "Disciplina do professor"),
+    "Responsável": ("Nome do(a) Responsável", None),
+    "Artístico/Esportivo": ("Nome do(a) Profissional", "Área de atuação"),
+}
+
+def _coluna_texto(df, coluna):
+    """str(valor).strip() da coluna inteira, como célula a célula (NaN vira "nan"); '' se a coluna não existe."""
+    if coluna is None or coluna not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    serie = df[coluna]
+    return serie.astype(str).where(serie.notna(), "nan").str.strip().astype(object)
+
+# coluna do horário de envio na exportação do Google Forms
+COLUNAS_CARIMBO = ("Carimbo de data/hora", "Timestamp")
+# envios.carimbo das linhas sem carimbo: este prefixo + a impressão digital da linha
+PREFIXO_SEM_CARIMBO = "#"
+
+def _carimbos(df):
+    """
+    Horário de envio de cada linha em texto AAAA-MM-DDTHH:MM:SS (o mesmo envio lido do
+    CSV ou do Excel dá o mesmo texto); o texto original se não é data; '' sem a coluna.
+    """
+    coluna = next((c for c in COLUNAS_CARIMBO if c in df.columns), None)
+    if coluna is None:
+        return pd.Series("", index=df.index, dtype=object)
+    serie = df[coluna]
+    # ISO primeiro: com dayfirst, "2024-05-01" viraria 5 de janeiro
+    datas = pd.to_datetime(serie, format="ISO8601", errors="coerce")
+    datas = datas.fillna(pd.to_datetime(serie.where(datas.isna()), format="mixed", dayfirst=True, errors="coerce"))
+    texto = serie.astype(str).where(serie.notna(), "").str.strip()
+    return datas.dt.strftime("%Y-%m-%dT%H:%M:%S").where(datas.notna(), texto).astype(object)
+
+def _impressoes(perguntas, respostas):
+    """Impressão digital (SHA-1) de cada linha: as perguntas do arquivo e as respostas da linha."""
+    cabecalho = "\x1f".join(perguntas) + "\x1e"
+    return [hash_bytes((cabecalho + "\x1f".join(linha)).encode("utf-8")) for linha in respostas]
 
 def salvar_respostas_lote(df, perfil):
-    conn = sqlite3.connect("respostas_ahsd.db")
-    c = conn.cursor()
-
-    for _, linha in df.iterrows():
-        # Ignora se o nome do aluno estiver ausente ou vazio
-        if pd.isna(linha.get('Nome do(a) Aluno(a)', linha.get('Nome'))):
-            continue
-        nome_aluno = str(linha.get('Nome do(a) Aluno(a)', linha.get('Nome'))).strip()
-
-        # Cadastra aluno se ainda não existir
-        c.execute("SELECT id FROM alunos WHERE nome = ?", (nome_aluno,))
-        if not c.fetchone():
-            c.execute("INSERT INTO alunos (nome) VALUES (?)", (nome_aluno,))
-
-        nome_resp = ""
-        disciplina = ""
-
-        if perfil == "Professor":
-            nome_resp = str(linha.get('Nome do(a) Professor(a)', '')).strip()
-            disciplina = str(linha.get('Disciplina do professor', '')).strip()
-        elif perfil == "Responsável":
-            nome_resp = str(linha.get('Nome do(a) Responsável', '')).strip()
-        elif perfil == "Artístico/Esportivo":
-            nome_resp = str(linha.get('Nome do(a) Profissional', '')).strip()
-            disciplina = str(linha.get('Área de atuação', '')).strip()
-
-        if nome_resp:
-            c.execute("SELECT id FROM profissionais WHERE nome = ? AND perfil = ?", (nome_resp, perfil))
-            if not c.fetchone():
-                c.execute("INSERT INTO profissionais (nome, perfil, disciplina) VALUES (?, ?, ?)", (nome_resp, perfil, disciplina))
-
-        for bloco, perguntas in blocos.items():
-            for pergunta in perguntas:
-                if pergunta in df.columns:
-                    resposta = str(linha[pergunta])
-                    c.execute("""
-                        INSERT INTO respostas (aluno, perfil, pergunta, resposta, data_envio, bloco)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (nome_aluno, perfil, pergunta, resposta, datetime.now().isoformat(), bloco))
-
-    conn.commit()
-    conn.close()
+    """
+    Importa o questionário inteiro numa única transação: alunos, profissionais, blocos e
+    perguntas com INSERT OR IGNORE e as respostas de uma vez (executemany, só chaves
+    inteiras, o texto da resposta e seus pontos), com um só horário de importação.
+
+    Cada linha é um envio, identificado por (aluno, perfil, respondente, carimbo de
+    data/hora) e com a impressão digital das respostas:
+      - envio novo → gravado
+      - envio já importado com outras respostas (formulário editado) → regravado
+      - envio já importado igual, ou repetido no próprio arquivo → ignorado (vale a última linha)
+    Sem carimbo (coluna ausente ou célula vazia) não há como reconhecer o mesmo envio:
+    a linha só é ignorada se já existe um envio idêntico do aluno e respondente; senão
+    é gravada como envio novo (nunca substitui respostas já gravadas).
+    Retorna {"novas": n, "atualizadas": n, "ignoradas": n}.
+    """
+    relatorio = {"novas": 0, "atualizadas": 0, "ignoradas": 0}
+    col_nome = 'Nome do(a) Aluno(a)' if 'Nome do(a) Aluno(a)' in df.columns else 'Nome' if 'Nome' in df.columns else None
+    if col_nome is None:
+        return relatorio
+    # Ignora linhas com o nome do aluno ausente
+    df = df[df[col_nome].notna()]
+    if df.empty:
+        return relatorio
+
+    data_envio = datetime.now().isoformat()
+    nomes_alunos = df[col_nome].astype(str).str.strip().to_numpy(dtype=object)
+
+    col_resp, col_disc = COLUNAS_RESPONDENTE.get(perfil, (None, None))
+    profissionais = pd.DataFrame({"nome": _coluna_texto(df, col_resp), "disciplina": _coluna_texto(df, col_disc)})
+    profissionais = profissionais[profissionais["nome"] != ""].drop_duplicates("nome")  # 1ª disciplina vence
+    # respondente da chave do envio: '' quando a célula (ou a coluna) está vazia
+    respondentes = _coluna_texto(df, col_resp)
+    if col_resp in df.columns:
+        respondentes = respondentes.where(df[col_resp].notna(), "")
+
+    # pares (bloco, pergunta) presentes no arquivo, na ordem de blocos
+    pares = [(bloco, pergunta) for bloco, perguntas in blocos.items() for pergunta in perguntas if pergunta in df.columns]
+    blocos_pares = np.array([b for b, _ in pares], dtype=object)
+    perguntas_pares = np.array([p for _, p in pares], dtype=object)
+    respostas = df[list(perguntas_pares)]
+    respostas = respostas.astype(str).where(respostas.notna(), "nan").to_numpy(dtype=object)
+    impressoes = _impressoes(perguntas_pares, respostas)
+
+    n_linhas, n_perguntas = respostas.shape
+    conn = conectar()
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO profissionais (nome, perfil, disciplina) VALUES (?, ?, ?)",
+                         ((nome, perfil, disc) for nome, disc in zip(profissionais["nome"], profissionais["disciplina"])))
+        # textos → chaves inteiras (cadastrando alunos, blocos e perguntas novos)
+        ids_alunos = ids_por_nome(conn, "alunos", "nome", nomes_alunos)
+        ids_blocos = ids_por_nome(conn, "blocos", "nome", blocos_pares)
+        ids_perguntas = ids_por_nome(conn, "perguntas", "texto", perguntas_pares)
+        id_perfil = ids_por_nome(conn, "perfis", "nome", [perfil])[perfil]
+        alunos_linhas = np.array([ids_alunos[n] for n in nomes_alunos], dtype=object)
+
+        # envios já gravados deste perfil, comparados em lote pela chave e pela impressão
+        sql_envios = "SELECT aluno_id, respondente, carimbo, id, impressao FROM envios WHERE perfil_id = ?"
+        gravados = {(a, r, c): (id_envio, imp) for a, r, c, id_envio, imp in conn.execute(sql_envios, (id_perfil,))}
+        conteudos = {(a, r, imp) for (a, r, _), (_, imp) in gravados.items()}
+        # sem carimbo, a chave do envio usa a própria impressão: linhas iguais são o mesmo envio
+        carimbos = _carimbos(df).to_numpy(dtype=object)
+        chaves = [(a, r, c if c else PREFIXO_SEM_CARIMBO + imp)
+                  for a, r, c, imp in zip(alunos_linhas, respondentes, carimbos, impressoes)]
+        ultima_linha = {chave: i for i, chave in enumerate(chaves)}
+        novas, atualizadas = [], []
+        for chave, i in ultima_linha.items():
+            if not carimbos[i]:
+                if (chave[0], chave[1], impressoes[i]) not in conteudos:
+                    novas.append(i)
+                continue
+            anterior = gravados.get(chave)
+            if anterior is None:
+                novas.append(i)
+            elif anterior[1] != impressoes[i]:
+                atualizadas.append((i, anterior[0]))
+        relatorio = {"novas": len(novas), "atualizadas": len(atualizadas),
+                     "ignoradas": n_linhas - len(novas) - len(atualizadas)}
+        if not novas and not atualizadas:
+            return relatorio
+
+        # atualizadas: as respostas anteriores do envio saem e as da linha nova entram
+        conn.executemany("DELETE FROM respostas WHERE envio_id = ?", ((id_envio,) for _, id_envio in atualizadas))
+        conn.executemany("UPDATE envios SET impressao = ?, data_envio = ? WHERE id = ?",
+                         ((impressoes[i], data_envio, id_envio) for i, id_envio in atualizadas))
+        conn.executemany("""
+            INSERT INTO envios (aluno_id, perfil_id, respondente, carimbo, impressao, data_envio)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, ((chaves[i][0], id_perfil, chaves[i][1], chaves[i][2], impressoes[i], data_envio) for i in novas))
+        ids_envios = {(a, r, c): id_envio for a, r, c, id_envio, _ in conn.execute(sql_envios, (id_perfil,))}
+
+        linhas = np.array(sorted(novas + [i for i, _ in atualizadas]), dtype=np.intp)
+        gravar = respostas[linhas]
+        registros = zip(
+            np.repeat(alunos_linhas[linhas], n_perguntas),
+            itertools.repeat(id_perfil),
+            np.tile(np.array([ids_blocos[b] for b in blocos_pares], dtype=object), len(linhas)),
+            np.tile(np.array([ids_perguntas[p] for p in perguntas_pares], dtype=object), len(linhas)),
+            gravar.ravel(),
+            pontuar_respostas(gravar.ravel()),
+            itertools.repeat(data_envio),
+            np.repeat(np.array([ids_envios[chaves[i]] for i in linhas], dtype=object), n_perguntas),
+        )
+        conn.executemany("""
+            INSERT INTO respostas (aluno_id, perfil_id, bloco_id, pergunta_id, resposta, pontos, data_envio, envio_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, registros)
+    return relatorio
 
 def gerenciar_profissionais():
-    conn = sqlite3.connect("respostas_ahsd.db")
+    conn = conectar()
     c = conn.cursor()
 
     st.subheader("👥 Profissionais Cadastrados")
@@ -129,29 +206,25 @@ def gerenciar_profissionais():
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("💾 Salvar alterações"):
-                    c.execute("""
-                        UPDATE profissionais SET nome = ?, perfil = ?, disciplina = ? WHERE id = ?
-                    """, (novo_nome.strip(), novo_perfil, nova_disciplina.strip(), id_sel))
-                    conn.commit()
+                    with conn:
+                        c.execute("""
+                            UPDATE profissionais SET nome = ?, perfil = ?, disciplina = ? WHERE id = ?
+                        """, (novo_nome.strip(), novo_perfil, nova_disciplina.strip(), id_sel))
                     st.toast("Alterações salvas com sucesso!", icon="✅")
                     st.rerun()
             with col2:
                 if st.button("🗑️ Excluir profissional"):
-                    c.execute("DELETE FROM profissionais WHERE id = ?", (id_sel,))
-                    conn.commit()
+                    with conn:
+                        c.execute("DELETE FROM profissionais WHERE id = ?", (id_sel,))
                     st.toast("Profissional excluído.", icon="⚠️")
                     st.experimental_rerun()
 
     else:
         st.info("Nenhum profissional cadastrado até o momento.")
 
-    conn.close()
     st.subheader("👥 Profissionais Cadastrados")
-    conn = sqlite3.connect("respostas_ahsd.db")
-    c = conn.cursor()
     c.execute("SELECT nome, perfil, disciplina FROM profissionais ORDER BY perfil, nome")
     dados = c.fetchall()
-    conn.close()
 
     if dados:
         df = pd.DataFrame(dados, columns=["Nome", "Perfil", "Disciplina"])
@@ -161,7 +234,7 @@ def gerenciar_profissionais():
 
 def gerenciar_alunos():
     st.subheader("👩‍🎓 Alunos Cadastrados")
-    conn = sqlite3.connect("respostas_ahsd.db")
+    conn = conectar()
     c = conn.cursor()
     c.execute("SELECT id, nome FROM alunos ORDER BY nome")
     dados = c.fetchall()
@@ -183,29 +256,28 @@ def gerenciar_alunos():
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("💾 Salvar alterações"):
-                    c.execute("UPDATE alunos SET nome = ? WHERE id = ?", (novo_nome.strip(), id_sel))
-                    conn.commit()
+                    with conn:
+                        c.execute("UPDATE alunos SET nome = ? WHERE id = ?", (novo_nome.strip(), id_sel))
                     st.success("Alterações salvas com sucesso!")
                     st.experimental_rerun()
             with col2:
                 if st.button("🗑️ Excluir aluno"):
-                    c.execute("DELETE FROM alunos WHERE id = ?", (id_sel,))
-                    conn.commit()
+                    with conn:
+                        c.execute("DELETE FROM alunos WHERE id = ?", (id_sel,))
                     st.warning("Aluno excluído.")
                     st.experimental_rerun()
     else:
         st.info("Nenhum aluno cadastrado ainda.")
 
-    conn.close()
-
 def analisar_respostas_aluno():
     st.subheader("📊 Análise Detalhada por Aluno")
-    conn = sqlite3.connect("respostas_ahsd.db")
+    conn = conectar()
     c = conn.cursor()
 
     # Lista alunos
-    c.execute("SELECT nome FROM alunos ORDER BY nome")
-    nomes = [row[0] for row in c.fetchall()]
+    c.execute("SELECT nome, id FROM alunos ORDER BY nome")
+    ids_alunos = dict(c.fetchall())
+    nomes = list(ids_alunos)
 
     if not nomes:
         st.info("Nenhum aluno cadastrado.")
@@ -217,27 +289,35 @@ def analisar_respostas_aluno():
         return
 
     # Seleciona o perfil desejado
-    c.execute("SELECT DISTINCT perfil FROM respostas WHERE aluno = ?", (aluno_sel,))
+    c.execute("""
+        SELECT DISTINCT pf.nome FROM respostas r JOIN perfis pf ON pf.id = r.perfil_id
+        WHERE r.aluno_id = ?
+    """, (ids_alunos[aluno_sel],))
     perfis_disponiveis = sorted([row[0] for row in c.fetchall()])
     perfil_sel = st.selectbox("👤 Filtrar por perfil", ["Todos"] + perfis_disponiveis)
 
-    # Busca as respostas de acordo com o perfil selecionado
+    # Busca as respostas de acordo com o perfil selecionado (busca pelo índice aluno/perfil/bloco)
+    sql = """
+        SELECT b.nome, pg.texto, r.resposta, pf.nome, r.pontos
+        FROM respostas r
+        JOIN blocos b ON b.id = r.bloco_id
+        JOIN perguntas pg ON pg.id = r.pergunta_id
+        JOIN perfis pf ON pf.id = r.perfil_id
+        WHERE r.aluno_id = ? {filtro}
+        ORDER BY r.id
+    """
     if perfil_sel == "Todos":
-        c.execute("SELECT bloco, pergunta, resposta, perfil FROM respostas WHERE aluno = ?", (aluno_sel,))
+        c.execute(sql.format(filtro=""), (ids_alunos[aluno_sel],))
     else:
-        c.execute("SELECT bloco, pergunta, resposta, perfil FROM respostas WHERE aluno = ? AND perfil = ?", (aluno_sel, perfil_sel))
+        c.execute(sql.format(filtro="AND r.perfil_id = (SELECT id FROM perfis WHERE nome = ?)"), (ids_alunos[aluno_sel], perfil_sel))
 
     dados = c.fetchall()
-    conn.close()
 
     if not dados:
         st.warning("Este aluno ainda não possui respostas registradas.")
         return
 
-    df = pd.DataFrame(dados, columns=["Bloco", "Pergunta", "Resposta", "Perfil"])
-
-    mapa_respostas = {"Nunca": 0, "Raramente": 1, "Às vezes": 2, "As vezes": 2, "Frequentemente": 3, "Sempre": 4}
-    mapa_diagnostico = {"Sim": 4, "Não": 0, "Altas": 4, "Alta": 4, "Média": 2, "Medias": 2, "Médias": 2, "Baixa": 0, "Baixas": 0}
+    df = pd.DataFrame(dados, columns=["Bloco", "Pergunta", "Resposta", "Perfil", "Pontos"])
 
     medias_blocos = {}
 
@@ -249,9 +329,8 @@ def analisar_respostas_aluno():
             for _, linha in bloco_df.drop_duplicates(subset=["Pergunta", "Resposta"]).iterrows():
                 st.markdown(f"**{linha['Pergunta']}** → _{linha['Resposta']}_")
         else:
-            respostas = bloco_df["Resposta"].apply(lambda x: unicodedata.normalize("NFKD", str(x).strip()).encode("ASCII", "ignore").decode("utf-8"))
-            respostas_numericas = respostas.map(mapa_respostas).fillna(respostas.map(mapa_diagnostico))
-            media = pd.to_numeric(respostas_numericas, errors="coerce").mean()
+            # pontos gravados na importação (banco_ahsd.pontuar_resposta)
+            media = pd.to_numeric(bloco_df["Pontos"], errors="coerce").mean()
             if pd.notna(media):
                 st.markdown(f"**Pontuação média:** `{media:.2f} / 4.00`")
                 st.progress(media / 4)
@@ -268,31 +347,15 @@ def analisar_respostas_aluno():
 
         st.divider()
         st.subheader("📈 Radar de Pontuação por Bloco")
-        labels = list(medias_blocos.keys())
-        valores = list(medias_blocos.values())
-        labels_plot = labels + [labels[0]]
-        valores_plot = valores + [valores[0]]
-        angles = np.linspace(0, 2 * np.pi, len(labels), endpoint=False).tolist()
-        angles += angles[:1]
-
         escala = st.slider("📐 Escala visual do gráfico", 3, 8, 5)
+        # mesmo PNG (memoizado) para a tela, o download e os relatórios PDF
+        png_radar = png_radar_blocos(medias_blocos, f'Radar – {aluno_sel}', escala)
         col1, col2, col3 = st.columns([1, 6, 1])
         with col2:
-            fig, ax = plt.subplots(figsize=(escala, escala * 0.8), subplot_kw=dict(polar=True))
-            ax.plot(angles, valores_plot, linewidth=2, linestyle='solid', marker='o')
-            ax.fill(angles, valores_plot, alpha=0.25)
-            ax.set_yticks([0, 1, 2, 3, 4])
-            ax.set_yticklabels(['0', '1', '2', '3', '4'], fontsize=8)
-            ax.set_ylim(0, 4)
-            ax.set_xticks(angles)
-            ax.set_xticklabels(labels_plot, fontsize=9)
-            ax.set_title(f'Radar – {aluno_sel}', size=13, pad=10)
-            st.pyplot(fig)
+            st.image(png_radar)
 
         # Exporta o gráfico como imagem PNG
-        buf = io.BytesIO()
-        fig.savefig(buf, format="png", bbox_inches="tight")
-        buf.seek(0)
+        buf = io.BytesIO(png_radar)
 
         nome_limpo = aluno_sel.replace(" ", "_").lower()
         nome_arquivo = f"grafico_radar_{nome_limpo}.png"
@@ -310,6 +373,7 @@ def analisar_respostas_aluno():
 
 def run_ah_mode():
     st.title("📤 Importação de Respostas - Altas Habilidades/Superdotação")
+    preparar_banco()
 
     if st.checkbox("📊 Acessar análise por aluno"):
         analisar_respostas_aluno()
@@ -334,8 +398,13 @@ def run_ah_mode():
                 st.error("❌ O arquivo deve conter uma coluna com o nome do aluno.")
                 return
 
-            salvar_respostas_lote(df, perfil)
+            relatorio = salvar_respostas_lote(df, perfil)
             st.success("✅ Respostas importadas e associadas aos alunos e profissionais com sucesso!")
+            st.markdown(
+                f"**Novos:** {relatorio['novas']} questionário(s) · "
+                f"**Atualizados:** {relatorio['atualizadas']} (respostas alteradas no formulário) · "
+                f"**Ignorados:** {relatorio['ignoradas']} (já importados ou repetidos no arquivo)"
+            )
 
         except Exception as e:
             st.error(f"Erro ao processar o arquivo: {e}")
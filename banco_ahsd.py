@@ -0,0 +1,366 @@
+# banco_ahsd.py
+# ------------------------------------------------------------
+# Banco das respostas de Altas Habilidades/Superdotação (SQLite)
+# - Perguntas, blocos e perfis "internados" em tabelas próprias: cada resposta
+#   guarda só chaves inteiras, não o texto da pergunta e do bloco
+# - Índice composto (aluno, perfil, bloco): a análise de um aluno é busca por índice
+# - Pontos de cada resposta (0–4) gravados na importação: médias por bloco e
+#   ranking dos alunos saem de GROUP BY, sem trazer as respostas para o pandas
+# - Migração dos arquivos antigos (respostas com colunas de texto, ou sem os
+#   pontos), com cópia de segurança e VACUUM no fim
+# - Cada linha importada do questionário (envio) tem chave única e impressão
+#   digital das respostas: reimportar o mesmo arquivo não duplica nada
+# - Uma conexão por sessão do Streamlit, reaproveitada entre os reruns (cada rerun
+#   roda numa thread nova), em modo WAL: leituras não esperam a importação, e escritas
+#   concorrentes esperam (busy_timeout) em vez de falhar com "database is locked";
+#   o esquema é conferido uma vez por processo
+#
+# Uso (migração manual; o app também migra sozinho ao abrir um arquivo antigo):
+#   python banco_ahsd.py respostas_ahsd.db
+#   python banco_ahsd.py respostas_ahsd.db --sem-backup
+# ------------------------------------------------------------
+
+import os
+import sys
+import argparse
+import threading
+import unicodedata
+
+import sqlite3
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# arquivo do banco; ajuste pela variável de ambiente
+CAMINHO_AHSD = os.environ.get("AHSD_DB", "respostas_ahsd.db")
+
+# espera máxima por um lock de escrita de outra sessão antes de desistir
+ESPERA_LOCK_MS = int(os.environ.get("AHSD_ESPERA_LOCK_MS", "10000"))
+
+# ajustes de cada conexão nova (WAL: leitores e um escritor ao mesmo tempo;
+# synchronous=NORMAL é seguro em WAL e não sincroniza o disco a cada transação)
+PRAGMAS_AHSD = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "busy_timeout": ESPERA_LOCK_MS,
+    "cache_size": -16 * 1024,          # em KiB (negativo): 16 MB de cache de páginas
+    "mmap_size": 64 * 1024 * 1024,     # leituras por mmap até 64 MB do arquivo
+    "temp_store": "MEMORY",
+}
+
+# PRAGMA user_version dos arquivos no esquema atual
+# (1 = respostas com colunas de texto, 2 = chaves inteiras sem os pontos,
+#  3 = sem os envios)
+VERSAO_ESQUEMA = 4
+
+ESQUEMA_AHSD = """
+CREATE TABLE IF NOT EXISTS alunos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nome TEXT UNIQUE
+);
+CREATE TABLE IF NOT EXISTS profissionais (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nome TEXT,
+    perfil TEXT,
+    disciplina TEXT,
+    UNIQUE(nome, perfil)
+);
+CREATE TABLE IF NOT EXISTS perfis (
+    id INTEGER PRIMARY KEY,
+    nome TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS blocos (
+    id INTEGER PRIMARY KEY,
+    nome TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS perguntas (
+    id INTEGER PRIMARY KEY,
+    texto TEXT NOT NULL UNIQUE
+);
+-- uma linha do questionário importada: a chave única identifica o envio do formulário
+-- e a impressão digital resume as respostas (mudou → o envio é regravado)
+CREATE TABLE IF NOT EXISTS envios (
+    id INTEGER PRIMARY KEY,
+    aluno_id INTEGER NOT NULL REFERENCES alunos(id) ON DELETE CASCADE,
+    perfil_id INTEGER NOT NULL REFERENCES perfis(id),
+    respondente TEXT NOT NULL,         -- nome de quem respondeu ('' se o arquivo não tem)
+    carimbo TEXT NOT NULL,             -- "Carimbo de data/hora" do formulário ('#' + impressão se não tem)
+    impressao TEXT NOT NULL,           -- SHA-1 das perguntas e respostas da linha
+    data_envio TEXT,                   -- última importação que gravou as respostas
+    UNIQUE (aluno_id, perfil_id, respondente, carimbo)
+);
+CREATE TABLE IF NOT EXISTS respostas (
+    id INTEGER PRIMARY KEY,
+    aluno_id INTEGER NOT NULL REFERENCES alunos(id) ON DELETE CASCADE,
+    perfil_id INTEGER NOT NULL REFERENCES perfis(id),
+    bloco_id INTEGER NOT NULL REFERENCES blocos(id),
+    pergunta_id INTEGER NOT NULL REFERENCES perguntas(id),
+    resposta TEXT,
+    pontos REAL,                       -- pontuar_resposta(resposta); NULL se não é de escala
+    data_envio TEXT,
+    envio_id INTEGER REFERENCES envios(id) ON DELETE CASCADE  -- NULL nas importações antigas
+);
+-- respostas de um aluno (de um perfil, de um bloco): busca por índice; com os pontos
+-- no fim, as médias por aluno e por bloco (GROUP BY) leem só os índices, não a tabela
+CREATE INDEX IF NOT EXISTS idx_respostas_aluno_perfil_bloco ON respostas (aluno_id, perfil_id, bloco_id, pontos);
+CREATE INDEX IF NOT EXISTS idx_respostas_bloco_pontos ON respostas (bloco_id, pontos);
+-- regravar (ou excluir) um envio apaga suas respostas pelo índice
+CREATE INDEX IF NOT EXISTS idx_respostas_envio ON respostas (envio_id);
+"""
+
+# versão 1 → atual, numa só transação (executescript).
+# Os ids das respostas são mantidos (a ordem de inserção continua a mesma) e as
+# tabelas de nomes recebem os valores na ordem em que apareceram pela primeira vez.
+# Respostas de alunos que já tinham sido excluídos da tabela alunos voltam a ter cadastro.
+_SQL_MIGRACAO_V1 = """
+BEGIN;
+ALTER TABLE respostas RENAME TO respostas_v1;
+{esquema}
+INSERT OR IGNORE INTO alunos (nome)
+    SELECT COALESCE(aluno, '') FROM respostas_v1 GROUP BY COALESCE(aluno, '') ORDER BY MIN(id);
+INSERT OR IGNORE INTO perfis (nome)
+    SELECT COALESCE(perfil, '') FROM respostas_v1 GROUP BY COALESCE(perfil, '') ORDER BY MIN(id);
+INSERT OR IGNORE INTO blocos (nome)
+    SELECT COALESCE(bloco, '') FROM respostas_v1 GROUP BY COALESCE(bloco, '') ORDER BY MIN(id);
+INSERT OR IGNORE INTO perguntas (texto)
+    SELECT COALESCE(pergunta, '') FROM respostas_v1 GROUP BY COALESCE(pergunta, '') ORDER BY MIN(id);
+INSERT INTO respostas (id, aluno_id, perfil_id, bloco_id, pergunta_id, resposta, pontos, data_envio)
+    SELECT r.id, a.id, pf.id, b.id, pg.id, r.resposta, pontuar_resposta(r.resposta), r.data_envio
+    FROM respostas_v1 r
+    JOIN alunos a ON a.nome = COALESCE(r.aluno, '')
+    JOIN perfis pf ON pf.nome = COALESCE(r.perfil, '')
+    JOIN blocos b ON b.nome = COALESCE(r.bloco, '')
+    JOIN perguntas pg ON pg.texto = COALESCE(r.pergunta, '')
+    ORDER BY r.id;
+DROP TABLE respostas_v1;
+PRAGMA user_version = {versao};
+COMMIT;
+"""
+
+# arquivos com chaves inteiras: passo de cada versão para a seguinte, aplicados em
+# sequência na mesma transação; o esquema atual vem depois, com tabelas e índices novos
+_PASSOS_MIGRACAO = {
+    # 2 → 3: pontos calculados para as respostas já gravadas
+    2: """
+ALTER TABLE respostas ADD COLUMN pontos REAL;
+UPDATE respostas SET pontos = pontuar_resposta(resposta);
+DROP INDEX IF EXISTS idx_respostas_aluno_perfil_bloco;
+""",
+    # 3 → 4: respostas ligadas ao envio; as já gravadas ficam sem envio (sem impressão digital)
+    3: """
+ALTER TABLE respostas ADD COLUMN envio_id INTEGER REFERENCES envios(id) ON DELETE CASCADE;
+""",
+}
+
+# ------------------------------------------------------------
+# Pontuação das respostas (0–4)
+# ------------------------------------------------------------
+
+MAPA_RESPOSTAS = {"Nunca": 0, "Raramente": 1, "Às vezes": 2, "As vezes": 2, "Frequentemente": 3, "Sempre": 4}
+MAPA_DIAGNOSTICO = {"Sim": 4, "Não": 0, "Altas": 4, "Alta": 4, "Média": 2, "Medias": 2, "Médias": 2, "Baixa": 0, "Baixas": 0}
+
+
+def pontuar_resposta(resposta):
+    """
+    Pontos de uma resposta: o texto sem acentos na escala de frequência e, se não
+    estiver nela, na de diagnóstico. None para texto livre, resposta em branco etc.
+    """
+    texto = unicodedata.normalize("NFKD", str(resposta).strip()).encode("ASCII", "ignore").decode("utf-8")
+    pontos = MAPA_RESPOSTAS.get(texto, MAPA_DIAGNOSTICO.get(texto))
+    return None if pontos is None else float(pontos)
+
+
+def pontuar_respostas(respostas):
+    """pontuar_resposta de cada item, calculada uma vez por texto distinto."""
+    pontos = {texto: pontuar_resposta(texto) for texto in set(respostas)}
+    return [pontos[texto] for texto in respostas]
+
+
+# ------------------------------------------------------------
+# Conexões
+# ------------------------------------------------------------
+
+_conexoes = threading.local()          # {caminho: conexão} de cada thread, fora do app
+_esquemas_prontos = set()
+_lock_esquema = threading.Lock()
+
+
+def abrir(caminho=None, entre_threads=False):
+    """
+    Conexão nova com os PRAGMAS_AHSD (chaves estrangeiras ligadas: excluir um aluno
+    exclui suas respostas). Quem abre, fecha; no app use conectar().
+      - entre_threads: pode ser usada por outra thread (uma de cada vez)
+    """
+    conn = sqlite3.connect(caminho or CAMINHO_AHSD, timeout=ESPERA_LOCK_MS / 1000,
+                           check_same_thread=not entre_threads)
+    for pragma, valor in PRAGMAS_AHSD.items():
+        conn.execute(f"PRAGMA {pragma} = {valor}")
+    return conn
+
+
+def preparar_esquema(caminho=None):
+    """
+    Confere o esquema (criando as tabelas ou migrando um arquivo antigo) uma única vez
+    por arquivo neste processo. Retorna True só na chamada que migrou o arquivo.
+    """
+    caminho = os.path.abspath(caminho or CAMINHO_AHSD)
+    if caminho in _esquemas_prontos:
+        return False
+    with _lock_esquema:
+        if caminho in _esquemas_prontos:
+            return False
+        migrou = criar_esquema(_conexao_do_dono(caminho))
+        _esquemas_prontos.add(caminho)
+    return migrou
+
+
+def _conexao_do_dono(caminho):
+    """
+    Conexão de quem chama: da sessão do Streamlit (guardada no session_state, vale entre
+    os reruns, que rodam um de cada vez, e some com a sessão) ou, fora do app, da thread.
+    """
+    na_sessao = get_script_run_ctx(suppress_warning=True) is not None
+    if na_sessao:
+        conexoes = st.session_state.setdefault("_conexoes_ahsd", {})
+    else:
+        conexoes = getattr(_conexoes, "por_caminho", None)
+        if conexoes is None:
+            conexoes = _conexoes.por_caminho = {}
+    if caminho not in conexoes:
+        conexoes[caminho] = abrir(caminho, entre_threads=na_sessao)
+    return conexoes[caminho]
+
+
+def conectar(caminho=None):
+    """
+    Conexão com o banco AH/SD, aberta na primeira chamada da sessão do Streamlit (ou da
+    thread, fora do app) e reaproveitada nas seguintes, inclusive em outros reruns
+    (não feche). Transações com "with conn:". O esquema já vem pronto.
+    """
+    caminho = os.path.abspath(caminho or CAMINHO_AHSD)
+    preparar_esquema(caminho)
+    return _conexao_do_dono(caminho)
+
+
+# ------------------------------------------------------------
+# Esquema e migração
+# ------------------------------------------------------------
+
+def _colunas(conn, tabela):
+    return {linha[1] for linha in conn.execute(f"PRAGMA table_info({tabela})")}
+
+
+def versao_arquivo(conn):
+    """Versão do esquema pelas colunas de respostas (um arquivo vazio já nasce na atual)."""
+    colunas = _colunas(conn, "respostas")
+    if "aluno" in colunas:
+        return 1
+    if colunas and "pontos" not in colunas:
+        return 2
+    if colunas and "envio_id" not in colunas:
+        return 3
+    return VERSAO_ESQUEMA
+
+
+def precisa_migrar(conn):
+    """True se o arquivo ainda está num esquema antigo (ver VERSAO_ESQUEMA)."""
+    return versao_arquivo(conn) < VERSAO_ESQUEMA
+
+
+def criar_esquema(conn, backup=True):
+    """
+    Deixa o banco no esquema atual: cria as tabelas que faltam ou, num arquivo
+    antigo, migra as respostas (ver migrar). Retorna True se houve migração.
+    """
+    if precisa_migrar(conn):
+        migrar(conn, backup)
+        return True
+    conn.executescript(ESQUEMA_AHSD)
+    if conn.execute("PRAGMA user_version").fetchone()[0] < VERSAO_ESQUEMA:
+        conn.execute(f"PRAGMA user_version = {VERSAO_ESQUEMA}")
+    return False
+
+
+def caminho_backup(conn):
+    """<arquivo>.v<versão>.bak: a cópia de cada versão migrada fica separada."""
+    arquivo = conn.execute("PRAGMA database_list").fetchone()[2]
+    return f"{arquivo}.v{versao_arquivo(conn)}.bak"
+
+
+def migrar(conn, backup=True, compactar=True):
+    """
+    Migra um arquivo antigo para o esquema atual numa única transação (ou nada muda).
+      - backup: grava antes uma cópia do arquivo (caminho_backup); devolve o caminho dela
+      - compactar: VACUUM no fim, devolvendo ao disco o espaço dos textos repetidos
+    """
+    copia = None
+    if backup:
+        copia = caminho_backup(conn)
+        destino = sqlite3.connect(copia)
+        try:
+            conn.backup(destino)
+        finally:
+            destino.close()
+    versao = versao_arquivo(conn)
+    if versao == 1:
+        script = _SQL_MIGRACAO_V1.format(esquema=ESQUEMA_AHSD, versao=VERSAO_ESQUEMA)
+    else:
+        passos = "".join(_PASSOS_MIGRACAO[v] for v in range(versao, VERSAO_ESQUEMA))
+        script = f"BEGIN;\n{passos}{ESQUEMA_AHSD}\nPRAGMA user_version = {VERSAO_ESQUEMA};\nCOMMIT;\n"
+    conn.create_function("pontuar_resposta", 1, pontuar_resposta, deterministic=True)
+    # chaves estrangeiras desligadas durante a troca das tabelas (só funciona fora de transação)
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        conn.executescript(script)
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+    if compactar:
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # em WAL, o arquivo só encolhe no checkpoint
+    return copia
+
+
+def ids_por_nome(conn, tabela, coluna, valores):
+    """
+    {valor: id} da tabela de nomes (alunos, perfis, blocos, perguntas), cadastrando
+    os valores que ainda não existem (INSERT OR IGNORE). Deve rodar dentro da
+    transação da importação. As tabelas de nomes são pequenas: lidas inteiras.
+    """
+    conn.executemany(f"INSERT OR IGNORE INTO {tabela} ({coluna}) VALUES (?)",
+                     ((valor,) for valor in dict.fromkeys(valores)))
+    return dict(conn.execute(f"SELECT {coluna}, id FROM {tabela}"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migra um banco de respostas AH/SD antigo para o esquema atual (chaves inteiras e pontos).")
+    parser.add_argument("arquivo", nargs="?", default=CAMINHO_AHSD, help="arquivo .db (padrão: %(default)s)")
+    parser.add_argument("--sem-backup", action="store_true", help="não grava a cópia <arquivo>.v<versão>.bak antes de migrar")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.arquivo):
+        print(f"Arquivo não encontrado: {args.arquivo}", file=sys.stderr)
+        return 1
+    antes = os.path.getsize(args.arquivo)
+    conn = abrir(args.arquivo)
+    try:
+        if not precisa_migrar(conn):
+            criar_esquema(conn)
+            print(f"{args.arquivo} já está no esquema atual (versão {VERSAO_ESQUEMA}).")
+            return 0
+        backup = migrar(conn, backup=not args.sem_backup)
+        respostas = conn.execute("SELECT COUNT(*) FROM respostas").fetchone()[0]
+    finally:
+        conn.close()
+    depois = os.path.getsize(args.arquivo)
+    print(f"{respostas} respostas migradas para a versão {VERSAO_ESQUEMA}: {antes / 1e6:.1f} MB → {depois / 1e6:.1f} MB"
+          + (f" (cópia em {backup})" if backup else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+# cache_local.py
+# ------------------------------------------------------------
+# Caches locais compartilhados pelos modos do dashboard
+# - hash_bytes/hash_arquivo: chave estável pelo conteúdo do arquivo enviado
+# - CacheLRU: cache em memória limitado por nº de itens e/ou bytes,
+#   com callback para "derramar" (spill) o item mais antigo
+# - salvar_parquet/ler_parquet: persistência colunar de DataFrames
+# - png_grafico: gráficos renderizados (PNG) memoizados por dados e tamanho
+# Os caches vivem no processo do Streamlit (valem para todas as sessões).
+# ------------------------------------------------------------
+
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# pasta local para arquivos de cache (fora do controle de versão)
+PASTA_CACHE = os.environ.get("SMART_EDU_CACHE", ".cache")
+
+
+def hash_bytes(dados):
+    """SHA-1 hexadecimal de um bloco de bytes (mesmo arquivo → mesma chave)."""
+    return hashlib.sha1(dados).hexdigest()
+
+
+def hash_arquivo(arquivo, tamanho_bloco=1 << 20):
+    """
+    Mesmo hash de hash_bytes, lendo um arquivo (binário, com seek) em blocos,
+    sem copiar o conteúdo inteiro. Volta o cursor para onde estava.
+    """
+    inicio = arquivo.tell()
+    arquivo.seek(0)
+    h = hashlib.sha1()
+    for bloco in iter(lambda: arquivo.read(tamanho_bloco), b""):
+        h.update(bloco)
+    arquivo.seek(inicio)
+    return h.hexdigest()
+
+
+class CacheLRU:
+    """
+    Cache LRU thread-safe.
+      - max_itens: nº máximo de entradas (None = sem limite)
+      - max_bytes: orçamento de memória, medido com a função 'tamanho' (None = sem limite)
+      - ao_despejar(chave, valor): chamado para cada entrada removida por falta de espaço
+    """
+
+    def __init__(self, max_itens=None, max_bytes=None, tamanho=None, ao_despejar=None):
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self.tamanho = tamanho or (lambda valor: 0)
+        self.ao_despejar = ao_despejar
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def get(self, chave, padrao=None):
+        with self._lock:
+            if chave not in self._itens:
+                return padrao
+            self._itens.move_to_end(chave)
+            return self._itens[chave][0]
+
+    def put(self, chave, valor):
+        tam = self.tamanho(valor)
+        despejados = []
+        with self._lock:
+            if chave in self._itens:
+                self._bytes -= self._itens.pop(chave)[1]
+            # item maior que o orçamento inteiro não é guardado em memória
+            if self.max_bytes is not None and tam > self.max_bytes:
+                despejados.append((chave, valor))
+            else:
+                self._itens[chave] = (valor, tam)
+                self._bytes += tam
+                while self._itens and self._excedeu():
+                    chave_velha, (valor_velho, tam_velho) = self._itens.popitem(last=False)
+                    self._bytes -= tam_velho
+                    despejados.append((chave_velha, valor_velho))
+        # callback fora do lock (pode fazer I/O)
+        if self.ao_despejar:
+            for chave_velha, valor_velho in despejados:
+                self.ao_despejar(chave_velha, valor_velho)
+
+    def _excedeu(self):
+        if self.max_itens is not None and len(self._itens) > self.max_itens:
+            return True
+        return self.max_bytes is not None and self._bytes > self.max_bytes
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    @property
+    def bytes_usados(self):
+        return self._bytes
+
+    def __contains__(self, chave):
+        with self._lock:
+            return chave in self._itens
+
+    def __len__(self):
+        return len(self._itens)
+
+
+def caminho_cache(subpasta, nome):
+    """Caminho dentro de PASTA_CACHE/subpasta (cria a pasta se preciso)."""
+    pasta = os.path.join(PASTA_CACHE, subpasta)
+    os.makedirs(pasta, exist_ok=True)
+    return os.path.join(pasta, nome)
+
+
+def salvar_parquet(df, caminho):
+    """
+    Grava o DataFrame em Parquet (escrita atômica via arquivo temporário).
+    Retorna False se o pyarrow não estiver disponível ou se alguma coluna
+    tiver tipos mistos que o formato colunar não aceita.
+    """
+    tmp = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        df.to_parquet(tmp, index=True)
+        os.replace(tmp, caminho)
+        return True
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+
+
+def ler_parquet(caminho):
+    """Lê um Parquet salvo por salvar_parquet; None se não existir ou estiver ilegível."""
+    if not os.path.exists(caminho):
+        return None
+    try:
+        df = pd.read_parquet(caminho)
+        os.utime(caminho)  # marca como usado recentemente (para a poda)
+        return df
+    except Exception:
+        return None
+
+
+def podar_pasta(subpasta, max_arquivos):
+    """Mantém só os 'max_arquivos' arquivos usados mais recentemente em PASTA_CACHE/subpasta."""
+    pasta = os.path.join(PASTA_CACHE, subpasta)
+    if not os.path.isdir(pasta):
+        return
+    arquivos = [os.path.join(pasta, n) for n in os.listdir(pasta) if not n.endswith(".tmp")]
+    arquivos.sort(key=os.path.getmtime, reverse=True)
+    for caminho in arquivos[max_arquivos:]:
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+# -----------------------------
+# Cache de gráficos renderizados (PNG)
+# -----------------------------
+# orçamento de memória para PNGs (MB); ajuste pela variável de ambiente
+MAX_MB_GRAFICOS = int(os.environ.get("SMART_EDU_CACHE_GRAFICOS_MB", "64"))
+
+_cache_graficos = CacheLRU(max_bytes=MAX_MB_GRAFICOS * 1024 * 1024, tamanho=len)
+
+
+def _atualizar_digest(h, obj):
+    if isinstance(obj, (tuple, list)):
+        h.update(f"{type(obj).__name__}[{len(obj)}]".encode())
+        for item in obj:
+            _atualizar_digest(h, item)
+    elif isinstance(obj, dict):
+        h.update(f"dict[{len(obj)}]".encode())
+        for chave, valor in obj.items():
+            _atualizar_digest(h, chave)
+            _atualizar_digest(h, valor)
+    elif isinstance(obj, (pd.DataFrame, pd.Series)):
+        h.update(type(obj).__name__.encode())
+        h.update(repr(obj.index.tolist()).encode("utf-8"))
+        if isinstance(obj, pd.DataFrame):
+            h.update(repr(obj.columns.tolist()).encode("utf-8"))
+        else:
+            h.update(repr(obj.name).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes())
+    elif hasattr(obj, "tobytes") and hasattr(obj, "dtype"):
+        h.update(str(obj.dtype).encode())
+        h.update(repr(obj.shape).encode())
+        h.update(obj.tobytes())
+    else:
+        h.update(repr(obj).encode("utf-8"))
+    h.update(b"\x00")
+
+
+def digest_dados(*objs):
+    """
+    Digest estável dos dados de um gráfico (DataFrame, Series, ndarray, listas, dicts, escalares).
+    Índices e nomes de colunas entram no digest, não só os valores.
+    """
+    h = hashlib.sha1()
+    _atualizar_digest(h, objs)
+    return h.hexdigest()
+
+
+def chave_grafico(tipo, dados, largura, altura, opcoes=None, dpi=100, bbox_inches="tight"):
+    """Chave do cache de gráficos: (tipo, digest dos dados, tamanho, opções, saída)."""
+    return (tipo, digest_dados(dados), largura, altura, repr(opcoes), dpi, bbox_inches)
+
+
+def buscar_png(chave):
+    """PNG já renderizado para a chave, ou None."""
+    return _cache_graficos.get(chave)
+
+
+def guardar_png(chave, png):
+    _cache_graficos.put(chave, png)
+
+
+def figura_em_png(fig, dpi=100, bbox_inches="tight"):
+    """Salva a figura em PNG (bytes) e a fecha."""
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format="png", dpi=dpi, bbox_inches=bbox_inches)
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()
+
+
+def png_grafico(tipo, dados, largura, altura, desenhar, opcoes=None, dpi=100, bbox_inches="tight"):
+    """
+    Retorna os bytes PNG do gráfico, renderizando só se (tipo, dados, tamanho, opções) forem novos.
+      - desenhar(): cria e devolve a figura matplotlib (só é chamada em caso de falta no cache)
+      - dados: o que o gráfico mostra (entra no digest)
+      - opcoes: parâmetros visuais que mudam a imagem (título, tipo de gráfico, etc.)
+    """
+    chave = chave_grafico(tipo, dados, largura, altura, opcoes, dpi, bbox_inches)
+    png = buscar_png(chave)
+    if png is None:
+        png = figura_em_png(desenhar(), dpi=dpi, bbox_inches=bbox_inches)
+        guardar_png(chave, png)
+    return png
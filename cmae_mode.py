@@ -1,7 +1,18 @@
+import io
+import os
+import re
+import unicodedata
+import zipfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
 import streamlit as st
+import numpy as np
 import pandas as pd
+import matplotlib
 import matplotlib.pyplot as plt
-import io
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
@@ -9,12 +20,93 @@ from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
 from docx import Document
 from docx.shared import Inches
-from utils import CATEGORIAS_VALIDAS
+from openpyxl import load_workbook
+from utils import CATEGORIAS_VALIDAS, contar_respostas_categorias, mapa_colunas_categorias
+from cache_local import (
+    CacheLRU, hash_bytes, hash_arquivo, caminho_cache, salvar_parquet, ler_parquet, podar_pasta,
+    png_grafico, figura_em_png, digest_dados,
+)
+from historico_portage import salvar_avaliacoes, evolucao_aluno, evolucao_unidade, desenhar_evolucao
+
+# -----------------------------
+# Ingestão com cache (hash do arquivo)
+# -----------------------------
+SUBPASTA_CACHE_CMAE = "cmae"
+VERSAO_NORMALIZACAO = 1       # mude ao alterar normalizar_planilha (invalida os .parquet antigos)
+MAX_PLANILHAS_MEMORIA_CMAE = 4
+MAX_PLANILHAS_DISCO_CMAE = 24
+
+_cache_planilhas_cmae = CacheLRU(max_itens=MAX_PLANILHAS_MEMORIA_CMAE)
+
+def _arquivo_planilha(hash_conteudo):
+    return caminho_cache(SUBPASTA_CACHE_CMAE, f"{hash_conteudo}_v{VERSAO_NORMALIZACAO}.parquet")
+
+def ler_excel_streaming(arquivo):
+    """
+    Primeira aba do XLSX em modo somente leitura: linhas lidas em sequência, só valores,
+    sem montar o modelo da planilha. Mesmo resultado de pd.read_excel (cabeçalho na 1ª linha,
+    "Unnamed: i" para cabeçalho vazio, nomes repetidos com sufixo .1, .2…).
+    """
+    wb = load_workbook(arquivo, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb.worksheets[0]
+        # a dimensão gravada no arquivo pode estar errada (planilhas geradas por
+        # outros programas); sem ela as linhas vêm inteiras, como faz o pandas
+        ws.reset_dimensions()
+        linhas = ws.iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        dados = list(linhas)
+    finally:
+        wb.close()
+    if cabecalho is None:
+        return pd.DataFrame()
+
+    # linhas vazias no fim da aba não contam
+    while dados and all(v is None for v in dados[-1]):
+        dados.pop()
+
+    # sem a dimensão as linhas têm larguras diferentes: cabeçalho vai até a mais larga
+    largura = max(map(len, dados), default=0)
+    cabecalho = tuple(cabecalho) + (None,) * (largura - len(cabecalho))
+
+    colunas, vistos = [], {}
+    for i, nome in enumerate(cabecalho):
+        nome = f"Unnamed: {i}" if nome is None else nome
+        if nome in vistos:
+            vistos[nome] += 1
+            nome = f"{nome}.{vistos[nome]}"
+        else:
+            vistos[nome] = 0
+        colunas.append(nome)
+    df = pd.DataFrame(dados, columns=colunas)
+    # coluna sem nenhum valor vira float64 NaN, como no read_excel (e não object de None)
+    if dados:
+        for coluna in df.columns[df.isna().all().to_numpy()]:
+            df[coluna] = np.nan
+    return df
 
 def carregar_dados(uploaded_file):
-    """Carrega os dados do Excel, renomeia colunas flexivelmente e trata ausências."""
-    
-    df = pd.read_excel(uploaded_file, engine="openpyxl")
+    """
+    Carrega os dados do Excel já normalizados, com cache pelo hash do arquivo:
+    memória → .parquet local (vale entre sessões) → leitura da planilha.
+    Retorna (df, hash do arquivo); df é None se a planilha é inválida.
+    """
+    chave = hash_arquivo(uploaded_file)
+    df = _cache_planilhas_cmae.get(chave)
+    if df is None:
+        df = ler_parquet(_arquivo_planilha(chave))
+        if df is None:
+            df = normalizar_planilha(ler_excel_streaming(uploaded_file))
+            if df is None:
+                return None, chave  # planilha inválida: nada vai para o cache
+            if salvar_parquet(df, _arquivo_planilha(chave)):
+                podar_pasta(SUBPASTA_CACHE_CMAE, MAX_PLANILHAS_DISCO_CMAE)
+        _cache_planilhas_cmae.put(chave, df)
+    # cópia rasa: quem chama pode trocar colunas sem mexer no DataFrame do cache
+    return df.copy(deep=False), chave
+
+def normalizar_planilha(df):
+    """Renomeia colunas flexivelmente, trata ausências, converte datas e calcula idades."""
     df.columns = df.columns.str.strip()
 
     # 🔧 Lista de colunas esperadas com mapeamento parcial
@@ -61,40 +153,54 @@ def carregar_dados(uploaded_file):
     df["Data_Nascimento"] = pd.to_datetime(df["Data_Nascimento"], errors="coerce")
     df["Data_Avaliacao"] = pd.to_datetime(df["Data_Avaliacao"], errors="coerce")
 
-    # 📏 Calcula idade (em anos, meses e total de meses)
-    df["Ano"], df["Meses"], df["Meses_Totais"] = zip(*df.apply(
-        lambda row: calcular_idade(row["Data_Nascimento"], row["Data_Avaliacao"])
-        if pd.notna(row["Data_Nascimento"]) and pd.notna(row["Data_Avaliacao"])
-        else (None, None, None),
-        axis=1
-    ))
+    # 📏 Calcula idade (em anos, meses e total de meses) de todas as linhas de uma vez
+    df["Ano"], df["Meses"], df["Meses_Totais"] = calcular_idade_colunas(df["Data_Nascimento"], df["Data_Avaliacao"])
 
     return df
 
-def calcular_idade(data_nascimento, data_avaliacao):
-    """Calcula a idade do aluno na data da avaliação."""
-    if pd.isnull(data_nascimento) or pd.isnull(data_avaliacao):
-        return None, None, None
+def calcular_idade_colunas(datas_nascimento, datas_avaliacao):
+    """
+    Idade na data da avaliação para colunas inteiras de datas (datetime64).
+    Retorna (anos, meses, meses_totais) como Series 'Int64', com <NA> onde falta alguma data.
+    """
+    nascimento = pd.Series(pd.to_datetime(datas_nascimento, errors="coerce"))
+    avaliacao = pd.Series(pd.to_datetime(datas_avaliacao, errors="coerce"), index=nascimento.index)
+    valido = (nascimento.notna() & avaliacao.notna()).to_numpy()
+
+    def inteiros(serie):
+        return serie.fillna(0).to_numpy(dtype=np.int64)
 
-    idade_anos = data_avaliacao.year - data_nascimento.year
-    idade_meses = data_avaliacao.month - data_nascimento.month
+    idade_anos = inteiros(avaliacao.dt.year) - inteiros(nascimento.dt.year)
+    idade_meses = inteiros(avaliacao.dt.month) - inteiros(nascimento.dt.month)
 
-    if data_avaliacao.day < data_nascimento.day:
-        idade_meses -= 1
+    # mês ainda não completado no dia do aniversário
+    idade_meses -= inteiros(avaliacao.dt.day) < inteiros(nascimento.dt.day)
 
-    if idade_meses < 0:
-        idade_anos -= 1
-        idade_meses += 12
+    negativo = idade_meses < 0
+    idade_anos -= negativo
+    idade_meses += 12 * negativo
 
     meses_totais = (idade_anos * 12) + idade_meses
 
     # Ajuste de arredondamento de até 2 dias
-    diferenca_dias = (data_avaliacao - data_nascimento).days
-    if 0 < diferenca_dias % 30 <= 2:
-        meses_totais += 1
-        idade_meses += 1
+    diferenca_dias = inteiros((avaliacao - nascimento) // pd.Timedelta(days=1))
+    resto = diferenca_dias % 30
+    ajuste = (resto > 0) & (resto <= 2)
+    meses_totais += ajuste
+    idade_meses += ajuste
+
+    def coluna(valores):
+        return pd.Series(pd.arrays.IntegerArray(valores, ~valido), index=nascimento.index)
 
-    return idade_anos, idade_meses, meses_totais
+    return coluna(idade_anos), coluna(idade_meses), coluna(meses_totais)
+
+def calcular_idade(data_nascimento, data_avaliacao):
+    """Calcula a idade do aluno na data da avaliação (uma criança; ver calcular_idade_colunas)."""
+    if pd.isnull(data_nascimento) or pd.isnull(data_avaliacao):
+        return None, None, None
+
+    anos, meses, meses_totais = calcular_idade_colunas([pd.Timestamp(data_nascimento)], [pd.Timestamp(data_avaliacao)])
+    return int(anos.iloc[0]), int(meses.iloc[0]), int(meses_totais.iloc[0])
 
 CORES_FIXAS_STATUS = {
     "Sem atraso ✅": "#2E7D32",
@@ -102,52 +208,75 @@ CORES_FIXAS_STATUS = {
     "Possível Déficit 🚨": "#D32F2F"
 }
 
+# Pontos de cada resposta do inventário (o que não está aqui vale 0)
+PONTOS_RESPOSTA = {"Sim": 1, "Às vezes": 0.5}
+
+def colunas_por_categoria(colunas, categorias):
+    """{categoria: colunas cujo nome começa pela categoria}, na ordem da planilha."""
+    return {cat: [col for col in colunas if str(col).startswith(cat)] for cat in categorias}
+
+def matriz_pontos(df, colunas):
+    """Pontos de cada resposta (linhas × colunas): Sim = 1, Às vezes = 0,5, o resto = 0."""
+    pontos = np.zeros((len(df), len(colunas)))
+    respostas = df[colunas]
+    for resposta, valor in PONTOS_RESPOSTA.items():
+        pontos[(respostas == resposta).to_numpy(dtype=bool)] = valor
+    return pontos
+
 def calcular_status_aluno(df, categoria, meses_faixa_etaria, pontuacao_esperada_manual=None):
+    """
+    Uma linha por (aluno, categoria) com pontuação obtida, esperada e status,
+    na ordem das linhas de df (e, dentro de cada linha, na ordem das categorias).
+    Tudo em matriz: pontos das respostas (alunos × perguntas) × índice pergunta → categoria.
+    """
     categorias = CATEGORIAS_VALIDAS if categoria == "Todas" else [categoria]
-    df_resultado = []
-
-    for _, row in df.iterrows():
-        for categoria in categorias:
-            colunas_categoria = [col for col in df.columns if col.startswith(categoria)]
-            total_perguntas = len(colunas_categoria)
-
-            if total_perguntas == 0:
-                continue  
-
-            pontos_obtidos = sum([
-                1 if row[col] == "Sim" else 0.5 if row[col] == "Às vezes" else 0
-                for col in colunas_categoria
-            ])
-
-            idade_meses = row["Meses"]
-            if pd.isna(idade_meses):
-                idade_meses = 0  
-
-            if pd.isna(meses_faixa_etaria) or meses_faixa_etaria == 0:
-                pontuacao_esperada = 0  
-            else:
-                pontuacao_esperada = (idade_meses * total_perguntas) / meses_faixa_etaria
-
-            if pontuacao_esperada_manual is not None:
-                pontuacao_esperada = pontuacao_esperada_manual
-
-            if pontos_obtidos >= pontuacao_esperada:
-                status = "Sem atraso ✅"
-            elif pontos_obtidos >= (pontuacao_esperada - 2):
-                status = "Alerta para atraso ⚠️"
-            else:
-                status = "Possível Déficit 🚨"
-
-            df_resultado.append({
-                "Aluno": row["Aluno"],
-                "Categoria": categoria,
-                "Pontuação Obtida": pontos_obtidos,
-                "Pontuação Esperada": round(pontuacao_esperada, 2),
-                "Status": status
-            })
-
-    df_resultado = pd.DataFrame(df_resultado)
-    return df_resultado if not df_resultado.empty else None
+    por_categoria = {cat: cols for cat, cols in colunas_por_categoria(df.columns, categorias).items() if cols}
+    if df.empty or not por_categoria:
+        return None
+
+    # índice coluna → categoria (uma coluna pode casar com mais de uma categoria)
+    colunas = list(dict.fromkeys(col for cols in por_categoria.values() for col in cols))
+    posicao = {col: i for i, col in enumerate(colunas)}
+    indice = np.zeros((len(colunas), len(por_categoria)))
+    for j, cols in enumerate(por_categoria.values()):
+        indice[[posicao[col] for col in cols], j] = 1
+
+    respostas = matriz_pontos(df, colunas)
+    pontos_obtidos = respostas @ indice                      # alunos × categorias
+    total_perguntas = indice.sum(axis=0)
+
+    if pontuacao_esperada_manual is not None:
+        pontuacao_esperada = np.full(pontos_obtidos.shape, pontuacao_esperada_manual, dtype=float)
+        esperada_exibida = np.full(pontos_obtidos.size, round(pontuacao_esperada_manual, 2))
+    elif pd.isna(meses_faixa_etaria) or meses_faixa_etaria == 0:
+        pontuacao_esperada = np.zeros(pontos_obtidos.shape)
+        esperada_exibida = np.zeros(pontos_obtidos.size, dtype=np.int64)
+    else:
+        idade_meses = pd.to_numeric(df["Meses"], errors="coerce").fillna(0).to_numpy(dtype=float)
+        pontuacao_esperada = (idade_meses[:, None] * total_perguntas) / meses_faixa_etaria
+        # round do Python (e não np.round) nos valores distintos: mesmo arredondamento de sempre
+        distintos, codigos = np.unique(pontuacao_esperada.ravel(), return_inverse=True)
+        esperada_exibida = np.array([round(v, 2) for v in distintos.tolist()], dtype=float)[codigos]
+
+    status = np.select(
+        [pontos_obtidos >= pontuacao_esperada, pontos_obtidos >= pontuacao_esperada - 2],
+        ["Sem atraso ✅", "Alerta para atraso ⚠️"],
+        default="Possível Déficit 🚨",
+    ).astype(object)
+
+    # sem nenhum "Às vezes" as pontuações são inteiras
+    pontos = pontos_obtidos.ravel()
+    if not (respostas == PONTOS_RESPOSTA["Às vezes"]).any():
+        pontos = pontos.astype(np.int64)
+
+    n_categorias = len(por_categoria)
+    return pd.DataFrame({
+        "Aluno": np.repeat(df["Aluno"].to_numpy(dtype=object), n_categorias),
+        "Categoria": np.tile(np.array(list(por_categoria), dtype=object), len(df)),
+        "Pontuação Obtida": pontos,
+        "Pontuação Esperada": esperada_exibida,
+        "Status": status.ravel(),
+    })
 
 def gerar_texto_analise(status_alunos):
     """Gera um parágrafo dinâmico com base nos resultados do aluno no inventário."""
@@ -217,11 +346,8 @@ def gerar_pdf(filtros, status_alunos, img_grafico,):
         elements.append(Spacer(1, 12))
 
     if img_grafico:
-        img_path = "grafico_temp.png"
-        with open(img_path, "wb") as f:
-            f.write(img_grafico.getvalue())
-
-        elements.append(Image(img_path, width=300, height=200))
+        # imagem direto da memória (cópia própria: o buffer do chamador continua intacto)
+        elements.append(Image(io.BytesIO(img_grafico.getvalue()), width=300, height=200))
         texto_analise = gerar_texto_analise(status_alunos)
         elements.append(Spacer(1, 12))
         elements.append(Paragraph(texto_analise, styles["Normal"]))
@@ -272,12 +398,8 @@ def gerar_word(filtros, status_alunos, img_grafico):
 
     # Adicionar imagem do gráfico se disponível
     if img_grafico:
-        img_path = "grafico_temp.png"
-        with open(img_path, "wb") as f:
-            f.write(img_grafico.getvalue())
-
         doc.add_paragraph("\n📊 Gráfico de Resultados:")
-        doc.add_picture(img_path, width=Inches(4))
+        doc.add_picture(io.BytesIO(img_grafico.getvalue()), width=Inches(4))
 
     doc.add_paragraph("\nO Inventário Portage Operacionalizado (IPO) vem sendo respondido pelos professores dos Centros de Educação Infantil, de maneira adaptada e parcial, como forma de levantar dados e acompanhar o desenvolvimento das crianças. Para investigação mais aprofundada, sugere-se a aplicação do Inventário Dimensional de Avaliação do Desenvolvimento Infantil - IDADI.")
 
@@ -285,6 +407,349 @@ def gerar_word(filtros, status_alunos, img_grafico):
     buffer.seek(0)
     return buffer
 
+# Relatórios prontos (PDF/Word), pelo conteúdo: o mesmo download não refaz o documento
+MAX_MB_RELATORIOS_CMAE = int(os.environ.get("CMAE_CACHE_RELATORIOS_MB", "64"))
+_cache_relatorios = CacheLRU(max_bytes=MAX_MB_RELATORIOS_CMAE * 1024 * 1024, tamanho=len)
+
+GERADORES_RELATORIO = {"pdf": gerar_pdf, "docx": gerar_word}
+
+def chave_relatorio(formato, filtros, status_alunos, png):
+    """Digest de (formato, filtros, tabela de status, bytes do gráfico)."""
+    return (formato, digest_dados(filtros, status_alunos, hash_bytes(png) if png else None))
+
+def relatorio_cacheado(formato, filtros, status_alunos, png):
+    """
+    Bytes do relatório 'pdf' ou 'docx'. Só gera na primeira vez para o mesmo conteúdo;
+    pensado para o data= (callable) do st.download_button, que roda só no clique.
+    """
+    chave = chave_relatorio(formato, filtros, status_alunos, png)
+    dados = _cache_relatorios.get(chave)
+    if dados is None:
+        img_grafico = io.BytesIO(png) if png else None
+        dados = GERADORES_RELATORIO[formato](filtros, status_alunos, img_grafico).getvalue()
+        _cache_relatorios.put(chave, dados)
+    return dados
+
+def contar_respostas_por_categoria(df, categorias_ativas):
+    """Contagem de "Sim", "Às vezes" e "Não" por categoria (linhas = categorias)."""
+    return contar_respostas_categorias(df, categorias_ativas)
+
+
+def desenhar_grafico_status(tipo_grafico, status_alunos, df_resposta, largura, altura):
+    """Desenha o gráfico escolhido na barra lateral e devolve a figura."""
+    fig, ax = plt.subplots(figsize=(largura, altura))
+
+    if tipo_grafico == "Barras":
+        status_counts = status_alunos["Status"].value_counts()
+        cores = [CORES_FIXAS_STATUS.get(status, "#000000") for status in status_counts.index]
+        ax.bar(status_counts.index, status_counts.values, color=cores)
+        ax.set_ylabel("Quantidade")
+        ax.set_title("Distribuição dos Status")
+
+    elif tipo_grafico == "Barras Empilhadas":
+        df_stack = status_alunos.groupby(["Categoria", "Status"]).size().unstack(fill_value=0)
+        cores_stack = [CORES_FIXAS_STATUS.get(status, "#000000") for status in df_stack.columns]
+        df_stack.plot(kind="bar", stacked=True, ax=ax, color=cores_stack)
+        ax.set_ylabel("Quantidade")
+        ax.set_title("Distribuição de Status por Categoria")
+        ax.legend(title="Status", bbox_to_anchor=(1.05, 1), loc="upper left")
+        fig.tight_layout()
+
+    elif tipo_grafico == "Pizza":
+        status_counts = status_alunos["Status"].value_counts()
+        cores = [CORES_FIXAS_STATUS.get(status, "#000000") for status in status_counts.index]
+        ax.pie(status_counts.values, labels=status_counts.index, autopct='%1.1f%%', colors=cores)
+        ax.axis("equal")
+        ax.set_title("Distribuição dos Status")
+
+    elif tipo_grafico == "Linha":
+        status_counts = status_alunos["Status"].value_counts()
+        ax.plot(status_counts.index, status_counts.values, marker='o', linestyle='-')
+        ax.set_ylabel("Quantidade")
+        ax.set_title("Distribuição dos Status")
+
+    elif tipo_grafico == "Barras por Resposta":
+        cores_resp = ["#2E7D32", "#FFC107", "#D32F2F"]
+        df_resposta.plot(kind="bar", stacked=True, ax=ax, color=cores_resp)
+
+        ax.set_ylabel("Quantidade de Respostas")
+        ax.set_title("Distribuição das Respostas por Categoria")
+        ax.legend(title="Resposta", bbox_to_anchor=(1.05, 1), loc="upper left")
+        fig.tight_layout()
+
+    return fig
+
+
+# -----------------------------
+# Exportação em lote (todos os alunos de uma unidade)
+# -----------------------------
+# processos que geram PDF/Word em paralelo (1 = tudo no processo do Streamlit)
+WORKERS_LOTE_CMAE = int(os.environ.get("CMAE_WORKERS_LOTE", min(4, os.cpu_count() or 1)))
+# relatórios em andamento por processo: limita DataFrames e bytes em trânsito
+PENDENTES_POR_WORKER = 2
+# ZIPs gerados ficam em disco (PASTA_CACHE/cmae_zip), nunca inteiros na sessão;
+# a pasta guarda no máximo estes arquivos (os de outras sessões inclusive)
+SUBPASTA_ZIP_CMAE = "cmae_zip"
+MAX_ZIPS_DISCO_CMAE = 8
+# o ZIP é montado numa thread (uma exportação por vez; as outras esperam na fila)
+# e a barra lateral consulta o progresso a cada INTERVALO_PROGRESSO_ZIP segundos
+_executor_zip_cmae = ThreadPoolExecutor(max_workers=1, thread_name_prefix="zip_cmae")
+INTERVALO_PROGRESSO_ZIP = 1.0
+
+def filtros_do_aluno(aluno_info):
+    """Cabeçalho do relatório (nome, unidade, datas, idade, professor) a partir de uma linha da planilha."""
+    return {
+        "Nome do Aluno": aluno_info.get("Aluno", "N/A"),
+        "Unidade Escolar": aluno_info.get("Unidade", "N/A"),
+        "Data da Avaliação": aluno_info.get("Data_Avaliacao", "N/A"),
+        "Data de Nascimento": aluno_info.get("Data_Nascimento", "N/A"),
+        "Idade": f"{aluno_info.get('Ano', 'N/A')} anos e {aluno_info.get('Meses', 'N/A')} meses",
+        "Professor": aluno_info.get("Professor", "N/A")
+    }
+
+def nome_arquivo_aluno(nome):
+    """Nome de arquivo sem acentos nem espaços (Maria José → Maria_Jose)."""
+    ascii_ = unicodedata.normalize("NFKD", str(nome)).encode("ascii", "ignore").decode()
+    return re.sub(r"[^A-Za-z0-9]+", "_", ascii_).strip("_") or "sem_nome"
+
+def tarefas_relatorios(df, categoria, tipo_grafico, largura, altura, meses_faixa_etaria=12):
+    """
+    Pontua todos os alunos de df numa única chamada de calcular_status_aluno e
+    monta uma tarefa (nome, filtros, status, respostas, gráfico) por aluno,
+    com o mesmo conteúdo de quando o aluno é escolhido em "Pesquise um aluno".
+    """
+    status = calcular_status_aluno(df, categoria, meses_faixa_etaria)
+    if status is None:
+        return []
+    categorias_ativas = CATEGORIAS_VALIDAS if categoria == "Todas" else [categoria]
+    status_por_aluno = dict(tuple(status.groupby("Aluno", sort=False)))
+
+    # pontuação sem nenhum "Às vezes" é inteira (como no relatório de um aluno só)
+    colunas = list(dict.fromkeys(mapa_colunas_categorias(df.columns, categorias_ativas)["coluna"]))
+    com_as_vezes = (df[colunas] == "Às vezes").any(axis=1).groupby(df["Aluno"], sort=False).any()
+
+    tarefas = []
+    for aluno, df_aluno in df.groupby("Aluno", sort=False):
+        status_aluno = status_por_aluno.get(aluno)
+        if status_aluno is None:
+            continue
+        status_aluno = status_aluno.reset_index(drop=True)
+        if not com_as_vezes[aluno]:
+            status_aluno["Pontuação Obtida"] = status_aluno["Pontuação Obtida"].astype(np.int64)
+        df_resposta = None
+        if tipo_grafico == "Barras por Resposta":
+            df_resposta = contar_respostas_por_categoria(df_aluno, categorias_ativas)
+        tarefas.append((aluno, filtros_do_aluno(df_aluno.iloc[0]), status_aluno, df_resposta,
+                        tipo_grafico, largura, altura))
+    return tarefas
+
+def _iniciar_processo_lote():
+    # processos do pool nunca abrem janela: backend não interativo
+    matplotlib.use("Agg")
+
+def gerar_relatorios_aluno(tarefa):
+    """Gráfico + PDF + Word de um aluno; devolve (nome, bytes do PDF, bytes do Word)."""
+    aluno, filtros, status_aluno, df_resposta, tipo_grafico, largura, altura = tarefa
+    fig = desenhar_grafico_status(tipo_grafico, status_aluno, df_resposta, largura, altura)
+    png = figura_em_png(fig, bbox_inches=None)
+    pdf = gerar_pdf(filtros, status_aluno, io.BytesIO(png)).getvalue()
+    docx = gerar_word(filtros, status_aluno, io.BytesIO(png)).getvalue()
+    return aluno, pdf, docx
+
+def _relatorios_em_pool(tarefas, workers, feitos):
+    """Gera (índice, resultado) na ordem em que ficam prontos, com no máximo workers × PENDENTES_POR_WORKER em trânsito."""
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_iniciar_processo_lote) as pool:
+        fila = (i for i in range(len(tarefas)) if i not in feitos)
+        pendentes = {}
+        for i in fila:
+            pendentes[pool.submit(gerar_relatorios_aluno, tarefas[i])] = i
+            if len(pendentes) >= workers * PENDENTES_POR_WORKER:
+                break
+        while pendentes:
+            prontos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                i = pendentes.pop(futuro)
+                yield i, futuro.result()
+                proximo = next(fila, None)
+                if proximo is not None:
+                    pendentes[pool.submit(gerar_relatorios_aluno, tarefas[proximo])] = proximo
+
+def exportar_relatorios_zip(tarefas, destino, workers=None, ao_progredir=None):
+    """
+    Gera PDF e Word de cada tarefa e grava no ZIP 'destino' (caminho ou arquivo binário)
+    à medida que ficam prontos (Aluno.pdf / Aluno.docx; nomes repetidos ganham sufixo).
+    Só um aluno por vez fica em memória. Retorna destino.
+      - ao_progredir(feitos, total): chamado a cada aluno concluído
+    """
+    workers = max(1, min(WORKERS_LOTE_CMAE if workers is None else workers, len(tarefas) or 1))
+
+    # nomes definidos pela ordem das tarefas (não pela ordem em que terminam)
+    nomes, usados = [], {}
+    for tarefa in tarefas:
+        base = nome_arquivo_aluno(tarefa[0])
+        usados[base] = usados.get(base, 0) + 1
+        nomes.append(base if usados[base] == 1 else f"{base}_{usados[base]}")
+
+    feitos = set()
+    with zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) as zf:
+        def gravar(i, resultado):
+            _, pdf, docx = resultado
+            zf.writestr(f"{nomes[i]}.pdf", pdf)
+            zf.writestr(f"{nomes[i]}.docx", docx)
+            feitos.add(i)
+            if ao_progredir:
+                ao_progredir(len(feitos), len(tarefas))
+
+        if workers > 1:
+            try:
+                for i, resultado in _relatorios_em_pool(tarefas, workers, feitos):
+                    gravar(i, resultado)
+            except BrokenProcessPool:
+                pass  # processo caiu: o que faltou é gerado aqui mesmo
+        for i, tarefa in enumerate(tarefas):
+            if i not in feitos:
+                gravar(i, gerar_relatorios_aluno(tarefa))
+    return destino
+
+class _ExportacaoCancelada(Exception):
+    """A sessão desistiu do ZIP (filtros ou planilha mudaram) enquanto ele era gerado."""
+
+def _gerar_zip(tarefas, pedido):
+    """Corpo da thread: grava o ZIP em pedido["caminho"], atualizando pedido["feitos"]."""
+    def ao_progredir(feitos, total):
+        pedido["feitos"] = feitos
+        if pedido["cancelado"].is_set():
+            raise _ExportacaoCancelada()
+    try:
+        exportar_relatorios_zip(tarefas, pedido["caminho"], ao_progredir=ao_progredir)
+    except BaseException:
+        _descartar_zip(pedido)
+        raise
+    podar_pasta(SUBPASTA_ZIP_CMAE, MAX_ZIPS_DISCO_CMAE)
+    return pedido["caminho"]
+
+def _descartar_zip(pedido):
+    """Apaga o arquivo de um ZIP que a sessão não vai mais oferecer (e interrompe a geração)."""
+    if pedido is not None:
+        pedido["cancelado"].set()
+        pedido["futuro"].cancel()  # ainda na fila: nem começa
+        try:
+            os.remove(pedido["caminho"])
+        except OSError:
+            pass
+
+def _ler_arquivo(caminho):
+    with open(caminho, "rb") as f:
+        return f.read()
+
+@st.fragment(run_every=INTERVALO_PROGRESSO_ZIP)
+def _progresso_zip():
+    """Barra de progresso do ZIP; quando termina, recarrega a página para mostrar o download."""
+    pedido = st.session_state.get("cmae_zip")
+    if pedido is None or pedido["futuro"].done():
+        st.rerun()
+    st.progress(pedido["feitos"] / pedido["n"], text=f"Gerando relatórios… {pedido['feitos']}/{pedido['n']} alunos")
+
+def painel_exportacao_unidade(df, chave_arquivo, unidade, categoria, tipo_grafico, largura, altura):
+    """
+    Barra lateral: PDF + Word de todos os alunos da unidade num único ZIP (gerado só quando pedido).
+    O ZIP é montado em segundo plano num arquivo em disco, com barra de progresso; a sessão
+    guarda só o pedido (caminho, progresso, futuro) e o download lê o arquivo apenas no clique.
+    chave_arquivo: hash da planilha (de carregar_dados), que identifica o ZIP com os filtros.
+    """
+    st.sidebar.markdown("---")
+    chave = (chave_arquivo, unidade, categoria, tipo_grafico, largura, altura)
+    pedido = st.session_state.get("cmae_zip")
+    if pedido is not None and (pedido["chave"] != chave
+                               or (pedido["futuro"].done() and not os.path.exists(pedido["caminho"]))):
+        # planilha ou filtros mudaram (ou o arquivo foi podado): o ZIP anterior não vale mais
+        _descartar_zip(pedido)
+        del st.session_state["cmae_zip"]
+        pedido = None
+
+    n_alunos = df["Aluno"].dropna().nunique()
+    if n_alunos == 0:
+        return
+
+    if pedido is None:
+        rotulo = "Todas as unidades" if unidade == "Todas" else unidade
+        if not st.sidebar.button(f"📦 Gerar relatórios de {n_alunos} aluno(s) (ZIP) – {rotulo}"):
+            return
+        tarefas = tarefas_relatorios(df, categoria, tipo_grafico, largura, altura)
+        pedido = {"chave": chave, "caminho": caminho_cache(SUBPASTA_ZIP_CMAE, f"{os.urandom(8).hex()}.zip"),
+                  "n": len(tarefas), "feitos": 0, "cancelado": threading.Event()}
+        pedido["futuro"] = _executor_zip_cmae.submit(_gerar_zip, tarefas, pedido)
+        st.session_state["cmae_zip"] = pedido
+
+    futuro = pedido["futuro"]
+    if not futuro.done():
+        with st.sidebar:
+            _progresso_zip()
+        return
+
+    try:
+        futuro.result()
+    except Exception as e:
+        st.session_state.pop("cmae_zip", None)
+        st.sidebar.error(f"Erro ao gerar os relatórios: {e}")
+        return
+
+    st.sidebar.download_button(
+        f"📥 Baixar relatórios ({pedido['n']} alunos, ZIP)",
+        lambda caminho=pedido["caminho"]: _ler_arquivo(caminho),
+        file_name=f"relatorios_CMAE_{nome_arquivo_aluno(unidade)}.zip",
+        mime="application/zip"
+    )
+
+
+# -----------------------------
+# Histórico longitudinal (avaliacoes_portage.db)
+# -----------------------------
+def salvar_no_historico(df, meses_faixa_etaria=12):
+    """Pontua todas as avaliações de df (todas as categorias) e grava no histórico; retorna (gravadas, ignoradas)."""
+    status = calcular_status_aluno(df, "Todas", meses_faixa_etaria)
+    perguntas = {cat: len(cols) for cat, cols in colunas_por_categoria(df.columns, CATEGORIAS_VALIDAS).items()}
+    return salvar_avaliacoes(df, status, perguntas)
+
+def botao_salvar_historico(df):
+    """Barra lateral: grava a planilha inteira no histórico (reimportar não duplica)."""
+    st.sidebar.markdown("---")
+    if st.sidebar.button("💾 Salvar avaliações no histórico"):
+        gravadas, ignoradas = salvar_no_historico(df)
+        st.sidebar.success(f"✅ {gravadas} avaliação(ões) no histórico.")
+        if ignoradas:
+            st.sidebar.caption(f"{ignoradas} linha(s) sem aluno ou data da avaliação ficaram de fora.")
+
+def painel_historico(aluno, unidade, largura, altura):
+    """Evolução ao longo das avaliações salvas: do aluno escolhido ou, sem aluno, da unidade por semestre."""
+    if not st.checkbox("📈 Ver evolução no histórico"):
+        return
+
+    if aluno != "Todos":
+        evolucao = evolucao_aluno(aluno, None if unidade == "Todas" else unidade)
+        if evolucao.empty:
+            st.info("Este aluno ainda não tem avaliações salvas no histórico.")
+            return
+        titulo, eixo = f"Evolução – {aluno}", "data_avaliacao"
+    elif unidade != "Todas":
+        evolucao = evolucao_unidade(unidade)
+        if evolucao.empty:
+            st.info("Esta unidade ainda não tem avaliações salvas no histórico.")
+            return
+        titulo, eixo = f"Evolução por semestre – {unidade}", "periodo"
+    else:
+        st.info("Selecione uma unidade ou um aluno para ver a evolução.")
+        return
+
+    st.image(png_grafico(
+        "cmae_evolucao", evolucao, largura, altura,
+        lambda: desenhar_evolucao(evolucao, eixo, largura, altura, titulo),
+        opcoes=(eixo, titulo), bbox_inches=None
+    ))
+    st.dataframe(evolucao, use_container_width=True)
+
+
 def run_cmae_mode():
     st.title("📊 Painel Interativo de Avaliação (Modo CMAE)")
 
@@ -294,12 +759,13 @@ def run_cmae_mode():
         st.info("🔍 Envie a planilha para iniciar a análise.")
         return
     
-    df = carregar_dados(uploaded_file)
+    df, chave_arquivo = carregar_dados(uploaded_file)
     if df is None:
         st.error("Erro ao carregar os dados. Verifique se as colunas necessárias estão presentes.")
         return
     
     df["Unidade"] = df["Unidade"].astype(str).str.strip()
+    botao_salvar_historico(df)
 
     st.sidebar.header("🎯 **Filtros**")
     unidades = ["Todas"] + sorted(df["Unidade"].dropna().unique().tolist())
@@ -325,18 +791,11 @@ def run_cmae_mode():
 
     if unidade_selecionada != "Todas":
         df = df[df["Unidade"] == unidade_selecionada]
+    painel_exportacao_unidade(df, chave_arquivo, unidade_selecionada, categoria_selecionada, tipo_grafico, largura, altura)
     if aluno_selecionado != "Todos":
         df = df[df["Aluno"] == aluno_selecionado]
     if not df.empty:
-        aluno_info = df.iloc[0]
-        filtros = {
-            "Nome do Aluno": aluno_info.get("Aluno", "N/A"),
-            "Unidade Escolar": aluno_info.get("Unidade", "N/A"),
-            "Data da Avaliação": aluno_info.get("Data_Avaliacao", "N/A"),
-            "Data de Nascimento": aluno_info.get("Data_Nascimento", "N/A"),
-            "Idade": f"{aluno_info.get('Ano', 'N/A')} anos e {aluno_info.get('Meses', 'N/A')} meses",
-            "Professor": aluno_info.get("Professor", "N/A")
-        }
+        filtros = filtros_do_aluno(df.iloc[0])
 
         st.write("### 📄 Informações do Aluno")
         for key, value in filtros.items():
@@ -352,73 +811,23 @@ def run_cmae_mode():
         st.write(f"### 📊 Estatísticas para {aluno_selecionado} na Categoria: {categoria_selecionada}")
         st.dataframe(status_alunos)
 
-        status_counts = status_alunos["Status"].value_counts()
-        fig, ax = plt.subplots(figsize=(largura, altura))
-        cores = [CORES_FIXAS_STATUS.get(status, "#000000") for status in status_counts.index]
-
-        if tipo_grafico == "Barras":
-            status_counts = status_alunos["Status"].value_counts()
-            cores = [CORES_FIXAS_STATUS.get(status, "#000000") for status in status_counts.index]
-            ax.bar(status_counts.index, status_counts.values, color=cores)
-            ax.set_ylabel("Quantidade")
-            ax.set_title("Distribuição dos Status")
-
-        elif tipo_grafico == "Barras Empilhadas":
-            df_stack = status_alunos.groupby(["Categoria", "Status"]).size().unstack(fill_value=0)
-            cores_stack = [CORES_FIXAS_STATUS.get(status, "#000000") for status in df_stack.columns]
-            df_stack.plot(kind="bar", stacked=True, ax=ax, color=cores_stack)
-            ax.set_ylabel("Quantidade")
-            ax.set_title("Distribuição de Status por Categoria")
-            ax.legend(title="Status", bbox_to_anchor=(1.05, 1), loc="upper left")
-            plt.tight_layout()
-
-        elif tipo_grafico == "Pizza":
-            status_counts = status_alunos["Status"].value_counts()
-            cores = [CORES_FIXAS_STATUS.get(status, "#000000") for status in status_counts.index]
-            ax.pie(status_counts.values, labels=status_counts.index, autopct='%1.1f%%', colors=cores)
-            ax.axis("equal")
-            ax.set_title("Distribuição dos Status")
-
-        elif tipo_grafico == "Linha":
-            status_counts = status_alunos["Status"].value_counts()
-            ax.plot(status_counts.index, status_counts.values, marker='o', linestyle='-')
-            ax.set_ylabel("Quantidade")
-            ax.set_title("Distribuição dos Status")
-        
-        elif tipo_grafico == "Barras por Resposta":
+        df_resposta = None
+        if tipo_grafico == "Barras por Resposta":
             categorias_ativas = CATEGORIAS_VALIDAS if categoria_selecionada == "Todas" else [categoria_selecionada]
+            df_resposta = contar_respostas_por_categoria(df, categorias_ativas)
 
-            # Inicializa um dicionário para contar "Sim", "Às vezes" e "Não" por categoria
-            dados_respostas = {cat: {"Sim": 0, "Às vezes": 0, "Não": 0} for cat in categorias_ativas}
-
-            for _, row in df.iterrows():
-                for cat in categorias_ativas:
-                    colunas = [col for col in df.columns if col.startswith(cat)]
-                    for col in colunas:
-                        valor = row[col]
-                        if valor in ["Sim", "Às vezes", "Não"]:
-                            dados_respostas[cat][valor] += 1
-
-            # Converte para DataFrame para facilitar a plotagem
-            df_resposta = pd.DataFrame(dados_respostas).T[["Sim", "Às vezes", "Não"]]
-
-            cores_resp = ["#2E7D32", "#FFC107", "#D32F2F"]
-            df_resposta.plot(kind="bar", stacked=True, ax=ax, color=cores_resp)
-
-            ax.set_ylabel("Quantidade de Respostas")
-            ax.set_title("Distribuição das Respostas por Categoria")
-            ax.legend(title="Resposta", bbox_to_anchor=(1.05, 1), loc="upper left")
-            plt.tight_layout()
-
-        st.pyplot(fig)
-
-        buffer_grafico = io.BytesIO()
-        fig.savefig(buffer_grafico, format="png")
-        buffer_grafico.seek(0)
+        # PNG memoizado: o mesmo bytes vai para a tela, o download e os relatórios
+        png_grafico_status = png_grafico(
+            "cmae_status", (status_alunos, df_resposta), largura, altura,
+            lambda: desenhar_grafico_status(tipo_grafico, status_alunos, df_resposta, largura, altura),
+            opcoes=tipo_grafico, bbox_inches=None
+        )
+        st.image(png_grafico_status)
 
+        # documentos só são gerados quando o download é pedido (e reaproveitados pelo cache)
         st.download_button(
             "📥 Baixar Relatório Completo (PDF)",
-            gerar_pdf(filtros, status_alunos, buffer_grafico),
+            lambda: relatorio_cacheado("pdf", filtros, status_alunos, png_grafico_status),
             file_name="relatorio_CMAE.pdf",
             mime="application/pdf"
         )
@@ -426,14 +835,15 @@ def run_cmae_mode():
         # Criar botão de download apenas para o gráfico
         st.download_button(
             "📥 Baixar Gráfico",
-            buffer_grafico,
+            png_grafico_status,
             file_name="grafico_CMAE.png",
             mime="image/png"
         )
-        buffer_word = gerar_word(filtros, status_alunos, buffer_grafico)
         st.download_button(
         "📥 Baixar Relatório Completo (Word)",
-        buffer_word,
+        lambda: relatorio_cacheado("docx", filtros, status_alunos, png_grafico_status),
         file_name="relatorio_CMAE.docx",
         mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        )
\ No newline at end of file
+        )
+
+        painel_historico(aluno_selecionado, unidade_selecionada, largura, altura)
@@ -1,7 +1,7 @@
 import streamlit as st
 from datetime import datetime
 import pandas as pd
-from cmae_mode import calcular_idade, calcular_status_aluno, gerar_pdf, gerar_word
+from cmae_mode import calcular_idade, calcular_status_aluno, relatorio_cacheado
 from utils import gerar_grafico_respostas 
 from perguntas_portage import PERGUNTAS_PORTAGE
 import io
@@ -94,16 +94,18 @@ def run_formulario_portage():
                     "Professor": professor
                 }
 
+                # PDF/Word só são gerados no clique do download
+                png = buffer_grafico.getvalue()
                 st.download_button(
                     "📥 Baixar Relatório (PDF)",
-                    gerar_pdf(filtros, status_alunos, buffer_grafico),
+                    lambda: relatorio_cacheado("pdf", filtros, status_alunos, png),
                     file_name="relatorio_portage.pdf",
                     mime="application/pdf"
                 )
 
                 st.download_button(
                     "📥 Baixar Relatório (Word)",
-                    gerar_word(filtros, status_alunos, buffer_grafico),
+                    lambda: relatorio_cacheado("docx", filtros, status_alunos, png),
                     file_name="relatorio_portage.docx",
                     mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
                 )
@@ -0,0 +1,207 @@
+# historico_portage.py
+# ------------------------------------------------------------
+# Histórico longitudinal das avaliações Portage (SQLite)
+# - Cada avaliação pontuada é gravada por (aluno, unidade, data da avaliação);
+#   reimportar a mesma planilha atualiza as linhas em vez de duplicar (upsert)
+# - Pontuação por categoria em tabela própria, ligada à avaliação
+# - Evolução por aluno e por unidade direto em SQL, por índices
+# ------------------------------------------------------------
+
+import os
+import threading
+from datetime import datetime
+
+import sqlite3
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+# arquivo do banco (fora do controle de versão); ajuste pela variável de ambiente
+CAMINHO_HISTORICO = os.environ.get("CMAE_HISTORICO_DB", "avaliacoes_portage.db")
+
+ESQUEMA_HISTORICO = """
+CREATE TABLE IF NOT EXISTS avaliacoes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    aluno TEXT NOT NULL,
+    unidade TEXT NOT NULL,
+    data_avaliacao TEXT NOT NULL,      -- AAAA-MM-DD
+    data_nascimento TEXT,
+    professor TEXT,
+    idade_meses INTEGER,
+    importado_em TEXT,
+    UNIQUE (aluno, unidade, data_avaliacao)
+);
+CREATE TABLE IF NOT EXISTS pontuacoes (
+    avaliacao_id INTEGER NOT NULL REFERENCES avaliacoes(id) ON DELETE CASCADE,
+    categoria TEXT NOT NULL,
+    pontos REAL NOT NULL,
+    esperado REAL,
+    perguntas INTEGER NOT NULL,
+    status TEXT,
+    PRIMARY KEY (avaliacao_id, categoria)
+) WITHOUT ROWID;
+-- UNIQUE acima já indexa (aluno, unidade, data): evolução de um aluno é busca por índice
+CREATE INDEX IF NOT EXISTS idx_avaliacoes_unidade_data ON avaliacoes (unidade, data_avaliacao);
+"""
+
+_esquemas_criados = set()
+_lock_esquema = threading.Lock()
+
+
+def conectar(caminho=None):
+    """Conexão com o histórico; o esquema é criado uma única vez por arquivo neste processo."""
+    caminho = caminho or CAMINHO_HISTORICO
+    conn = sqlite3.connect(caminho)
+    conn.execute("PRAGMA foreign_keys = ON")
+    with _lock_esquema:
+        if caminho not in _esquemas_criados:
+            conn.executescript(ESQUEMA_HISTORICO)
+            _esquemas_criados.add(caminho)
+    return conn
+
+
+def _datas_iso(serie):
+    """Coluna de datas → textos AAAA-MM-DD (NaN onde não há data)."""
+    return pd.to_datetime(serie, errors="coerce").dt.strftime("%Y-%m-%d")
+
+
+def _texto(valor):
+    return None if pd.isna(valor) else str(valor).strip()
+
+
+def salvar_avaliacoes(df, status, perguntas_por_categoria, caminho=None):
+    """
+    Grava (upsert) as avaliações de df e suas pontuações por categoria, numa transação.
+      - status: saída de calcular_status_aluno(df, "Todas", ...) — uma linha por
+        (linha de df, categoria), na ordem de df
+      - perguntas_por_categoria: {categoria: nº de perguntas da planilha}
+    Linhas sem aluno ou sem data da avaliação não têm chave e ficam de fora.
+    Retorna (gravadas, ignoradas).
+    """
+    if status is None or status.empty or df.empty:
+        return 0, len(df)
+    n_categorias = len(status) // len(df)
+    linha_df = np.repeat(np.arange(len(df)), n_categorias)
+
+    importado_em = datetime.now().isoformat(timespec="seconds")
+    chaves = []
+    avaliacoes = []
+    for aluno, unidade, data_av, data_nasc, professor, idade in zip(
+        df["Aluno"], df["Unidade"], _datas_iso(df["Data_Avaliacao"]), _datas_iso(df["Data_Nascimento"]),
+        df["Professor"], df["Meses_Totais"]
+    ):
+        chave = (_texto(aluno), _texto(unidade) or "Não informado", _texto(data_av))
+        chaves.append(chave if chave[0] and chave[2] else None)
+        if chaves[-1] is not None:
+            avaliacoes.append(chave + (_texto(data_nasc), _texto(professor),
+                                       None if pd.isna(idade) else int(idade), importado_em))
+
+    pontuacoes = [
+        chaves[i] + (categoria, float(pontos), None if pd.isna(esperado) else float(esperado),
+                     int(perguntas_por_categoria.get(categoria, 0)), status_txt)
+        for i, categoria, pontos, esperado, status_txt in zip(
+            linha_df, status["Categoria"], status["Pontuação Obtida"], status["Pontuação Esperada"], status["Status"]
+        )
+        if chaves[i] is not None
+    ]
+
+    conn = conectar(caminho)
+    try:
+        with conn:
+            conn.executemany("""
+                INSERT INTO avaliacoes (aluno, unidade, data_avaliacao, data_nascimento, professor, idade_meses, importado_em)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (aluno, unidade, data_avaliacao) DO UPDATE SET
+                    data_nascimento = excluded.data_nascimento,
+                    professor = excluded.professor,
+                    idade_meses = excluded.idade_meses,
+                    importado_em = excluded.importado_em
+            """, avaliacoes)
+            conn.executemany("""
+                INSERT INTO pontuacoes (avaliacao_id, categoria, pontos, esperado, perguntas, status)
+                VALUES ((SELECT id FROM avaliacoes WHERE aluno = ? AND unidade = ? AND data_avaliacao = ?), ?, ?, ?, ?, ?)
+                ON CONFLICT (avaliacao_id, categoria) DO UPDATE SET
+                    pontos = excluded.pontos,
+                    esperado = excluded.esperado,
+                    perguntas = excluded.perguntas,
+                    status = excluded.status
+            """, pontuacoes)
+    finally:
+        conn.close()
+    return len(avaliacoes), len(df) - len(avaliacoes)
+
+
+def _consultar(sql, parametros, caminho=None):
+    conn = conectar(caminho)
+    try:
+        return pd.read_sql_query(sql, conn, params=parametros)
+    finally:
+        conn.close()
+
+
+def listar_alunos(unidade=None, caminho=None):
+    """Alunos com avaliações no histórico (de uma unidade ou de todas)."""
+    if unidade is None:
+        df = _consultar("SELECT DISTINCT aluno FROM avaliacoes ORDER BY aluno", (), caminho)
+    else:
+        df = _consultar("SELECT DISTINCT aluno FROM avaliacoes WHERE unidade = ? ORDER BY aluno", (unidade,), caminho)
+    return df["aluno"].tolist()
+
+
+def evolucao_aluno(aluno, unidade=None, caminho=None):
+    """
+    Pontuações de um aluno ao longo do tempo: data_avaliacao, unidade, categoria,
+    pontos, esperado, perguntas, status e percentual (pontos / perguntas).
+    """
+    sql = """
+        SELECT a.data_avaliacao, a.unidade, a.idade_meses, p.categoria, p.pontos, p.esperado, p.perguntas, p.status,
+               100.0 * p.pontos / NULLIF(p.perguntas, 0) AS percentual
+        FROM avaliacoes a JOIN pontuacoes p ON p.avaliacao_id = a.id
+        WHERE a.aluno = ? {filtro}
+        ORDER BY a.data_avaliacao, p.categoria
+    """
+    if unidade is None:
+        df = _consultar(sql.format(filtro=""), (aluno,), caminho)
+    else:
+        df = _consultar(sql.format(filtro="AND a.unidade = ?"), (aluno, unidade), caminho)
+    df["data_avaliacao"] = pd.to_datetime(df["data_avaliacao"])
+    return df
+
+
+# semestre da avaliação em SQL: "2024.1" (jan–jun) / "2024.2" (jul–dez)
+_SQL_SEMESTRE = ("substr(a.data_avaliacao, 1, 4) || '.' || "
+                 "(CASE WHEN CAST(substr(a.data_avaliacao, 6, 2) AS INTEGER) <= 6 THEN 1 ELSE 2 END)")
+
+
+def evolucao_unidade(unidade, caminho=None):
+    """
+    Evolução de uma unidade por semestre e categoria: nº de alunos avaliados,
+    percentual médio e quantos ficaram em cada status.
+    """
+    return _consultar(f"""
+        SELECT {_SQL_SEMESTRE} AS periodo, p.categoria,
+               COUNT(DISTINCT a.aluno) AS alunos,
+               AVG(100.0 * p.pontos / NULLIF(p.perguntas, 0)) AS percentual,
+               SUM(p.status = 'Sem atraso ✅') AS sem_atraso,
+               SUM(p.status = 'Alerta para atraso ⚠️') AS alerta,
+               SUM(p.status = 'Possível Déficit 🚨') AS deficit
+        FROM avaliacoes a JOIN pontuacoes p ON p.avaliacao_id = a.id
+        WHERE a.unidade = ?
+        GROUP BY periodo, p.categoria
+        ORDER BY periodo, p.categoria
+    """, (unidade,), caminho)
+
+
+def desenhar_evolucao(df, coluna_x, largura, altura, titulo):
+    """Linhas do percentual por categoria ao longo de coluna_x (data ou período)."""
+    fig, ax = plt.subplots(figsize=(largura, altura))
+    tabela = df.pivot_table(index=coluna_x, columns="categoria", values="percentual", aggfunc="mean").sort_index()
+    rotulos = [x.strftime("%d/%m/%Y") if hasattr(x, "strftime") else str(x) for x in tabela.index]
+    for categoria in tabela.columns:
+        ax.plot(rotulos, tabela[categoria].to_numpy(), marker="o", label=categoria)
+    ax.set_ylim(0, 105)
+    ax.set_ylabel("% das perguntas (Sim = 1, Às vezes = 0,5)")
+    ax.set_title(titulo)
+    ax.legend(title="Categoria", bbox_to_anchor=(1.02, 1), loc="upper left")
+    fig.tight_layout()
+    return fig
@@ -0,0 +1,214 @@
+# sme_benchmark.py
+# ------------------------------------------------------------
+# Medição de desempenho do pipeline do Modo SME (linha de comando, sem Streamlit)
+# - Gera exportações sintéticas (sme_sintetico) em vários tamanhos
+# - Cronometra cada etapa: leitura do CSV, preparar_dataframe, detectar_colunas,
+#   parse das notas, tabela-resumo, gráficos e serialização do DOCX
+# - Resultado em JSON (stdout ou arquivo), para comparar versões e máquinas
+#
+# Uso:
+#   python sme_benchmark.py --linhas 1000 10000 100000 --perguntas 30
+#   python sme_benchmark.py --linhas 50000 --repeticoes 5 --saida bench.json --referencia
+# ------------------------------------------------------------
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import warnings
+
+import numpy as np
+import pandas as pd
+import matplotlib
+import streamlit.logger
+
+# sme_mode usa st.cache_data; fora do servidor o Streamlit só avisa que não há runtime
+streamlit.logger.get_logger("streamlit.runtime.caching.cache_data_api").setLevel("ERROR")
+
+from sme_mode import (  # noqa: E402
+    CuboNotas, preparar_dataframe, detectar_colunas, parse_rating_cell, parse_rating_series,
+    montar_matriz_notas, resumo_notas, gerar_docx_relatorio,
+)
+from sme_graficos import renderizar_png, _iniciar_processo  # noqa: E402
+from sme_sintetico import FORMATOS_NOTA, gerar_respostas  # noqa: E402
+
+# nº máximo de gráficos desenhados por medição (o relatório completo pode ter centenas)
+MAX_GRAFICOS_BENCHMARK = 10
+
+
+def medir(funcao, repeticoes=3, preparar=None):
+    """
+    Executa funcao(*preparar()) 'repeticoes' vezes e devolve (tempos, último resultado).
+    O tempo de preparar() (cópias, por exemplo) fica fora da medição.
+    """
+    tempos, resultado = [], None
+    for _ in range(repeticoes):
+        args = preparar() if preparar else ()
+        inicio = time.perf_counter()
+        resultado = funcao(*args)
+        tempos.append(time.perf_counter() - inicio)
+    return tempos, resultado
+
+
+def _estatisticas(etapa, tempos, **extras):
+    return {
+        "etapa": etapa,
+        "repeticoes": len(tempos),
+        "segundos_min": round(min(tempos), 6),
+        "segundos_mediana": round(statistics.median(tempos), 6),
+        "segundos_max": round(max(tempos), 6),
+        **extras,
+    }
+
+
+def _parse_celula_a_celula(df, perguntas):
+    """Referência: o parse antigo, célula a célula (para comparar com parse_rating_series)."""
+    return [df[col].map(parse_rating_cell) for col in perguntas]
+
+
+def _jobs_graficos(df, perguntas, matriz, max_graficos, largura=7, altura=4):
+    """Os mesmos gráficos da tela: distribuição geral, distribuição e média por curso."""
+    jobs = []
+    cursos = df["Curso"].to_numpy(dtype=object) if "Curso" in df.columns else None
+    for i, col in enumerate(perguntas):
+        notas = pd.Series(matriz[i]).where(matriz[i] > 0)
+        contagem = notas.value_counts().reindex([1, 2, 3, 4, 5], fill_value=0)
+        jobs.append(("sme_distribuicao", contagem, largura, altura, "Barras"))
+        if cursos is not None:
+            validos = notas.notna().to_numpy()
+            tb = pd.crosstab(cursos[validos], notas[validos].astype(int)).reindex(columns=[1, 2, 3, 4, 5], fill_value=0)
+            jobs.append(("sme_grupo", tb, largura, altura, None))
+            jobs.append(("sme_media_grupo", notas.groupby(cursos).mean().dropna(), largura, altura, None))
+        if len(jobs) >= max_graficos:
+            break
+    return jobs[:max_graficos]
+
+
+def medir_pipeline(df_bruto, repeticoes=3, max_graficos=MAX_GRAFICOS_BENCHMARK, referencia=False):
+    """Cronometra cada etapa sobre uma exportação (DataFrame cru); devolve a lista de medições."""
+    resultados = []
+
+    csv = df_bruto.to_csv(index=False).encode("utf-8")
+    tempos, _ = medir(lambda: pd.read_csv(io.BytesIO(csv)), repeticoes)
+    resultados.append(_estatisticas("leitura_csv", tempos, bytes=len(csv)))
+
+    # preparar_dataframe altera os cabeçalhos do df recebido: cada repetição usa uma cópia
+    tempos, df = medir(preparar_dataframe, repeticoes, preparar=lambda: (df_bruto.copy(deep=False),))
+    resultados.append(_estatisticas("preparar_dataframe", tempos))
+
+    tempos, (meta_cols, perguntas, abertas) = medir(lambda: detectar_colunas(df, usar_cache=False), repeticoes)
+    resultados.append(_estatisticas("detectar_colunas", tempos, perguntas_numericas=len(perguntas),
+                                    perguntas_abertas=len(abertas)))
+    tempos, _ = medir(lambda: detectar_colunas(df, usar_cache=True), repeticoes)
+    resultados.append(_estatisticas("detectar_colunas_cache", tempos))
+
+    tempos, _ = medir(lambda: [parse_rating_series(df[col]) for col in perguntas], repeticoes)
+    resultados.append(_estatisticas("parse_notas", tempos, celulas=len(df) * len(perguntas)))
+    if referencia:
+        tempos, _ = medir(lambda: _parse_celula_a_celula(df, perguntas), repeticoes)
+        resultados.append(_estatisticas("parse_notas_celula_a_celula", tempos, celulas=len(df) * len(perguntas)))
+
+    tempos, matriz = medir(lambda: montar_matriz_notas(df, perguntas), repeticoes)
+    resultados.append(_estatisticas("matriz_notas", tempos))
+
+    tempos, _ = medir(lambda: resumo_notas(matriz, perguntas), repeticoes)
+    resultados.append(_estatisticas("tabela_resumo", tempos))
+
+    def _cubo():
+        cubo = CuboNotas(perguntas)
+        cubo.adicionar(df, matriz)
+        return cubo.resumo(cubo.selecionar())
+    tempos, _ = medir(_cubo, repeticoes)
+    resultados.append(_estatisticas("tabela_resumo_cubo", tempos))
+
+    jobs = _jobs_graficos(df, perguntas, matriz, max_graficos)
+    tempos, pngs = medir(lambda: [renderizar_png(*job) for job in jobs], repeticoes)
+    resultados.append(_estatisticas("graficos", tempos, graficos=len(jobs),
+                                    segundos_por_grafico=round(min(tempos) / max(1, len(jobs)), 6)))
+
+    figuras = [(f"Gráfico {i + 1}", png) for i, png in enumerate(pngs)]
+    tempos, docx = medir(lambda: gerar_docx_relatorio("Relatório de Avaliação - Benchmark", figuras), repeticoes)
+    resultados.append(_estatisticas("docx", tempos, bytes=len(docx)))
+
+    return resultados
+
+
+def ambiente():
+    """Versões e máquina, para os resultados serem comparáveis."""
+    import docx
+    return {
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "processador": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "matplotlib": matplotlib.__version__,
+        "python_docx": getattr(docx, "__version__", None),
+    }
+
+
+def executar_benchmark(linhas=(1000, 10000), perguntas=20, formatos=FORMATOS_NOTA, abertas=2,
+                       palavras=(5, 30), repeticoes=3, max_graficos=MAX_GRAFICOS_BENCHMARK,
+                       referencia=False, semente=0, ao_progredir=None):
+    """Roda o pipeline para cada tamanho de 'linhas' e devolve o relatório completo (dict)."""
+    _iniciar_processo()
+    warnings.simplefilter("ignore", FutureWarning)
+    warnings.simplefilter("ignore", UserWarning)
+
+    parametros = {
+        "linhas": list(linhas), "perguntas": perguntas, "formatos": list(formatos), "abertas": abertas,
+        "palavras": list(palavras), "repeticoes": repeticoes, "max_graficos": max_graficos,
+        "referencia": referencia, "semente": semente,
+    }
+    cenarios = []
+    for n in linhas:
+        inicio = time.perf_counter()
+        df = gerar_respostas(n, perguntas, formatos, abertas, palavras, semente=semente)
+        geracao = time.perf_counter() - inicio
+        etapas = medir_pipeline(df, repeticoes, max_graficos, referencia)
+        cenarios.append({"linhas": n, "colunas": len(df.columns), "segundos_geracao": round(geracao, 6),
+                         "etapas": etapas})
+        if ao_progredir:
+            ao_progredir(cenarios[-1])
+    return {"ambiente": ambiente(), "parametros": parametros, "cenarios": cenarios}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede o desempenho do pipeline do Modo SME com dados sintéticos.")
+    parser.add_argument("--linhas", type=int, nargs="+", default=[1000, 10000], help="tamanhos a medir")
+    parser.add_argument("--perguntas", type=int, default=20, help="nº de perguntas 1–5")
+    parser.add_argument("--formatos", nargs="+", default=list(FORMATOS_NOTA), choices=FORMATOS_NOTA)
+    parser.add_argument("--abertas", type=int, default=2, help="nº de perguntas abertas")
+    parser.add_argument("--palavras", type=int, nargs=2, default=[5, 30], metavar=("MIN", "MAX"))
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--graficos", type=int, default=MAX_GRAFICOS_BENCHMARK, help="gráficos desenhados por medição")
+    parser.add_argument("--referencia", action="store_true",
+                        help="também mede o parse antigo célula a célula (lento)")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--saida", default=None, help="arquivo JSON (padrão: stdout)")
+    args = parser.parse_args(argv)
+
+    def progresso(cenario):
+        total = sum(e["segundos_mediana"] for e in cenario["etapas"])
+        print(f"{cenario['linhas']} linhas: {total:.3f}s (soma das medianas)", file=sys.stderr)
+
+    relatorio = executar_benchmark(
+        args.linhas, args.perguntas, args.formatos, args.abertas, tuple(args.palavras),
+        max(1, args.repeticoes), max(0, args.graficos), args.referencia, args.semente, progresso,
+    )
+    texto = json.dumps(relatorio, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+# sme_graficos.py
+# ------------------------------------------------------------
+# Gráficos do Modo SME (sem Streamlit)
+# - Cada gráfico é desenhado só a partir dos dados: desenhar(tipo, dados, largura, altura, opcoes)
+# - renderizar_em_lote: vários gráficos de uma vez, em processos separados
+#   (backend Agg), devolvidos na mesma ordem dos pedidos
+# - Os PNGs passam pelo cache compartilhado de cache_local
+# ------------------------------------------------------------
+
+import os
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import matplotlib
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from cache_local import chave_grafico, buscar_png, guardar_png, figura_em_png
+
+# tenta importar quebrar_rotulo do seu utils; se não houver, usa fallback
+try:
+    from utils import quebrar_rotulo  # deve receber string e devolver string com quebras
+except Exception:
+    def quebrar_rotulo(s, largura=18):
+        """Fallback simples para quebrar labels longos em múltiplas linhas."""
+        if not isinstance(s, str):
+            s = str(s)
+        palavras, linhas, atual = s.split(), [], ""
+        for w in palavras:
+            if len(atual) + len(w) + 1 <= largura:
+                atual = (atual + " " + w).strip()
+            else:
+                linhas.append(atual)
+                atual = w
+        if atual:
+            linhas.append(atual)
+        return "\n".join(linhas)
+
+# resolução dos PNGs (tela e relatório usam a mesma imagem)
+DPI_GRAFICOS = 150
+
+# para classificação 1-5
+PALETA_RATING = {
+    1: "#D32F2F", 2: "#FF7043", 3: "#FFEB3B", 4: "#66BB6A", 5: "#2E7D32"
+}
+NOTAS = [1, 2, 3, 4, 5]
+
+# nº de processos para renderizar em lote (1 = tudo na thread atual)
+WORKERS_GRAFICOS = int(os.environ.get("SME_WORKERS_GRAFICOS", min(4, os.cpu_count() or 1)))
+
+# abaixo disso não compensa mandar para o pool de processos
+MIN_GRAFICOS_PARALELO = 4
+
+
+def grafico_barras_contagem(index_labels, valores, ax, titulo=None, paleta=None, anotar=True):
+    """Barras simples com rótulos quebrados e contagem anotada."""
+    pal = None
+    if paleta:
+        pal = [paleta.get(lbl, "#999999") for lbl in index_labels]
+
+    sns.barplot(x=index_labels, y=valores, palette=pal, ax=ax)
+    ax.set_xlabel("")
+    ax.set_ylabel("Quantidade")
+    ax.set_xticklabels([quebrar_rotulo(str(x)) for x in index_labels], ha="center")
+    if anotar:
+        for p in ax.patches:
+            ax.annotate(
+                f"{int(p.get_height())}",
+                (p.get_x() + p.get_width() / 2, p.get_height()),
+                ha="center", va="center", size=10, xytext=(0, 8), textcoords="offset points"
+            )
+    if titulo:
+        ax.set_title(titulo)
+
+
+def desenhar_distribuicao_grupo(tb, largura, altura, opcoes=None):
+    """Barras empilhadas grupo × nota (tabela de distribuicao_por_grupo)."""
+    fig, ax = plt.subplots(figsize=(largura, altura))
+    tb.plot(kind="bar", stacked=True, ax=ax, color=[PALETA_RATING[k] for k in NOTAS])
+    ax.set_xlabel("")
+    ax.set_ylabel("Quantidade")
+    ax.set_xticklabels([quebrar_rotulo(str(x)) for x in tb.index], ha="center")
+    ax.legend(title="Nota", bbox_to_anchor=(1.01, 1), loc="upper left")
+    return fig
+
+
+def desenhar_distribuicao(contagem, largura, altura, opcoes="Barras"):
+    """Distribuição 1–5 de uma pergunta; opcoes = "Barras" ou "Pizza"."""
+    fig, ax = plt.subplots(figsize=(largura, altura))
+    if opcoes == "Barras":
+        grafico_barras_contagem(contagem.index.tolist(), contagem.values.tolist(), ax,
+                                titulo="Distribuição de notas", paleta=PALETA_RATING)
+    else:
+        # Pizza
+        vals = contagem.values.tolist()
+        labels = contagem.index.tolist()
+        colors = [PALETA_RATING.get(k, "#999999") for k in labels]
+        ax.pie(vals, labels=labels, autopct='%1.1f%%', startangle=140, colors=colors)
+        ax.set_title("Distribuição de notas")
+    return fig
+
+
+def desenhar_media_grupo(med, largura, altura, opcoes=None):
+    """Barras com a média por grupo (índice simples ou combinação de grupos)."""
+    fig, ax = plt.subplots(figsize=(largura, altura))
+    rotulos = [" / ".join(map(str, k)) if isinstance(k, tuple) else str(k) for k in med.index]
+    sns.barplot(x=rotulos, y=med.values, ax=ax)
+    ax.set_xlabel("")
+    ax.set_ylabel("Média (1–5)")
+    ax.set_xticklabels([quebrar_rotulo(x) for x in rotulos], ha="center")
+    for p in ax.patches:
+        ax.annotate(
+            f"{p.get_height():.2f}",
+            (p.get_x() + p.get_width()/2, p.get_height()),
+            ha="center", va="center", size=10, xytext=(0, 8), textcoords="offset points"
+        )
+    ax.set_title("Média por grupo")
+    return fig
+
+
+def desenhar_palavras(cont, largura, altura, opcoes=None):
+    """Barras com os termos mais frequentes de uma pergunta aberta; opcoes = título."""
+    fig, ax = plt.subplots(figsize=(largura, altura))
+    grafico_barras_contagem(cont.index.tolist(), cont.values.tolist(), ax,
+                            titulo=opcoes or "Palavras mais frequentes")
+    return fig
+
+
+DESENHOS = {
+    "sme_grupo": desenhar_distribuicao_grupo,
+    "sme_distribuicao": desenhar_distribuicao,
+    "sme_media_grupo": desenhar_media_grupo,
+    "sme_palavras": desenhar_palavras,
+}
+
+
+# -----------------------------
+# Renderização (um gráfico ou em lote)
+# -----------------------------
+def renderizar_png(tipo, dados, largura, altura, opcoes=None):
+    """Desenha e devolve o PNG, sem passar pelo cache (usado também nos processos do pool)."""
+    fig = DESENHOS[tipo](dados, largura, altura, opcoes)
+    return figura_em_png(fig, dpi=DPI_GRAFICOS)
+
+
+def _renderizar_job(job):
+    return renderizar_png(*job)
+
+
+def _iniciar_processo():
+    # processos do pool nunca abrem janela: backend não interativo
+    matplotlib.use("Agg")
+
+
+_pool = None
+_pool_workers = 0
+_lock_pool = threading.Lock()
+
+
+def _obter_pool(workers):
+    """Pool de processos persistente (spawn: não herda threads do servidor)."""
+    global _pool, _pool_workers
+    with _lock_pool:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_iniciar_processo,
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def _descartar_pool():
+    global _pool, _pool_workers
+    with _lock_pool:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool, _pool_workers = None, 0
+
+
+def renderizar_em_lote(jobs, workers=None):
+    """
+    Renderiza uma lista de jobs (tipo, dados, largura, altura, opcoes) e devolve
+    os PNGs na MESMA ordem. O que já está no cache não é redesenhado; o restante
+    vai para o pool de processos quando há 'workers' > 1 e gráficos suficientes.
+    """
+    workers = WORKERS_GRAFICOS if workers is None else max(1, int(workers))
+    chaves = [chave_grafico(t, d, la, al, op, DPI_GRAFICOS) for t, d, la, al, op in jobs]
+    pngs = [buscar_png(chave) for chave in chaves]
+    faltando = [i for i, png in enumerate(pngs) if png is None]
+
+    novos = None
+    if workers > 1 and len(faltando) >= MIN_GRAFICOS_PARALELO:
+        try:
+            # map preserva a ordem de envio
+            novos = list(_obter_pool(workers).map(_renderizar_job, [jobs[i] for i in faltando]))
+        except BrokenProcessPool:
+            _descartar_pool()  # processo caiu: refaz tudo aqui mesmo
+    if novos is None:
+        novos = [_renderizar_job(jobs[i]) for i in faltando]
+
+    for i, png in zip(faltando, novos):
+        pngs[i] = png
+        guardar_png(chaves[i], png)
+    return pngs
@@ -0,0 +1,206 @@
+# sme_lote.py
+# ------------------------------------------------------------
+# Relatórios do Modo SME em lote (linha de comando, sem Streamlit)
+# - Lê a exportação do formulário uma única vez (CSV em blocos ou XLSX)
+# - Detecta as perguntas com detectar_colunas e soma as notas no cubo
+# - Gera um .docx por curso (e por curso + modalidade, se pedido),
+#   com os mesmos gráficos e o mesmo layout do relatório da tela
+# - Cada curso é desenhado e salvo num processo separado
+#
+# Uso:
+#   python sme_lote.py respostas.csv --saida relatorios/
+#   python sme_lote.py respostas.xlsx --aba "Respostas" --por-modalidade --agrupar Modalidade
+# ------------------------------------------------------------
+
+import os
+import re
+import sys
+import argparse
+import warnings
+import unicodedata
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import streamlit.logger
+
+# sme_mode usa st.cache_data; fora do servidor o Streamlit só avisa que não há runtime
+streamlit.logger.get_logger("streamlit.runtime.caching.cache_data_api").setLevel("ERROR")
+
+from sme_mode import (  # noqa: E402
+    ResumoEmBlocos, COLUNAS_GRUPO, STOPWORDS_SME,
+    detectar_colunas, preparar_dataframe, ler_csv_em_blocos, gerar_docx_relatorio,
+)
+from sme_graficos import WORKERS_GRAFICOS, renderizar_png, _iniciar_processo
+
+
+def carregar_resumo(caminho, aba=None):
+    """Lê o arquivo uma vez e devolve os agregados (ResumoEmBlocos) com notas e termos."""
+    if caminho.lower().endswith(".csv"):
+        return ler_csv_em_blocos(caminho)
+    df = pd.read_excel(caminho, sheet_name=aba if aba is not None else 0)
+    if df.empty:
+        return None
+    df = preparar_dataframe(df)
+    meta_cols, perguntas_numericas, perguntas_abertas = detectar_colunas(df)
+    resumo = ResumoEmBlocos(df.columns, meta_cols, perguntas_numericas, perguntas_abertas)
+    resumo.adicionar_bloco(df)
+    return resumo
+
+
+def nome_arquivo(*partes):
+    """Relatorio_Avaliacao_<curso>[_<modalidade>].docx, sem acentos nem espaços."""
+    sufixo = "_".join(
+        re.sub(r"[^A-Za-z0-9]+", "_", unicodedata.normalize("NFKD", str(p)).encode("ascii", "ignore").decode()).strip("_")
+        for p in partes
+    )
+    return f"Relatorio_Avaliacao_{sufixo or 'sem_nome'}.docx"
+
+
+def planejar_relatorio(resumo, sel, agrupar=(), tipo_grafico="Barras", largura=7, altura=4,
+                       stopwords=STOPWORDS_SME):
+    """
+    Lista de (título, job) do relatório para os grupos em 'sel', na mesma ordem da tela:
+    por pergunta 1–5 → distribuição por grupo, distribuição geral, média por grupo;
+    por pergunta aberta → palavras mais frequentes.
+    """
+    figuras = []
+    for col in resumo.perguntas_numericas:
+        contagem = resumo.contagem(col, sel)
+        if contagem.sum() == 0:
+            continue
+        for g in agrupar:
+            tb = resumo.distribuicao(col, g, sel)
+            if not tb.empty:
+                figuras.append((f"{col} — Distribuição por {g}", ("sme_grupo", tb, largura, altura, None)))
+        figuras.append((f"{col} — Distribuição geral", ("sme_distribuicao", contagem, largura, altura, tipo_grafico)))
+        if agrupar:
+            med = resumo.media(col, list(agrupar), sel)
+            if not med.empty:
+                figuras.append((f"{col} — Média por grupo", ("sme_media_grupo", med, largura, altura, None)))
+    for col in resumo.perguntas_abertas:
+        cont = resumo.termos_frequentes(col, sel, stopwords=stopwords)
+        if not cont.empty:
+            figuras.append((f"{col} — Palavras mais frequentes", ("sme_palavras", cont, largura, altura, None)))
+    return figuras
+
+
+def _iniciar_lote():
+    # backend Agg; avisos de depreciação do seaborn/matplotlib só poluem a saída do terminal
+    _iniciar_processo()
+    warnings.simplefilter("ignore", FutureWarning)
+    warnings.simplefilter("ignore", UserWarning)
+
+
+def gerar_relatorio(tarefa):
+    """Desenha os gráficos e grava o .docx de um curso (roda dentro do pool de processos)."""
+    titulo_doc, figuras, caminho = tarefa
+    pngs = [(titulo, renderizar_png(*job)) for titulo, job in figuras]
+    with open(caminho, "wb") as f:
+        f.write(gerar_docx_relatorio(titulo_doc, pngs))
+    return caminho, len(pngs)
+
+
+def montar_tarefas(resumo, pasta_saida, por_modalidade=False, **opcoes):
+    """
+    Uma tarefa (título, figuras, caminho) por curso e, se pedido, por curso + modalidade.
+    Nomes que ficam iguais sem acentos e pontuação ("Técnico – Info" e "Tecnico Info"),
+    inclusive só na caixa, ganham sufixo _2, _3… em vez de sobrescrever o anterior.
+    """
+    cursos = resumo.valores("Curso") if resumo.tem_coluna("Curso") else []
+    modalidades = resumo.valores("Modalidade") if resumo.tem_coluna("Modalidade") else []
+    if not cursos:
+        cursos = ["Todos"]  # planilha sem coluna de curso: um relatório geral
+
+    tarefas = []
+    for curso in cursos:
+        combinacoes = [(curso, "Todas")]
+        if por_modalidade:
+            combinacoes += [(curso, m) for m in modalidades]
+        for curso_filtro, modalidade_filtro in combinacoes:
+            sel = resumo.selecionar(curso_filtro, modalidade_filtro)
+            if resumo.n_respostas(sel) == 0:
+                continue
+            titulo_doc = f"Relatório de Avaliação - {curso if curso != 'Todos' else 'Todos os cursos'}"
+            partes = [curso]
+            if modalidade_filtro != "Todas":
+                titulo_doc += f" | Modalidade: {modalidade_filtro}"
+                partes.append(modalidade_filtro)
+            figuras = planejar_relatorio(resumo, sel, **opcoes)
+            tarefas.append((titulo_doc, figuras, nome_arquivo(*partes)))
+
+    # sufixos só depois de conhecer todos os nomes: um curso "X 2" real mantém o seu
+    livres = {nome.lower() for _, _, nome in tarefas}
+    usados = set()
+    for i, (titulo_doc, figuras, nome) in enumerate(tarefas):
+        base, extensao = os.path.splitext(nome)
+        n = 1
+        while nome.lower() in usados or (n > 1 and nome.lower() in livres):
+            n += 1
+            nome = f"{base}_{n}{extensao}"
+        usados.add(nome.lower())
+        tarefas[i] = (titulo_doc, figuras, os.path.join(pasta_saida, nome))
+    return tarefas
+
+
+def gerar_relatorios(caminho, pasta_saida, aba=None, por_modalidade=False, workers=None, **opcoes):
+    """Gera todos os relatórios; devolve a lista de arquivos gravados."""
+    resumo = carregar_resumo(caminho, aba)
+    if resumo is None:
+        raise ValueError(f"Sem dados em {caminho}")
+    os.makedirs(pasta_saida, exist_ok=True)
+    tarefas = montar_tarefas(resumo, pasta_saida, por_modalidade=por_modalidade, **opcoes)
+    print(f"{resumo.total_linhas} respostas, {len(resumo.perguntas_numericas)} perguntas 1–5, "
+          f"{len(resumo.perguntas_abertas)} abertas → {len(tarefas)} relatório(s)")
+
+    workers = max(1, min(WORKERS_GRAFICOS if workers is None else workers, len(tarefas) or 1))
+    gravados = []
+    if workers == 1:
+        _iniciar_lote()
+        for i, tarefa in enumerate(tarefas, 1):
+            arquivo, n = gerar_relatorio(tarefa)
+            gravados.append(arquivo)
+            print(f"[{i}/{len(tarefas)}] {arquivo} ({n} gráficos)")
+        return gravados
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_iniciar_lote) as pool:
+        futuros = [pool.submit(gerar_relatorio, tarefa) for tarefa in tarefas]
+        for i, futuro in enumerate(as_completed(futuros), 1):
+            arquivo, n = futuro.result()
+            gravados.append(arquivo)
+            print(f"[{i}/{len(tarefas)}] {arquivo} ({n} gráficos)")
+    return gravados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera um relatório .docx do Modo SME por curso.")
+    parser.add_argument("arquivo", help="exportação do formulário (.csv ou .xlsx)")
+    parser.add_argument("--saida", default="relatorios_sme", help="pasta de destino (padrão: relatorios_sme)")
+    parser.add_argument("--aba", default=None, help="aba do XLSX (padrão: a primeira)")
+    parser.add_argument("--por-modalidade", action="store_true",
+                        help="também gera um relatório por curso + modalidade")
+    parser.add_argument("--agrupar", nargs="*", default=[], choices=list(COLUNAS_GRUPO),
+                        help="inclui distribuição e média por estes grupos (como 'Agrupar por' na tela)")
+    parser.add_argument("--grafico", default="Barras", choices=["Barras", "Pizza"],
+                        help="gráfico das perguntas 1–5")
+    parser.add_argument("--largura", type=int, default=7)
+    parser.add_argument("--altura", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=None,
+                        help=f"processos em paralelo (padrão: {WORKERS_GRAFICOS})")
+    args = parser.parse_args(argv)
+
+    try:
+        gerar_relatorios(
+            args.arquivo, args.saida, aba=args.aba, por_modalidade=args.por_modalidade,
+            workers=args.workers, agrupar=tuple(args.agrupar), tipo_grafico=args.grafico,
+            largura=args.largura, altura=args.altura,
+        )
+    except (OSError, ValueError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
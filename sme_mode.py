@@ -1,7 +1,7 @@
 # sme_mode_v2.py
 # ------------------------------------------------------------
 # Streamlit – Painel Interativo (Modo SME) - V2
-# - Aceita XLSX/CSV, escolha de aba
+# - Aceita XLSX/CSV, escolha de aba; CSV grande pode ser lido em blocos (só agregados + amostra)
 # - Detecta perguntas 1-5 (inteiro, "5 - Excelente", "⭐⭐⭐⭐", etc.)
 # - Lida com colunas abertas (texto longo)
 # - Agrupamento por Curso/Modalidade
@@ -11,31 +11,17 @@
 import io
 import re
 import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 import streamlit as st
 import matplotlib.pyplot as plt
-import seaborn as sns
 from docx import Document
 from docx.shared import Inches
 
-# tenta importar quebrar_rotulo do seu utils; se não houver, usa fallback
-try:
-    from utils import quebrar_rotulo  # deve receber string e devolver string com quebras
-except Exception:
-    def quebrar_rotulo(s, largura=18):
-        """Fallback simples para quebrar labels longos em múltiplas linhas."""
-        if not isinstance(s, str):
-            s = str(s)
-        palavras, linhas, atual = s.split(), [], ""
-        for w in palavras:
-            if len(atual) + len(w) + 1 <= largura:
-                atual = (atual + " " + w).strip()
-            else:
-                linhas.append(atual)
-                atual = w
-        if atual:
-            linhas.append(atual)
-        return "\n".join(linhas)
+from cache_local import CacheLRU, hash_bytes, hash_arquivo, caminho_cache, salvar_parquet, ler_parquet, podar_pasta
+from sme_graficos import DPI_GRAFICOS, NOTAS, WORKERS_GRAFICOS, renderizar_em_lote
 
 # -----------------------------
 # Configurações visuais fixas
@@ -48,11 +34,6 @@ CORES_FIXAS = {
     "Regular": "#FFEB3B", "Insatisfeito(a)": "#FF7043",
 }
 
-# para classificação 1-5
-PALETA_RATING = {
-    1: "#D32F2F", 2: "#FF7043", 3: "#FFEB3B", 4: "#66BB6A", 5: "#2E7D32"
-}
-
 # colunas que não são perguntas (identificação/metadados mais comuns)
 COLUNAS_META_CANDIDATAS = {
     "carimbo de data/hora", "timestamp", "nome", "nome completo",
@@ -60,6 +41,9 @@ COLUNAS_META_CANDIDATAS = {
     "email", "e-mail", "turma", "setor"
 }
 
+# colunas de agrupamento/filtro (nomes já padronizados por preparar_dataframe)
+COLUNAS_GRUPO = ("Curso", "Modalidade")
+
 # padrões que ajudam a identificar perguntas (texto longo com ?)
 PADRAO_PERGUNTA = re.compile(r"\?$", re.IGNORECASE)
 
@@ -69,10 +53,28 @@ PADROES_ABERTAS = [
     "observações", "comentários", "sugestões"
 ]
 
+# stopwords básicas PT (enxuta; ajuste/importe NLTK se quiser algo melhor)
+STOPWORDS_SME = {
+    "para","como","isso","essa","esse","esta","este","aquele","aquela","aqui","ali","tudo",
+    "muito","também","pois","onde","quando","então","porque","pela","pelo","pela","pelos",
+    "sobre","entre","apesar","com","sem","mais","menos","cada","todos","todas","foram",
+    "curso","aulas","professor","instrutor","facilitador","palestrante"  # ajuste se quiser manter
+}
+
+# pontuação básica removida antes de separar as palavras
+PADRAO_PONTUACAO = r"[.,;:!?/()\"'“”·\-—–_]"
+
 
 # -----------------------------
 # Parsing de notas (1–5)
 # -----------------------------
+# mapeamentos livres (se quiser, amplie); a ordem define a prioridade
+MAPA_NOTAS_TEXTO = {
+    "péssimo": 1, "ruim": 2, "regular": 3,
+    "bom": 4, "excelente": 5
+}
+
+
 def parse_rating_cell(x):
     """
     Converte diferentes formatos para inteiros 1–5.
@@ -112,19 +114,147 @@ def parse_rating_cell(x):
     except Exception:
         pass
 
-    # mapeamentos livres (se quiser, amplie)
-    MAP = {
-        "péssimo": 1, "ruim": 2, "regular": 3,
-        "bom": 4, "excelente": 5
-    }
+    # mapeamentos livres
     s_low = s.lower()
-    for k, v in MAP.items():
+    for k, v in MAPA_NOTAS_TEXTO.items():
         if k in s_low:
             return v
 
     return None
 
 
+def _notas_de_numeros(valores):
+    """Arredonda (meio-para-par, como round) e mantém só 1–5; o resto vira NaN."""
+    valores = pd.to_numeric(pd.Series(valores), errors="coerce").astype("float64")
+    valores = valores.where(np.isfinite(valores))
+    arred = np.round(valores)
+    return arred.where((arred >= 1) & (arred <= 5))
+
+
+def _notas_de_textos(textos):
+    """
+    Aplica as regras de texto de parse_rating_cell a uma Series de strings:
+    primeiro dígito 1–5, estrelas, número com vírgula/ponto e, por fim, palavras-chave.
+    """
+    s = textos.str.strip()
+
+    # "5 - Excelente" → pega o primeiro número
+    notas = pd.to_numeric(s.str.extract(r"^\s*([1-5])\b", expand=False), errors="coerce")
+    pendente = notas.isna()
+
+    # "⭐⭐⭐" → conta estrelas (se houver estrela, a célula para aqui, válida ou não)
+    tem_estrela = pendente & s.str.contains("⭐", regex=False)
+    estrelas = s.str.count("⭐").astype("float64")
+    notas = notas.mask(tem_estrela, estrelas.where(estrelas.between(1, 5)))
+    pendente &= ~tem_estrela
+
+    # "4.0" / "4,0"
+    num = _notas_de_numeros(s.str.replace(",", ".", regex=False))
+    usa_num = pendente & num.notna()
+    notas = notas.mask(usa_num, num)
+    pendente &= ~usa_num
+
+    # palavras-chave: a primeira do mapa encontrada vence
+    s_low = s.str.lower()
+    for chave, valor in MAPA_NOTAS_TEXTO.items():
+        achou = pendente & s_low.str.contains(chave, regex=False)
+        notas = notas.mask(achou, float(valor))
+        pendente &= ~achou
+
+    return notas
+
+
+def parse_rating_series(serie):
+    """
+    Versão vetorizada de parse_rating_cell para uma coluna inteira.
+    Trabalha só sobre os valores distintos (respostas de formulário se repetem muito)
+    e devolve uma Series 'Int8' com o mesmo índice, <NA> onde não há nota válida.
+    """
+    serie = pd.Series(serie)
+    if serie.empty:
+        return pd.Series(pd.array([], dtype="Int8"), index=serie.index)
+
+    # coluna numérica pura (int/float/bool): só arredondar e checar a faixa
+    if pd.api.types.is_numeric_dtype(serie.dtype) or pd.api.types.is_bool_dtype(serie.dtype):
+        notas = _notas_de_numeros(serie.astype("float64")).to_numpy()
+        return pd.Series(pd.array(notas, dtype="Int8"), index=serie.index)
+
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    unicos = pd.Series(unicos.to_numpy(dtype=object), dtype=object)
+
+    # números soltos em colunas de texto seguem a regra numérica, o resto vira string
+    eh_numero = unicos.map(lambda v: isinstance(v, (int, float))).to_numpy(dtype=bool)
+    notas_unicos = pd.Series(np.nan, index=unicos.index)
+    if eh_numero.any():
+        notas_unicos[eh_numero] = _notas_de_numeros(unicos[eh_numero].astype("float64")).to_numpy()
+    if (~eh_numero).any():
+        textos = unicos[~eh_numero].map(str).astype(object)
+        notas_unicos[~eh_numero] = _notas_de_textos(textos).to_numpy()
+
+    # -1 (NaN na origem) → sem nota
+    notas = np.append(notas_unicos.to_numpy(dtype="float64"), np.nan)[codigos]
+    return pd.Series(pd.array(notas, dtype="Int8"), index=serie.index)
+
+
+# -----------------------------
+# Matriz de notas (parse único por arquivo)
+# -----------------------------
+def montar_matriz_notas(df, perguntas):
+    """
+    Matriz int8 (perguntas × respostas) com as notas 1–5; 0 = sem nota.
+    A linha i corresponde a perguntas[i] e a coluna j à j-ésima linha de df.
+    """
+    matriz = np.zeros((len(perguntas), len(df)), dtype=np.int8)
+    for i, col in enumerate(perguntas):
+        matriz[i] = parse_rating_series(df[col]).fillna(0).to_numpy(dtype=np.int8)
+    return matriz
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def matriz_notas_cacheada(chave_arquivo, sheet_name, perguntas, _df):
+    """Monta a matriz uma vez por (conteúdo do arquivo, aba, perguntas); _df não entra no hash."""
+    return montar_matriz_notas(_df, list(perguntas))
+
+
+def contagem_notas(matriz):
+    """Contagem de cada nota 1–5 por pergunta → array (perguntas × 5)."""
+    return np.stack([(matriz == k).sum(axis=1) for k in NOTAS], axis=1)
+
+
+def resumo_notas(matriz, perguntas):
+    """Tabela 'Média'/'N' por pergunta, só com perguntas que têm alguma nota."""
+    return resumo_de_contagens(contagem_notas(matriz), perguntas)
+
+
+def resumo_de_contagens(cont, perguntas):
+    """Mesmo resumo de resumo_notas, a partir das contagens (perguntas × 5)."""
+    n = cont.sum(axis=1)
+    soma = cont @ np.array(NOTAS)
+    resumo = {}
+    for col, ni, si in zip(perguntas, n, soma):
+        if ni > 0:
+            resumo[col] = {"Média": round(si / ni, 2), "N": int(ni)}
+    return resumo
+
+
+def distribuicao_por_grupo(grupos, notas, nome_grupo):
+    """Tabela grupo × nota (1–5) a partir de uma linha da matriz."""
+    validas = notas > 0
+    tb = pd.crosstab(
+        pd.Series(np.asarray(grupos)[validas], name=nome_grupo),
+        pd.Series(notas[validas], name="rating"),
+    )
+    return tb.reindex(columns=NOTAS, fill_value=0)
+
+
+def media_por_grupo(df_grupos, notas):
+    """Média das notas por combinação das colunas de df_grupos (mesma ordem de linhas)."""
+    validas = notas > 0
+    tmp = df_grupos.astype(str)[validas].copy()
+    tmp["rating"] = notas[validas].astype(float)
+    return tmp.groupby(list(df_grupos.columns))["rating"].mean().sort_values(ascending=False)
+
+
 def coluna_parece_aberta(nome_coluna):
     """Heurística para detectar perguntas abertas."""
     s = (nome_coluna or "").lower()
@@ -134,12 +264,167 @@ def coluna_parece_aberta(nome_coluna):
     return False
 
 
-def detectar_colunas(df):
+# -----------------------------
+# Detecção de colunas (perfil da coluna inteira, cache pelo cabeçalho)
+# -----------------------------
+VERSAO_ESQUEMA = 1            # mude ao alterar as regras abaixo (invalida os esquemas salvos)
+MAX_LINHAS_ESQUEMA = 5000     # acima disso o perfil usa uma amostra estratificada
+MIN_NOTAS_PERGUNTA = 3        # nº mínimo de notas válidas para ser pergunta 1–5
+FRACAO_NOTAS_PERGUNTA = 0.5   # fração mínima das respostas que viram nota 1–5
+TAMANHO_TEXTO_LIVRE = 25      # nº médio de caracteres a partir do qual a resposta é texto livre
+FRACAO_DISTINTOS_TEXTO = 0.3  # texto livre: respostas quase sempre diferentes entre si
+SUBPASTA_ESQUEMAS = "sme_esquemas"
+MAX_ESQUEMAS_DISCO = 200
+
+_cache_esquemas = CacheLRU(max_itens=64)
+
+
+def amostra_estratificada(df, n=MAX_LINHAS_ESQUEMA, estratos=COLUNAS_GRUPO):
+    """Até ~n linhas, proporcionais por Curso/Modalidade (ou espaçadas ao longo do arquivo)."""
+    if len(df) <= n:
+        return df
+    colunas = [c for c in estratos if c in df.columns]
+    if not colunas:
+        return df.iloc[np.linspace(0, len(df) - 1, n).astype(int)]
+    return df.groupby(colunas, dropna=False, group_keys=False, sort=False).sample(
+        frac=n / len(df), random_state=0
+    )
+
+
+def _valores_e_frequencias(serie):
+    """Valores distintos (sem NaN, dtype object) e quantas vezes cada um aparece."""
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    freq = np.bincount(codigos[codigos >= 0], minlength=len(unicos))
+    return pd.Series(np.asarray(unicos, dtype=object), dtype=object), freq
+
+
+def _perfil_basico(serie, unicos, freq):
+    n = int(freq.sum())
+    texto = pd.api.types.is_object_dtype(serie.dtype) or pd.api.types.is_string_dtype(serie.dtype)
+    tamanho_medio = 0.0
+    if texto and n:
+        tamanho_medio = float((unicos.astype(str).str.len().to_numpy() * freq).sum() / n)
+    return {"n": n, "cardinalidade": len(unicos), "tamanho_medio": tamanho_medio, "texto": bool(texto)}
+
+
+def _com_notas(perfil, n_notas):
+    perfil["n_notas"] = n_notas
+    perfil["fracao_notas"] = n_notas / perfil["n"] if perfil["n"] else 0.0
+    return perfil
+
+
+def perfil_coluna(serie):
+    """
+    Estatísticas da coluna usadas na classificação, calculadas sobre os valores
+    distintos ponderados pela frequência (a coluna inteira, sem laço por célula):
+    n, n_notas, fracao_notas, cardinalidade, tamanho_medio, texto.
+    """
+    unicos, freq = _valores_e_frequencias(serie)
+    tem_nota = parse_rating_series(unicos).notna().to_numpy()
+    return _com_notas(_perfil_basico(serie, unicos, freq), int(freq[tem_nota].sum()))
+
+
+def eh_texto_livre(nome, perfil):
+    """Respostas longas e variadas (ou longas numa coluna com nome de pergunta aberta)."""
+    longo = perfil["texto"] and perfil["tamanho_medio"] >= TAMANHO_TEXTO_LIVRE
+    variado = perfil["cardinalidade"] >= FRACAO_DISTINTOS_TEXTO * perfil["n"]
+    return longo and (variado or coluna_parece_aberta(nome))
+
+
+def classificar_coluna(nome, perfil):
+    """'numerica' (nota 1–5), 'aberta' (texto livre) ou None, a partir do perfil."""
+    texto_livre = eh_texto_livre(nome, perfil)
+
+    # nota 1–5: boa parte da coluna vira nota e as respostas não são texto corrido
+    if (not texto_livre and perfil["n_notas"] >= MIN_NOTAS_PERGUNTA
+            and perfil["fracao_notas"] >= FRACAO_NOTAS_PERGUNTA):
+        return "numerica"
+
+    # se for texto e parecer "aberta"
+    if perfil["texto"] and (texto_livre or coluna_parece_aberta(nome)
+                            or PADRAO_PERGUNTA.search(str(nome).strip()) is not None):
+        return "aberta"
+
+    # fallback: se for object mas com poucas categorias e não meta, ainda pode ser pergunta categórica (antigo Likert)
+    # mantemos fora nesta versão para foco no 1–5. (Se quiser, pode reincluir aqui.)
+    return None
+
+
+def chave_esquema(colunas):
+    """Hash do cabeçalho (mesmo formulário → mesma chave)."""
+    assinatura = json.dumps([VERSAO_ESQUEMA, [str(c) for c in colunas]], ensure_ascii=False)
+    return hash_bytes(assinatura.encode("utf-8"))
+
+
+def _arquivo_esquema(chave):
+    return caminho_cache(SUBPASTA_ESQUEMAS, f"{chave}.json")
+
+
+def carregar_esquema(chave):
+    """Esquema já inferido para este cabeçalho (memória → .json local), ou None."""
+    esquema = _cache_esquemas.get(chave)
+    if esquema is not None:
+        return esquema
+    caminho = _arquivo_esquema(chave)
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            esquema = json.load(f)
+        os.utime(caminho)
+    except (OSError, ValueError):
+        return None
+    _cache_esquemas.put(chave, esquema)
+    return esquema
+
+
+def salvar_esquema(chave, esquema):
+    _cache_esquemas.put(chave, esquema)
+    caminho = _arquivo_esquema(chave)
+    tmp = f"{caminho}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(esquema, f, ensure_ascii=False)
+        os.replace(tmp, caminho)
+        podar_pasta(SUBPASTA_ESQUEMAS, MAX_ESQUEMAS_DISCO)
+    except OSError:
+        pass  # sem disco: fica só o cache em memória
+
+
+def inferir_esquema(df, colunas):
+    """Classifica 'colunas' pelo perfil da coluna inteira (ou de uma amostra estratificada)."""
+    amostra = amostra_estratificada(df)
+    freqs = {c: _valores_e_frequencias(amostra[c]) for c in colunas}
+    perfis = {c: _perfil_basico(amostra[c], *freqs[c]) for c in colunas}
+
+    # texto livre não precisa ter as respostas parseadas; nas demais colunas as opções
+    # de resposta se repetem entre perguntas: cada valor distinto é parseado uma vez só
+    parsear = [c for c in colunas if not eh_texto_livre(c, perfis[c])]
+    valores = pd.Series(pd.unique(pd.concat(
+        [freqs[c][0] for c in parsear] + [pd.Series([], dtype=object)]
+    )), dtype=object)
+    valores_com_nota = valores[parse_rating_series(valores).notna().to_numpy()]
+
+    esquema = {"numericas": [], "abertas": [], "perfis": {}}
+    for c in colunas:
+        unicos, freq = freqs[c]
+        n_notas = int(freq[unicos.isin(valores_com_nota).to_numpy()].sum()) if c in parsear else 0
+        perfil = _com_notas(perfis[c], n_notas)
+        esquema["perfis"][str(c)] = perfil
+        tipo = classificar_coluna(c, perfil)
+        if tipo == "numerica":
+            esquema["numericas"].append(c)
+        elif tipo == "aberta":
+            esquema["abertas"].append(c)
+    return esquema
+
+
+def detectar_colunas(df, usar_cache=True):
     """
     Retorna:
       - meta_cols: colunas de identificação (curso, modalidade, etc.)
       - perguntas_numericas: perguntas que aceitam nota 1-5 (ou que podem ser parseadas)
       - perguntas_abertas: perguntas abertas (texto)
+    A classificação das perguntas fica em cache pelo hash do cabeçalho: o mesmo
+    formulário enviado de novo não é perfilado outra vez.
     """
     cols = list(df.columns)
     # meta: nomes exatos ou aproximações
@@ -158,27 +443,13 @@ def detectar_colunas(df):
     # perguntas candidatas = restantes
     restantes = [c for c in cols if c not in meta_cols]
 
-    perguntas_numericas, perguntas_abertas = [], []
-    for c in restantes:
-        serie = df[c]
-
-        # tenta parsear como 1-5
-        amostra = serie.dropna().head(20)
-        parsed = [parse_rating_cell(v) for v in amostra]
-        # se metade ou mais da amostra vira 1-5, consideramos numérica (estrelas)
-        if len(parsed) > 0 and sum(v is not None for v in parsed) >= max(3, len(parsed)//2):
-            perguntas_numericas.append(c)
-            continue
-
-        # se for texto e parecer "aberta"
-        if serie.dtype == "object" and (coluna_parece_aberta(c) or PADRAO_PERGUNTA.search(str(c).strip()) is not None):
-            perguntas_abertas.append(c)
-            continue
+    chave = chave_esquema(cols)
+    esquema = carregar_esquema(chave) if usar_cache else None
+    if esquema is None:
+        esquema = inferir_esquema(df, restantes)
+        salvar_esquema(chave, esquema)
 
-        # fallback: se for object mas com poucas categorias e não meta, ainda pode ser pergunta categórica (antigo Likert)
-        # mantemos fora nesta versão para foco no 1–5. (Se quiser, pode reincluir aqui.)
-
-    return meta_cols, perguntas_numericas, perguntas_abertas
+    return meta_cols, list(esquema["numericas"]), list(esquema["abertas"])
 
 
 def preparar_dataframe(df):
@@ -204,33 +475,653 @@ def preparar_dataframe(df):
     return df
 
 
-def grafico_barras_contagem(index_labels, valores, ax, titulo=None, paleta=None, anotar=True):
-    """Barras simples com rótulos quebrados e contagem anotada."""
-    pal = None
-    if paleta:
-        pal = [paleta.get(lbl, "#999999") for lbl in index_labels]
-
-    sns.barplot(x=index_labels, y=valores, palette=pal, ax=ax)
-    ax.set_xlabel("")
-    ax.set_ylabel("Quantidade")
-    ax.set_xticklabels([quebrar_rotulo(str(x)) for x in index_labels], ha="center")
-    if anotar:
-        for p in ax.patches:
-            ax.annotate(
-                f"{int(p.get_height())}",
-                (p.get_x() + p.get_width() / 2, p.get_height()),
-                ha="center", va="center", size=10, xytext=(0, 8), textcoords="offset points"
+# -----------------------------
+# Ingestão com cache (hash do arquivo, aba)
+# -----------------------------
+SUBPASTA_CACHE_SME = "sme"
+MAX_PLANILHAS_MEMORIA = 6     # DataFrames normalizados mantidos em memória
+MAX_PLANILHAS_DISCO = 48      # arquivos .parquet mantidos na pasta de cache
+
+
+def _arquivo_spill(chave):
+    hash_conteudo, aba = chave
+    sufixo = hash_bytes(str(aba).encode("utf-8"))[:10]
+    return caminho_cache(SUBPASTA_CACHE_SME, f"{hash_conteudo}_{sufixo}.parquet")
+
+
+def _derramar_planilha(chave, df):
+    """Entrada expulsa da memória vai para um .parquet local (se o formato aceitar)."""
+    caminho = _arquivo_spill(chave)
+    if not os.path.exists(caminho) and salvar_parquet(df, caminho):
+        podar_pasta(SUBPASTA_CACHE_SME, MAX_PLANILHAS_DISCO)
+
+
+_cache_planilhas = CacheLRU(max_itens=MAX_PLANILHAS_MEMORIA, ao_despejar=_derramar_planilha)
+_cache_abas = CacheLRU(max_itens=32)
+
+
+def listar_abas(conteudo, chave_arquivo):
+    """Nomes das abas de um XLSX, lidos uma vez por conteúdo."""
+    abas = _cache_abas.get(chave_arquivo)
+    if abas is None:
+        with pd.ExcelFile(io.BytesIO(conteudo)) as xls:
+            abas = list(xls.sheet_names)
+        _cache_abas.put(chave_arquivo, abas)
+    return abas
+
+
+def _ler_planilha(conteudo, nome_arquivo, sheet_name):
+    """Leitura bruta (sem cache): XLSX pela aba escolhida, CSV com fallback para ';'."""
+    if nome_arquivo.lower().endswith(".xlsx"):
+        return pd.read_excel(io.BytesIO(conteudo), sheet_name=sheet_name)
+    try:
+        # tenta detectar sep padrão; ajuste se necessário
+        return pd.read_csv(io.BytesIO(conteudo))
+    except Exception:
+        return pd.read_csv(io.BytesIO(conteudo), sep=";")
+
+
+def carregar_planilha(conteudo, nome_arquivo, sheet_name=None, chave_arquivo=None):
+    """
+    Retorna o DataFrame já normalizado (preparar_dataframe) para (hash do arquivo, aba).
+    Ordem de busca: memória → .parquet local → leitura do arquivo.
+    O DataFrame devolvido é compartilhado entre reruns: não altere no lugar.
+    """
+    chave = (chave_arquivo or hash_bytes(conteudo), sheet_name)
+
+    df = _cache_planilhas.get(chave)
+    if df is not None:
+        return df
+
+    df = ler_parquet(_arquivo_spill(chave))
+    if df is None:
+        df = _ler_planilha(conteudo, nome_arquivo, sheet_name)
+        if df is None or df.empty:
+            return df
+        df = preparar_dataframe(df)
+
+    _cache_planilhas.put(chave, df)
+    return df
+
+
+# -----------------------------
+# Grupos (Curso, Modalidade) e índice de termos das perguntas abertas
+# -----------------------------
+TAMANHO_MIN_PALAVRA = 4       # palavras mais curtas não entram no índice
+MAX_MASCARAS_STOPWORDS = 8    # conjuntos de stopwords com máscara guardada, por índice
+
+
+class GruposCursoModalidade:
+    """
+    Registro das combinações (Curso, Modalidade) já vistas, cada uma com um código
+    inteiro estável (0, 1, 2… na ordem em que aparecem). None = coluna ausente/vazia.
+    Os agregados guardam arrays indexados por esse código; os filtros viram máscaras.
+    """
+
+    def __init__(self):
+        self.chaves = []
+        self._codigo = {}
+
+    def __len__(self):
+        return len(self.chaves)
+
+    def _codigo_da_chave(self, chave):
+        codigo = self._codigo.get(chave)
+        if codigo is None:
+            codigo = len(self.chaves)
+            self.chaves.append(chave)
+            self._codigo[chave] = codigo
+        return codigo
+
+    def codigos(self, df):
+        """Código do grupo de cada linha de df (registra combinações novas)."""
+        chaves = pd.DataFrame(
+            {g: (df[g].to_numpy(dtype=object) if g in df.columns else None) for g in COLUNAS_GRUPO},
+            index=df.index,
+        )
+        ids = chaves.groupby(list(COLUNAS_GRUPO), dropna=False, sort=False).ngroup().to_numpy()
+        # np.unique devolve os ids em ordem (0..k-1) com a 1ª linha de cada um
+        _, primeiras = np.unique(ids, return_index=True)
+        mapa = np.array([
+            self._codigo_da_chave(tuple(None if pd.isna(v) else v for v in chaves.iloc[pos]))
+            for pos in primeiras
+        ], dtype=np.int64)
+        return mapa[ids]
+
+    def valores(self, coluna):
+        """Valores distintos de uma coluna de grupo (para os filtros)."""
+        p = COLUNAS_GRUPO.index(coluna)
+        return sorted({g[p] for g in self.chaves if g[p] is not None}, key=str)
+
+    def selecionar(self, curso="Todos", modalidade="Todas"):
+        """Máscara booleana sobre os grupos para os filtros da barra lateral."""
+        sel = np.ones(len(self.chaves), dtype=bool)
+        if curso != "Todos":
+            sel &= np.array([g[0] == curso for g in self.chaves], dtype=bool)
+        if modalidade != "Todas":
+            sel &= np.array([g[1] == modalidade for g in self.chaves], dtype=bool)
+        return sel
+
+
+def palavras_por_resposta(serie):
+    """
+    Todas as palavras de cada resposta (minúsculas, sem pontuação), na ordem do texto.
+    Devolve uma Series "explodida": uma linha por palavra, com o índice da resposta.
+    """
+    textos = serie.dropna().astype(str).str.lower().str.replace(PADRAO_PONTUACAO, " ", regex=True)
+    return textos.str.split().explode().dropna().astype(object)
+
+
+def tokens_por_resposta(serie, stopwords=STOPWORDS_SME):
+    """Palavras de cada resposta com 4+ letras e sem stopwords (mesmo formato de palavras_por_resposta)."""
+    tokens = palavras_por_resposta(serie)
+    return tokens[(tokens.str.len() >= TAMANHO_MIN_PALAVRA) & ~tokens.isin(stopwords)]
+
+
+def parse_stopwords(texto):
+    """Stopwords digitadas na barra lateral (separadas por vírgula, espaço ou linha)."""
+    return frozenset(p for p in re.split(r"[,;\s]+", (texto or "").lower()) if p)
+
+
+class IndiceTermos:
+    """
+    Índice invertido de uma pergunta aberta, montado de forma incremental (por bloco):
+      - vocabulário: termo → id (palavras e bigramas "palavra1 palavra2")
+      - ocorrências somadas por (grupo, termo): o top-N de qualquer filtro é uma soma
+        sobre os grupos selecionados, sem retokenizar o texto
+      - respostas (opcional): palavras de cada resposta, com Curso e Modalidade
+    As stopwords são aplicadas na consulta, então podem mudar sem reconstruir o índice.
+    """
+
+    def __init__(self, grupos=None, bigramas=True, guardar_respostas=True):
+        self.grupos = grupos if grupos is not None else GruposCursoModalidade()
+        self.bigramas = bigramas
+        self.respostas = [] if guardar_respostas else None
+        self._termos = []
+        self._id_termo = {}
+        self._partes = []                       # (palavra1, palavra2) ou (palavra, None)
+        self._eh_bigrama = np.zeros(0, dtype=bool)
+        self._mascaras = CacheLRU(max_itens=MAX_MASCARAS_STOPWORDS)   # stopwords → termos bloqueados
+        self._grupo = np.zeros(0, dtype=np.int64)
+        self._termo = np.zeros(0, dtype=np.int64)
+        self._qtd = np.zeros(0, dtype=np.int64)
+
+    def _ids(self, termos):
+        novos = pd.unique(termos[~termos.isin(list(self._id_termo))])
+        for termo in novos:
+            self._id_termo[termo] = len(self._termos)
+            self._termos.append(termo)
+            self._partes.append(tuple(termo.split(" ", 1)) if " " in termo else (termo, None))
+        self._eh_bigrama = np.concatenate([self._eh_bigrama, np.char.find(novos.astype(str), " ") >= 0])
+        return termos.map(self._id_termo).to_numpy(dtype=np.int64)
+
+    def adicionar(self, df, coluna, codigos_grupo=None):
+        """Indexa as respostas de df[coluna]; codigos_grupo (por linha de df) se já calculados."""
+        if codigos_grupo is None:
+            codigos_grupo = self.grupos.codigos(df)
+        # todas as palavras, na ordem do texto: os bigramas são vizinhas de verdade
+        palavras = palavras_por_resposta(df[coluna])
+        longa = palavras.str.len().to_numpy(dtype=np.int64) >= TAMANHO_MIN_PALAVRA
+        if not longa.any():
+            return
+        linha = df.index.get_indexer(palavras.index)
+        grupo = codigos_grupo[linha]
+        valores = palavras.to_numpy()
+
+        if self.respostas is not None:
+            # explode mantém as palavras de cada resposta contíguas: basta cortar nas trocas de linha
+            inicios = np.flatnonzero(np.r_[True, linha[1:] != linha[:-1]])
+            fins = np.r_[inicios[1:], len(linha)]
+            lista = valores.tolist()
+            self.respostas.append(pd.DataFrame({
+                "grupo": grupo[inicios],
+                "tokens": [lista[i:f] for i, f in zip(inicios, fins)],
+            }, index=df.index[linha[inicios]]))
+
+        termos, grupos_termo = [pd.Series(valores[longa], dtype=object)], [grupo[longa]]
+        if self.bigramas and len(valores) > 1:
+            # pares de palavras vizinhas na mesma resposta, as duas com 4+ letras
+            # (as stopwords valem para o par na consulta, como para as palavras)
+            par = (linha[1:] == linha[:-1]) & longa[:-1] & longa[1:]
+            bigramas = pd.Series(valores[:-1][par], dtype=object) + " " + pd.Series(valores[1:][par], dtype=object)
+            termos.append(bigramas)
+            grupos_termo.append(grupo[1:][par])
+
+        contagem = pd.DataFrame({
+            "grupo": np.concatenate(grupos_termo),
+            "termo": pd.concat(termos, ignore_index=True).to_numpy(dtype=object),
+        }).value_counts(sort=False)
+        self._grupo = np.concatenate([self._grupo, contagem.index.get_level_values("grupo").to_numpy(dtype=np.int64)])
+        self._termo = np.concatenate([self._termo, self._ids(pd.Series(contagem.index.get_level_values("termo"), dtype=object))])
+        self._qtd = np.concatenate([self._qtd, contagem.to_numpy(dtype=np.int64)])
+        self._compactar()
+
+    def _compactar(self):
+        """Junta linhas repetidas (mesmo grupo e termo) vindas de blocos diferentes."""
+        if len(self._qtd) < 2 * max(len(self._termos), 1):
+            return
+        chave = self._grupo * max(len(self._termos), 1) + self._termo
+        unicas, inverso = np.unique(chave, return_inverse=True)
+        self._qtd = np.bincount(inverso, weights=self._qtd).astype(np.int64)
+        self._grupo, self._termo = np.divmod(unicas, max(len(self._termos), 1))
+
+    def _bloqueados(self, stopwords):
+        """
+        Termos (ids) que contêm alguma stopword. A máscara de cada conjunto de stopwords é
+        guardada e, se o vocabulário cresceu, só os termos novos são conferidos.
+        """
+        if not stopwords:
+            return np.zeros(len(self._termos), dtype=bool)
+        stopwords = frozenset(stopwords)
+        mascara = self._mascaras.get(stopwords, np.zeros(0, dtype=bool))
+        if len(mascara) < len(self._termos):
+            partes = pd.DataFrame(self._partes[len(mascara):], columns=["p1", "p2"])
+            novos = (partes["p1"].isin(stopwords) | partes["p2"].isin(stopwords)).to_numpy()
+            mascara = np.concatenate([mascara, novos])
+            self._mascaras.put(stopwords, mascara)
+        return mascara
+
+    def termos_frequentes(self, sel=None, n=20, stopwords=STOPWORDS_SME, bigramas=False):
+        """Top-n termos nos grupos selecionados (sel: máscara de grupos; None = todos)."""
+        usar = np.ones(len(self._qtd), dtype=bool) if sel is None else np.asarray(sel)[self._grupo]
+        total = np.bincount(self._termo[usar], weights=self._qtd[usar], minlength=len(self._termos))
+        total[self._bloqueados(stopwords) | (self._eh_bigrama != bigramas)] = 0
+        ordem = np.argsort(-total, kind="stable")[:n]
+        ordem = ordem[total[ordem] > 0]
+        return pd.Series(total[ordem].astype(np.int64), index=[self._termos[i] for i in ordem], dtype=np.int64)
+
+    def respostas_com(self, termo, sel=None):
+        """Índices (linhas do arquivo) das respostas que contêm o termo (palavra ou bigrama)."""
+        if not self.respostas:
+            return pd.Index([])
+        tabela = pd.concat(self.respostas) if len(self.respostas) > 1 else self.respostas[0]
+        if sel is not None:
+            tabela = tabela[np.asarray(sel)[tabela["grupo"].to_numpy()]]
+        partes = termo.split(" ")
+        def contem(tokens):
+            return any(tokens[i:i + len(partes)] == partes for i in range(len(tokens) - len(partes) + 1))
+        return tabela.index[tabela["tokens"].map(contem).to_numpy(dtype=bool)]
+
+
+_cache_indices = CacheLRU(max_itens=16)
+
+
+def indice_termos_cacheado(chave_arquivo, sheet_name, df, coluna):
+    """IndiceTermos de uma pergunta aberta, montado uma vez por (arquivo, aba, coluna)."""
+    chave = (chave_arquivo, sheet_name, coluna)
+    indice = _cache_indices.get(chave)
+    if indice is None:
+        indice = IndiceTermos()
+        indice.adicionar(df, coluna)
+        _cache_indices.put(chave, indice)
+    return indice
+
+
+# -----------------------------
+# Cubo de contagens (Curso × Modalidade × pergunta × nota)
+# -----------------------------
+class CuboNotas:
+    """
+    Contagens das notas 1–5 por (grupo, pergunta, nota), com grupo = (Curso, Modalidade)
+    de GruposCursoModalidade. Montado uma vez por upload (ou somado bloco a bloco):
+    filtros, distribuições empilhadas, médias ponderadas e o índice agregado saem de
+    fatias e somas desse array pequeno, sem voltar às respostas.
+    """
+
+    def __init__(self, perguntas_numericas, grupos=None):
+        self.perguntas_numericas = list(perguntas_numericas)
+        self.grupos = grupos if grupos is not None else GruposCursoModalidade()
+        self._linha_pergunta = {col: i for i, col in enumerate(self.perguntas_numericas)}
+        self.contagens = np.zeros((0, len(self.perguntas_numericas), len(NOTAS)), dtype=np.int64)
+        self.n_linhas = np.zeros(0, dtype=np.int64)
+
+    # ---- montagem ----
+    def _crescer(self):
+        """Abre espaço nos arrays para grupos que apareceram nas últimas linhas."""
+        novos = len(self.grupos) - len(self.n_linhas)
+        if novos > 0:
+            self.contagens = np.concatenate(
+                [self.contagens, np.zeros((novos,) + self.contagens.shape[1:], dtype=np.int64)]
             )
-    if titulo:
-        ax.set_title(titulo)
+            self.n_linhas = np.append(self.n_linhas, np.zeros(novos, dtype=np.int64))
+
+    def adicionar(self, df, matriz=None):
+        """
+        Soma as linhas de df ao cubo e devolve o código de grupo de cada linha.
+        matriz: notas já parseadas (montar_matriz_notas(df, perguntas)), se houver.
+        """
+        grupos = self.grupos.codigos(df)
+        self._crescer()
+        n_perguntas = len(self.perguntas_numericas)
+        if n_perguntas and len(df):
+            if matriz is None:
+                matriz = montar_matriz_notas(df, self.perguntas_numericas)
+            perg, linhas = np.nonzero(matriz)
+            pos = (grupos[linhas] * n_perguntas + perg) * len(NOTAS) + matriz[perg, linhas] - 1
+            self.contagens += np.bincount(pos, minlength=self.contagens.size).reshape(self.contagens.shape)
+        self.n_linhas += np.bincount(grupos, minlength=len(self.grupos))
+        return grupos
+
+    # ---- consultas ----
+    def valores(self, coluna):
+        return self.grupos.valores(coluna)
+
+    def selecionar(self, curso="Todos", modalidade="Todas"):
+        return self.grupos.selecionar(curso, modalidade)
+
+    def n_respostas(self, sel):
+        return int(self.n_linhas[sel].sum())
+
+    def resumo(self, sel):
+        """Mesmo dicionário de resumo_notas ('Média'/'N' por pergunta) para os grupos em sel."""
+        return resumo_de_contagens(self.contagens[sel].sum(axis=0), self.perguntas_numericas)
+
+    def indice_agregado(self, sel):
+        """Média geral ponderada pelo nº de notas de cada pergunta (None se não houver notas)."""
+        cont = self.contagens[sel].sum(axis=(0, 1))
+        return float(cont @ np.array(NOTAS)) / cont.sum() if cont.sum() else None
+
+    def contagem(self, col, sel):
+        """Contagem 1–5 de uma pergunta → Series indexada por NOTAS."""
+        return pd.Series(self.contagens[sel, self._linha_pergunta[col]].sum(axis=0), index=NOTAS)
+
+    def _contagens_por(self, col, colunas_grupo, sel):
+        """Contagens 1–5 da pergunta somadas por combinação de 'colunas_grupo' (só combinações com nota)."""
+        p = [COLUNAS_GRUPO.index(c) for c in colunas_grupo]
+        i = self._linha_pergunta[col]
+        tabela = {}
+        for g in np.flatnonzero(sel):
+            chave = tuple(self.grupos.chaves[g][j] for j in p)
+            tabela[chave] = tabela.get(chave, 0) + self.contagens[g, i]
+        return {chave: cont for chave, cont in tabela.items() if cont.sum() > 0}
+
+    def distribuicao(self, col, coluna_grupo, sel):
+        """Mesma tabela de distribuicao_por_grupo (grupo × nota), a partir das contagens."""
+        tabela = {k[0]: v for k, v in self._contagens_por(col, [coluna_grupo], sel).items() if k[0] is not None}
+        rotulos = sorted(tabela, key=str)
+        tb = pd.DataFrame([tabela[r] for r in rotulos], columns=NOTAS, dtype=np.int64,
+                          index=pd.Index(rotulos, name=coluna_grupo))
+        tb.columns.name = "rating"
+        return tb
+
+    def media(self, col, colunas_grupo, sel):
+        """
+        Mesma série de media_por_grupo (média por combinação de grupos), a partir das contagens.
+        Curso/Modalidade vazio continua como grupo próprio, rotulado "nan" (como no astype(str)).
+        """
+        tabela = self._contagens_por(col, colunas_grupo, sel)
+        rotulos = [tuple("nan" if v is None else str(v) for v in k) for k in tabela]
+        medias = [float(cont @ np.array(NOTAS)) / cont.sum() for cont in tabela.values()]
+        if len(colunas_grupo) == 1:
+            indice = pd.Index([r[0] for r in rotulos], name=colunas_grupo[0])
+        else:
+            indice = pd.MultiIndex.from_tuples(rotulos, names=list(colunas_grupo))
+        return pd.Series(medias, index=indice, name="rating", dtype=float).sort_values(ascending=False)
 
 
-def inserir_figura_no_doc(doc, fig, titulo):
-    doc.add_heading(str(titulo), level=2)
+_cache_cubos = CacheLRU(max_itens=16)
+
+
+def cubo_notas_cacheado(chave_arquivo, sheet_name, perguntas, df, matriz):
+    """CuboNotas do arquivo/aba, montado uma vez a partir da matriz de notas já parseada."""
+    chave = (chave_arquivo, sheet_name, tuple(perguntas))
+    cubo = _cache_cubos.get(chave)
+    if cubo is None:
+        cubo = CuboNotas(perguntas)
+        cubo.adicionar(df, matriz)
+        _cache_cubos.put(chave, cubo)
+    return cubo
+
+
+# -----------------------------
+# Leitura em blocos (CSV grande)
+# -----------------------------
+TAMANHO_BLOCO_CSV = 50_000    # linhas por bloco
+TAMANHO_AMOSTRA_CSV = 200     # linhas guardadas para a prévia e para as respostas abertas
+LIMITE_MB_BLOCOS = 50         # acima disso o CSV é lido em blocos por padrão
+
+_cache_resumos = CacheLRU(max_itens=4)
+
+
+class ResumoEmBlocos(CuboNotas):
+    """
+    Agregados de um CSV lido em blocos, sem manter as linhas em memória:
+      - o cubo de notas (CuboNotas) e o nº de respostas por grupo
+      - n_abertas: nº de respostas de cada pergunta aberta por grupo
+      - termos: IndiceTermos por pergunta aberta (contagens por grupo, sem as respostas)
+      - amostra: até 'tamanho_amostra' linhas sorteadas uniformemente (prévia)
+    """
+
+    def __init__(self, colunas, meta_cols, perguntas_numericas, perguntas_abertas,
+                 tamanho_amostra=TAMANHO_AMOSTRA_CSV, semente=0):
+        super().__init__(perguntas_numericas)
+        self.colunas = list(colunas)
+        self.meta_cols = list(meta_cols)
+        self.perguntas_abertas = list(perguntas_abertas)
+        self.tamanho_amostra = tamanho_amostra
+        self.total_linhas = 0
+
+        self.n_abertas = {col: np.zeros(0, dtype=np.int64) for col in self.perguntas_abertas}
+        self.termos = {col: IndiceTermos(self.grupos, guardar_respostas=False) for col in self.perguntas_abertas}
+
+        self._rng = np.random.default_rng(semente)
+        self._amostra = None
+        self._sorteio_amostra = np.empty(0)
+
+    # ---- acumulação ----
+    def _crescer(self):
+        super()._crescer()
+        for col, n in self.n_abertas.items():
+            if len(n) < len(self.grupos):
+                self.n_abertas[col] = np.append(n, np.zeros(len(self.grupos) - len(n), dtype=np.int64))
+
+    def adicionar_bloco(self, bloco):
+        """Soma um bloco (já passado por preparar_dataframe) aos agregados."""
+        if bloco.empty:
+            return
+        grupos = self.adicionar(bloco)
+
+        for col in self.perguntas_abertas:
+            if col not in bloco.columns:
+                continue
+            respondidas = bloco[col].notna().to_numpy()
+            self.n_abertas[col] += np.bincount(grupos[respondidas], minlength=len(self.grupos))
+            self.termos[col].adicionar(bloco, col, codigos_grupo=grupos)
+
+        self._atualizar_amostra(bloco)
+        self.total_linhas += len(bloco)
+
+    def _atualizar_amostra(self, bloco):
+        """Amostra uniforme: cada linha recebe um sorteio e ficam as k de menor sorteio."""
+        k = self.tamanho_amostra
+        sorteio = self._rng.random(len(bloco))
+        if len(bloco) > k:
+            escolhidas = np.argpartition(sorteio, k)[:k]
+            bloco, sorteio = bloco.iloc[escolhidas], sorteio[escolhidas]
+        if self._amostra is not None:
+            bloco = pd.concat([self._amostra, bloco])
+            sorteio = np.concatenate([self._sorteio_amostra, sorteio])
+            if len(bloco) > k:
+                ficam = np.argpartition(sorteio, k)[:k]
+                bloco, sorteio = bloco.iloc[ficam], sorteio[ficam]
+        self._amostra, self._sorteio_amostra = bloco, sorteio
+
+    # ---- consultas ----
+    def tem_coluna(self, coluna):
+        return coluna in self.colunas
+
+    def termos_frequentes(self, col, sel, n=20, stopwords=STOPWORDS_SME, bigramas=False):
+        return self.termos[col].termos_frequentes(sel, n=n, stopwords=stopwords, bigramas=bigramas)
+
+    def n_respostas_abertas(self, col, sel):
+        return int(self.n_abertas[col][sel].sum())
+
+    def amostra(self, sel=None):
+        """Linhas sorteadas, na ordem do arquivo (opcionalmente só dos grupos selecionados)."""
+        if self._amostra is None:
+            return pd.DataFrame(columns=self.colunas)
+        amostra = self._amostra.sort_index()
+        if sel is not None and not sel.all():
+            amostra = amostra[sel[self.grupos.codigos(amostra)]]
+        return amostra
+
+
+def _separador_csv(arquivo):
+    """';' se a linha de cabeçalho tiver mais ';' do que ',' (exportação PT-BR do Excel)."""
+    inicio = arquivo.tell()
+    cabecalho = arquivo.readline()
+    arquivo.seek(inicio)
+    if isinstance(cabecalho, bytes):
+        cabecalho = cabecalho.decode("utf-8", errors="ignore")
+    return ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+
+
+def ler_csv_em_blocos(arquivo, tamanho_bloco=TAMANHO_BLOCO_CSV, tamanho_amostra=TAMANHO_AMOSTRA_CSV,
+                      ao_progredir=None):
+    """
+    Lê um CSV (caminho ou arquivo binário) em blocos de 'tamanho_bloco' linhas e
+    devolve um ResumoEmBlocos. As colunas são detectadas no primeiro bloco.
+    ao_progredir(bytes_lidos), se dado, é chamado após cada bloco.
+    Retorna None se o arquivo não tiver linhas.
+    """
+    if isinstance(arquivo, (str, os.PathLike)):
+        with open(arquivo, "rb") as f:
+            return ler_csv_em_blocos(f, tamanho_bloco, tamanho_amostra, ao_progredir)
+
+    resumo = None
+    with pd.read_csv(arquivo, sep=_separador_csv(arquivo), chunksize=tamanho_bloco) as leitor:
+        for bloco in leitor:
+            bloco = preparar_dataframe(bloco)
+            if resumo is None:
+                meta_cols, perguntas_numericas, perguntas_abertas = detectar_colunas(bloco)
+                resumo = ResumoEmBlocos(bloco.columns, meta_cols, perguntas_numericas, perguntas_abertas,
+                                        tamanho_amostra=tamanho_amostra)
+            resumo.adicionar_bloco(bloco)
+            if ao_progredir:
+                ao_progredir(arquivo.tell())
+    return resumo
+
+
+def carregar_csv_em_blocos(arquivo, tamanho_arquivo):
+    """ResumoEmBlocos do arquivo enviado, calculado uma vez por conteúdo (com barra de progresso)."""
+    chave = hash_arquivo(arquivo)
+    resumo = _cache_resumos.get(chave)
+    if resumo is None:
+        barra = st.progress(0.0, text="Lendo CSV em blocos…")
+
+        def ao_progredir(lidos):
+            barra.progress(min(lidos / max(tamanho_arquivo, 1), 1.0), text="Lendo CSV em blocos…")
+
+        arquivo.seek(0)
+        resumo = ler_csv_em_blocos(arquivo, ao_progredir=ao_progredir)
+        barra.empty()
+        if resumo is not None:
+            _cache_resumos.put(chave, resumo)
+    return resumo
+
+
+def figura_para_png(fig, fechar=True):
+    """Renderiza a figura uma única vez em PNG (o mesmo bytes serve à tela e ao DOCX)."""
     img_buffer = io.BytesIO()
-    fig.savefig(img_buffer, format='png', bbox_inches='tight')
-    img_buffer.seek(0)  # IMPORTANTE
-    doc.add_picture(img_buffer, width=Inches(6))  # ~80% da página A4
+    fig.savefig(img_buffer, format='png', bbox_inches='tight', dpi=DPI_GRAFICOS)
+    if fechar:
+        plt.close(fig)
+    return img_buffer.getvalue()
+
+
+def inserir_png_no_doc(doc, png, titulo):
+    doc.add_heading(str(titulo), level=2)
+    doc.add_picture(io.BytesIO(png), width=Inches(6))  # ~80% da página A4
+
+
+def inserir_figura_no_doc(doc, fig, titulo):
+    inserir_png_no_doc(doc, figura_para_png(fig, fechar=False), titulo)
+
+
+def mostrar_png(png, titulo, figuras_relatorio):
+    """Mostra o gráfico na tela e guarda o PNG (título, bytes) para o relatório."""
+    st.image(png)
+    figuras_relatorio.append((str(titulo), png))
+
+
+# -----------------------------
+# Relatório DOCX (sob demanda, em segundo plano)
+# -----------------------------
+_executor_relatorios = ThreadPoolExecutor(max_workers=2, thread_name_prefix="relatorio_sme")
+INTERVALO_VERIFICAR_RELATORIO = 1.0   # segundos entre as consultas da barra lateral ao relatório em preparo
+
+
+def gerar_docx_relatorio(titulo_doc, figuras):
+    """Monta e serializa o .docx a partir de PNGs já renderizados; retorna os bytes."""
+    doc = Document()
+    doc.add_heading(titulo_doc, level=1)
+    for titulo, png in figuras:
+        inserir_png_no_doc(doc, png, titulo)
+    doc_buffer = io.BytesIO()
+    doc.save(doc_buffer)
+    return doc_buffer.getvalue()
+
+
+def _chave_relatorio(titulo_doc, figuras):
+    partes = [titulo_doc.encode("utf-8")]
+    for titulo, png in figuras:
+        partes.append(titulo.encode("utf-8"))
+        partes.append(hash_bytes(png).encode("ascii"))
+    return hash_bytes(b"\x00".join(partes))
+
+
+@st.fragment(run_every=INTERVALO_VERIFICAR_RELATORIO)
+def _aguardar_relatorio():
+    """Aviso de relatório em preparação; quando fica pronto, recarrega a página para mostrar o download."""
+    pedido = st.session_state.get("sme_relatorio")
+    if pedido is None or pedido["futuro"].done():
+        st.rerun()
+    st.info("⏳ Relatório em preparação…")
+
+
+def painel_relatorio(titulo_doc, figuras):
+    """
+    Barra lateral do relatório: o DOCX só é gerado quando pedido, numa thread,
+    e fica na sessão enquanto o conteúdo (título + gráficos) não mudar. Enquanto
+    ele é preparado, a barra lateral confere sozinha se já terminou.
+    """
+    st.sidebar.markdown("---")
+    if not figuras:
+        st.sidebar.caption("Selecione perguntas para gerar o relatório.")
+        return
+
+    chave = _chave_relatorio(titulo_doc, figuras)
+    pedido = st.session_state.get("sme_relatorio")
+    if pedido is not None and pedido["chave"] != chave:
+        pedido = None  # filtros/gráficos mudaram: relatório anterior não vale mais
+
+    if pedido is None:
+        if st.sidebar.button("📄 Gerar relatório (DOCX)"):
+            futuro = _executor_relatorios.submit(gerar_docx_relatorio, titulo_doc, list(figuras))
+            pedido = {"chave": chave, "futuro": futuro}
+            st.session_state["sme_relatorio"] = pedido
+        else:
+            return
+
+    futuro = pedido["futuro"]
+    if not futuro.done():
+        with st.sidebar:
+            _aguardar_relatorio()
+        return
+
+    try:
+        docx_bytes = futuro.result()
+    except Exception as e:
+        st.session_state.pop("sme_relatorio", None)
+        st.sidebar.error(f"Erro ao gerar o relatório: {e}")
+        return
+
+    st.sidebar.download_button(
+        "📥 Baixar relatório (DOCX)",
+        docx_bytes,
+        file_name="Relatorio_Avaliacao.docx",
+        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    )
 
 
 def run_sme_mode():
@@ -250,50 +1141,77 @@ def run_sme_mode():
 
     if uploaded:
         filename = uploaded.name.lower()
-        if filename.endswith(".xlsx"):
-            # permite escolher a aba
+        resumo_blocos = None
+        if filename.endswith(".csv") and st.sidebar.checkbox(
+            "Ler CSV em blocos (arquivos grandes)",
+            value=uploaded.size >= LIMITE_MB_BLOCOS * 1024 * 1024,
+            help="Lê o CSV aos poucos e guarda só as contagens e uma amostra de linhas."
+        ):
             try:
-                xls = pd.ExcelFile(uploaded)
-                sheet_name = st.sidebar.selectbox("Aba da planilha", xls.sheet_names, index=0)
-                df = pd.read_excel(xls, sheet_name=sheet_name)
+                resumo_blocos = carregar_csv_em_blocos(uploaded, uploaded.size)
             except Exception as e:
-                st.error(f"Erro ao ler XLSX: {e}")
+                st.error(f"Erro ao ler CSV: {e}")
                 return
+            if resumo_blocos is None:
+                st.warning("Não foi possível carregar dados.")
+                return
+            colunas = resumo_blocos.colunas
+            meta_cols = resumo_blocos.meta_cols
+            perguntas_numericas = resumo_blocos.perguntas_numericas
+            perguntas_abertas = resumo_blocos.perguntas_abertas
+
+            with st.expander(f"🔎 Prévia dos dados (amostra de {len(resumo_blocos.amostra())} "
+                             f"de {resumo_blocos.total_linhas} linhas)"):
+                st.dataframe(resumo_blocos.amostra(), use_container_width=True)
         else:
-            # CSV
-            try:
-                # tenta detectar sep padrão; ajuste se necessário
-                df = pd.read_csv(uploaded)
-            except Exception:
-                uploaded.seek(0)
-                df = pd.read_csv(uploaded, sep=";")
+            conteudo = uploaded.getvalue()
+            chave_arquivo = hash_bytes(conteudo)
+            if filename.endswith(".xlsx"):
+                # permite escolher a aba
+                try:
+                    abas = listar_abas(conteudo, chave_arquivo)
+                    sheet_name = st.sidebar.selectbox("Aba da planilha", abas, index=0)
+                    df = carregar_planilha(conteudo, filename, sheet_name, chave_arquivo)
+                except Exception as e:
+                    st.error(f"Erro ao ler XLSX: {e}")
+                    return
+            else:
+                # CSV (cache por conteúdo; ver carregar_planilha)
+                df = carregar_planilha(conteudo, filename, None, chave_arquivo)
 
-        if df is None or df.empty:
-            st.warning("Não foi possível carregar dados.")
-            return
+            if df is None or df.empty:
+                st.warning("Não foi possível carregar dados.")
+                return
+            colunas = list(df.columns)
 
-        df = preparar_dataframe(df)
+            # mostra amostra
+            with st.expander("🔎 Prévia dos dados (primeiras linhas)"):
+                st.dataframe(df.head(10), use_container_width=True)
 
-        # mostra amostra
-        with st.expander("🔎 Prévia dos dados (primeiras linhas)"):
-            st.dataframe(df.head(10), use_container_width=True)
+            # detectar colunas
+            meta_cols, perguntas_numericas, perguntas_abertas = detectar_colunas(df)
 
-        # detectar colunas
-        meta_cols, perguntas_numericas, perguntas_abertas = detectar_colunas(df)
+            # notas 1–5 parseadas uma única vez por arquivo/aba (perguntas × respostas)
+            # e somadas no cubo (Curso × Modalidade × pergunta × nota)
+            matriz = matriz_notas_cacheada(chave_arquivo, sheet_name, tuple(perguntas_numericas), df)
+            cubo = cubo_notas_cacheado(chave_arquivo, sheet_name, perguntas_numericas, df, matriz)
+
+        if resumo_blocos is not None:
+            cubo = resumo_blocos
 
         # filtros
         st.sidebar.header("🎛️ Filtros")
-        curso_col = "Curso" if "Curso" in df.columns else None
-        modalidade_col = "Modalidade" if "Modalidade" in df.columns else None
+        curso_col = "Curso" if "Curso" in colunas else None
+        modalidade_col = "Modalidade" if "Modalidade" in colunas else None
 
         if curso_col:
-            cursos = ["Todos"] + sorted([c for c in df[curso_col].dropna().unique()])
+            cursos = ["Todos"] + cubo.valores(curso_col)
             curso_filtro = st.sidebar.selectbox("Curso", cursos, index=0)
         else:
             curso_filtro = "Todos"
 
         if modalidade_col:
-            modalidades = ["Todas"] + sorted([c for c in df[modalidade_col].dropna().unique()])
+            modalidades = ["Todas"] + cubo.valores(modalidade_col)
             modalidade_filtro = st.sidebar.selectbox("Modalidade", modalidades, index=0)
         else:
             modalidade_filtro = "Todas"
@@ -301,15 +1219,41 @@ def run_sme_mode():
         if st.sidebar.button("🔄 Recarregar"):
             st.rerun()
 
-        # aplica filtros
-        df_filtrado = df.copy()
-        if curso_col and curso_filtro != "Todos":
-            df_filtrado = df_filtrado[df_filtrado[curso_col] == curso_filtro]
-        if modalidade_col and modalidade_filtro != "Todas":
-            df_filtrado = df_filtrado[df_filtrado[modalidade_col] == modalidade_filtro]
+        # filtros = máscara sobre os grupos do cubo (notas, distribuições e médias saem dele)
+        sel = cubo.selecionar(curso_filtro, modalidade_filtro)
+        n_filtrado = cubo.n_respostas(sel)
+
+        # perguntas abertas: índice de termos (e as respostas em si, para a tabela)
+        if resumo_blocos is not None:
+            def respostas_de(col):
+                amostra = resumo_blocos.amostra(sel)[col].dropna().astype(str)
+                return amostra, resumo_blocos.n_respostas_abertas(col, sel)
+
+            def termos_de(col, bigramas=False):
+                return resumo_blocos.termos_frequentes(col, sel, stopwords=stopwords, bigramas=bigramas)
+
+            respostas_com_de = None  # em blocos o índice não guarda as respostas
+        else:
+            def respostas_de(col):
+                mascara = np.ones(len(df), dtype=bool)
+                if curso_col and curso_filtro != "Todos":
+                    mascara &= (df[curso_col] == curso_filtro).to_numpy()
+                if modalidade_col and modalidade_filtro != "Todas":
+                    mascara &= (df[modalidade_col] == modalidade_filtro).to_numpy()
+                serie_txt = df.loc[mascara, col].dropna().astype(str)
+                return serie_txt, len(serie_txt)
+
+            def termos_de(col, bigramas=False):
+                # índice montado uma vez por upload; o filtro vira uma soma sobre os grupos
+                indice = indice_termos_cacheado(chave_arquivo, sheet_name, df, col)
+                sel_termos = indice.grupos.selecionar(curso_filtro, modalidade_filtro)
+                return indice.termos_frequentes(sel_termos, stopwords=stopwords, bigramas=bigramas)
+
+            def respostas_com_de(col, termo):
+                return indice_termos_cacheado(chave_arquivo, sheet_name, df, col).respostas_com(termo)
 
         st.sidebar.markdown("---")
-        st.sidebar.write(f"📊 Total de respostas (filtro aplicado): **{len(df_filtrado)}**")
+        st.sidebar.write(f"📊 Total de respostas (filtro aplicado): **{n_filtrado}**")
 
         # seleção de perguntas
         st.sidebar.header("📝 Perguntas")
@@ -327,154 +1271,126 @@ def run_sme_mode():
         # tipo de gráfico para perguntas numéricas
         tipo_grafico = st.sidebar.selectbox("Gráfico para perguntas 1–5", ["Barras", "Pizza"], index=0)
 
+        # palavras das perguntas abertas
+        stopwords, mostrar_bigramas = STOPWORDS_SME, False
+        if perguntas_abertas:
+            st.sidebar.header("💬 Perguntas abertas")
+            stopwords = parse_stopwords(st.sidebar.text_area(
+                "Palavras ignoradas", value=", ".join(sorted(STOPWORDS_SME)),
+                help="Separe por vírgula. Palavras com menos de 4 letras já são ignoradas."
+            ))
+            mostrar_bigramas = st.sidebar.checkbox("Mostrar pares de palavras (bigramas)", value=False)
+
         # agrupar por (opcional)
         st.sidebar.header("📚 Agrupamento")
         group_by = st.sidebar.multiselect(
             "Agrupar por",
-            options=[c for c in ["Curso", "Modalidade"] if c in df_filtrado.columns],
+            options=[c for c in ["Curso", "Modalidade"] if c in colunas],
             default=[]
         )
 
         # sliders de tamanho
         largura = st.sidebar.slider("Largura do gráfico (inches aprox.)", 4, 14, 7)
         altura = st.sidebar.slider("Altura do gráfico (inches aprox.)", 3, 8, 4)
+        workers_graficos = st.sidebar.number_input(
+            "Processos para gerar gráficos", min_value=1, max_value=max(os.cpu_count() or 1, 1),
+            value=min(WORKERS_GRAFICOS, max(os.cpu_count() or 1, 1)), step=1,
+            help="Com muitas perguntas, os gráficos são desenhados em paralelo."
+        )
 
-        # DOCX
-        doc = Document()
+        # relatório: título + PNGs dos gráficos mostrados (o DOCX só é montado sob demanda)
+        figuras_relatorio = []
         titulo_doc = f"Relatório de Avaliação - {curso_filtro if curso_filtro!='Todos' else 'Todos os cursos'}"
         if modalidade_col and modalidade_filtro != "Todas":
             titulo_doc += f" | Modalidade: {modalidade_filtro}"
-        doc.add_heading(titulo_doc, level=1)
 
         # ======= RESUMO GERAL (só notas) =======
         if perguntas_numericas:
             st.header("📈 Resumo Geral (médias 1–5)")
-            resumo = {}
-            for col in perguntas_numericas:
-                ratings = df_filtrado[col].apply(parse_rating_cell)
-                serie = pd.Series([r for r in ratings if r is not None])
-                if len(serie) > 0:
-                    resumo[col] = {
-                        "Média": round(serie.mean(), 2),
-                        "N": int(serie.count())
-                    }
+            resumo = cubo.resumo(sel)
             if resumo:
                 df_resumo = pd.DataFrame(resumo).T.sort_values("Média", ascending=False)
                 st.dataframe(df_resumo, use_container_width=True)
-                # índice agregado (média de médias ponderada por N)
-                if not df_resumo.empty:
-                    agg = (df_resumo["Média"] * df_resumo["N"]).sum() / max(df_resumo["N"].sum(), 1)
+                # índice agregado (média de médias ponderada por N = soma de todas as notas / nº de notas)
+                agg = cubo.indice_agregado(sel)
+                if agg is not None:
                     st.success(f"⭐ **Índice agregado (média geral ponderada)**: {agg:.2f} / 5")
             else:
                 st.info("Não foi possível calcular médias. Verifique as colunas numéricas.")
 
         # ======= LOOP DAS PERGUNTAS ESCOLHIDAS =======
+        # 1) monta o roteiro da página (textos, tabelas e pedidos de gráfico, em ordem)
+        roteiro, jobs = [], []
+
+        def pedir_grafico(titulo, tipo, dados, opcoes=None):
+            roteiro.append(("grafico", titulo, len(jobs)))
+            jobs.append((tipo, dados, largura, altura, opcoes))
+
         for col in perguntas_escolhidas:
-            st.subheader(col)
+            roteiro.append(("subheader", col))
 
             if col in perguntas_numericas:
-                # distribuições 1–5
-                serie = df_filtrado[col].apply(parse_rating_cell)
-                serie = serie.dropna().astype(int)
-                # garante presença de 1..5 mesmo sem respostas
-                contagem = serie.value_counts().reindex([1,2,3,4,5], fill_value=0)
+                # distribuições 1–5 (já filtradas)
+                contagem = cubo.contagem(col, sel)
 
                 if group_by:
                     # gráfico por grupo (barras empilhadas simples por categoria)
                     for g in group_by:
-                        st.markdown(f"**Distribuição por {g}**")
-                        fig, ax = plt.subplots(figsize=(largura, altura))
+                        roteiro.append(("markdown", f"**Distribuição por {g}**"))
                         # tabela p/ cada categoria de g
-                        tmp = df_filtrado[[g, col]].copy()
-                        tmp["rating"] = tmp[col].apply(parse_rating_cell)
-                        tmp = tmp.dropna(subset=["rating"])
-                        tb = (tmp.pivot_table(index=g, columns="rating", values=col, aggfunc="count", fill_value=0)
-                                  .reindex(columns=[1,2,3,4,5], fill_value=0))
-                        tb.plot(kind="bar", stacked=True, ax=ax, color=[PALETA_RATING[k] for k in [1,2,3,4,5]])
-                        ax.set_xlabel("")
-                        ax.set_ylabel("Quantidade")
-                        ax.set_xticklabels([quebrar_rotulo(str(x)) for x in tb.index], ha="center")
-                        ax.legend(title="Nota", bbox_to_anchor=(1.01, 1), loc="upper left")
-                        st.pyplot(fig, use_container_width=True)
-                        inserir_figura_no_doc(doc, fig, f"{col} — Distribuição por {g}")
+                        tb = cubo.distribuicao(col, g, sel)
+                        pedir_grafico(f"{col} — Distribuição por {g}", "sme_grupo", tb)
 
                 # gráfico principal da pergunta
-                fig, ax = plt.subplots(figsize=(largura, altura))
-                if tipo_grafico == "Barras":
-                    grafico_barras_contagem(contagem.index.tolist(), contagem.values.tolist(), ax,
-                                            titulo="Distribuição de notas", paleta=PALETA_RATING)
-                else:
-                    # Pizza
-                    vals = contagem.values.tolist()
-                    labels = contagem.index.tolist()
-                    colors = [PALETA_RATING.get(k, "#999999") for k in labels]
-                    ax.pie(vals, labels=labels, autopct='%1.1f%%', startangle=140, colors=colors)
-                    ax.set_title("Distribuição de notas")
-                st.pyplot(fig, use_container_width=True)
-                inserir_figura_no_doc(doc, fig, f"{col} — Distribuição geral")
+                pedir_grafico(f"{col} — Distribuição geral", "sme_distribuicao", contagem, tipo_grafico)
 
                 # média por grupo (se houver)
                 if group_by:
-                    fig, ax = plt.subplots(figsize=(largura, altura))
-                    tmp = df_filtrado[group_by + [col]].copy()
-                    for g in group_by:
-                        tmp[g] = tmp[g].astype(str)
-                    tmp["rating"] = tmp[col].apply(parse_rating_cell)
-                    tmp = tmp.dropna(subset=["rating"])
                     # média por combinação de grupos selecionados
-                    med = tmp.groupby(group_by)["rating"].mean().sort_values(ascending=False)
-                    sns.barplot(x=med.index.astype(str), y=med.values, ax=ax)
-                    ax.set_xlabel("")
-                    ax.set_ylabel("Média (1–5)")
-                    ax.set_xticklabels([quebrar_rotulo(str(x)) for x in med.index], ha="center")
-                    for p in ax.patches:
-                        ax.annotate(
-                            f"{p.get_height():.2f}",
-                            (p.get_x() + p.get_width()/2, p.get_height()),
-                            ha="center", va="center", size=10, xytext=(0, 8), textcoords="offset points"
-                        )
-                    ax.set_title("Média por grupo")
-                    st.pyplot(fig, use_container_width=True)
-                    inserir_figura_no_doc(doc, fig, f"{col} — Média por grupo")
+                    med = cubo.media(col, group_by, sel)
+                    pedir_grafico(f"{col} — Média por grupo", "sme_media_grupo", med)
 
             elif col in perguntas_abertas:
                 # texto livre: mostra amostra e top palavras (contagem simples)
-                serie_txt = df_filtrado[col].dropna().astype(str)
-                st.write(f"Respostas (N={len(serie_txt)}):")
-                st.dataframe(serie_txt.to_frame(col), use_container_width=True)
-
-                # contagem simples de palavras (exclui muito curtas)
-                todas = " ".join(serie_txt.tolist()).lower()
-                # remove pontuação básica
-                todas = re.sub(r"[.,;:!?/()\"'“”·\-—–_]", " ", todas)
-                tokens = [t for t in todas.split() if len(t) >= 4]
-                # stopwords básicas PT (enxuta; ajuste/importe NLTK se quiser algo melhor)
-                stop = {
-                    "para","como","isso","essa","esse","esta","este","aquele","aquela","aqui","ali","tudo",
-                    "muito","também","pois","onde","quando","então","porque","pela","pelo","pela","pelos",
-                    "sobre","entre","apesar","com","sem","mais","menos","cada","todos","todas","foram",
-                    "curso","aulas","professor","instrutor","facilitador","palestrante"  # ajuste se quiser manter
-                }
-                tokens = [t for t in tokens if t not in stop]
-                cont = pd.Series(tokens).value_counts().head(20)
+                serie_txt, n_txt = respostas_de(col)
+                if len(serie_txt) < n_txt:
+                    roteiro.append(("write", f"Respostas (N={n_txt}; amostra de {len(serie_txt)}):"))
+                else:
+                    roteiro.append(("write", f"Respostas (N={n_txt}):"))
+                # top palavras (exclui muito curtas e stopwords), vindas do índice de termos
+                cont = termos_de(col)
+                roteiro.append(("respostas", col, serie_txt, cont.index.tolist()))
 
                 if not cont.empty:
-                    fig, ax = plt.subplots(figsize=(largura, altura))
-                    grafico_barras_contagem(cont.index.tolist(), cont.values.tolist(), ax, titulo="Palavras mais frequentes")
-                    st.pyplot(fig, use_container_width=True)
-                    inserir_figura_no_doc(doc, fig, f"{col} — Palavras mais frequentes")
+                    pedir_grafico(f"{col} — Palavras mais frequentes", "sme_palavras", cont)
+                if mostrar_bigramas:
+                    pares = termos_de(col, bigramas=True)
+                    if not pares.empty:
+                        pedir_grafico(f"{col} — Pares de palavras mais frequentes", "sme_palavras", pares,
+                                      "Pares de palavras mais frequentes")
+
+        # 2) renderiza todos os gráficos de uma vez (cache + pool de processos), na ordem pedida
+        with st.spinner("Gerando gráficos..."):
+            pngs = renderizar_em_lote(jobs, workers=workers_graficos)
+
+        # 3) desenha a página seguindo o roteiro
+        for item in roteiro:
+            if item[0] == "grafico":
+                _, titulo, idx = item
+                mostrar_png(pngs[idx], titulo, figuras_relatorio)
+            elif item[0] == "respostas":
+                _, col, serie_txt, termos = item
+                if respostas_com_de is not None and termos:
+                    termo = st.selectbox("Filtrar respostas pela palavra", ["(todas)"] + termos,
+                                         key=f"sme_termo_{col}")
+                    if termo != "(todas)":
+                        serie_txt = serie_txt.loc[serie_txt.index.intersection(respostas_com_de(col, termo))]
+                st.dataframe(serie_txt.to_frame(col), use_container_width=True)
+            else:
+                getattr(st, item[0])(item[1])
 
         # ======= EXPORTAÇÃO DOCX =======
-        st.sidebar.markdown("---")
-        doc_buffer = io.BytesIO()
-        doc.save(doc_buffer)
-        doc_buffer.seek(0)
-        st.sidebar.download_button(
-            "📥 Baixar relatório (DOCX)",
-            doc_buffer.getvalue(),
-            file_name="Relatorio_Avaliacao.docx",
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        )
+        painel_relatorio(titulo_doc, figuras_relatorio)
 
     else:
         st.info("🔍 Envie uma planilha (.xlsx ou .csv) para iniciar a análise.")
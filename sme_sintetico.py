@@ -0,0 +1,148 @@
+# sme_sintetico.py
+# ------------------------------------------------------------
+# Gerador de respostas sintéticas no formato da exportação do Google Forms
+# (para testar e medir o Modo SME sem dados reais)
+# - nº de linhas e de perguntas configurável
+# - formatos de nota: dígitos ("4"), estrelas ("⭐⭐⭐⭐"), rótulo ("4 - Bom")
+# - perguntas abertas com tamanho de texto configurável
+#
+# Uso:
+#   python sme_sintetico.py respostas.csv --linhas 100000 --perguntas 30
+#   python sme_sintetico.py respostas.xlsx --formatos estrelas rotulo --abertas 3 --palavras 10 60
+# ------------------------------------------------------------
+
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+FORMATOS_NOTA = ("digitos", "estrelas", "rotulo")
+
+ROTULOS_NOTA = {1: "Péssimo", 2: "Ruim", 3: "Regular", 4: "Bom", 5: "Excelente"}
+
+CURSOS_PADRAO = ["Matemática", "Português", "Ciências", "História", "Geografia", "Inglês", "Artes", "Educação Física"]
+MODALIDADES_PADRAO = ["Presencial", "EAD", "Híbrido"]
+
+TEMAS_PERGUNTA = [
+    "O curso atendeu às suas expectativas", "Avalie o conteúdo apresentado", "Avalie o material de apoio",
+    "Avalie a didática do formador", "A carga horária foi adequada", "Avalie a plataforma utilizada",
+    "As atividades práticas foram úteis", "Avalie a organização do curso", "Você recomendaria o curso",
+    "O curso contribuiu para sua prática",
+]
+
+TITULOS_ABERTAS = [
+    "Pontos positivos do curso", "Pontos que poderiam ser melhorados", "Comentários e sugestões",
+    "Observações finais",
+]
+
+VOCABULARIO = (
+    "curso conteúdo material didática formador prática atividades plataforma tempo carga horária "
+    "exemplos aula aulas turma colegas aprendizado escola alunos sala projeto avaliação encontros "
+    "muito bom ótimo excelente interessante cansativo longo curto claro confuso dinâmico útil "
+    "gostei faltou poderia melhorar mais menos sobre para com sem também bastante pouco "
+    "professor professora organização apostila vídeos leitura discussão trocas experiências"
+).split()
+
+
+def _formatar_notas(notas, formato):
+    """Array de notas 1–5 (0 = em branco) → textos da exportação no formato pedido."""
+    if formato == "digitos":
+        textos = {k: str(k) for k in ROTULOS_NOTA}
+    elif formato == "estrelas":
+        textos = {k: "⭐" * k for k in ROTULOS_NOTA}
+    elif formato == "rotulo":
+        textos = {k: f"{k} - {v}" for k, v in ROTULOS_NOTA.items()}
+    else:
+        raise ValueError(f"Formato de nota desconhecido: {formato} (use {', '.join(FORMATOS_NOTA)})")
+    tabela = np.array([None] + [textos[k] for k in sorted(textos)], dtype=object)
+    return tabela[notas]
+
+
+def _textos_livres(rng, n, palavras_min, palavras_max):
+    """n respostas abertas com palavras_min..palavras_max palavras do VOCABULARIO."""
+    tamanhos = rng.integers(palavras_min, palavras_max + 1, size=n)
+    palavras = np.array(VOCABULARIO, dtype=object)[rng.integers(0, len(VOCABULARIO), size=int(tamanhos.sum()))]
+    cortes = np.cumsum(tamanhos)[:-1]
+    return [" ".join(p).capitalize() + "." for p in np.split(palavras, cortes)]
+
+
+def gerar_respostas(linhas=1000, perguntas=20, formatos=FORMATOS_NOTA, abertas=2,
+                    palavras=(5, 30), cursos=None, modalidades=None, fracao_vazias=0.05, semente=0):
+    """
+    DataFrame com cara de exportação do Google Forms:
+    'Carimbo de data/hora', 'Nome completo', 'Selecione o curso',
+    'Modalidade (maior carga horária)', perguntas 1–5 e perguntas abertas.
+      - formatos: formatos de nota usados, em rodízio entre as perguntas
+      - palavras: (mín, máx) de palavras por resposta aberta
+      - fracao_vazias: fração de células em branco nas perguntas
+    Cada curso tem uma "tendência" própria, para os gráficos não ficarem todos iguais.
+    """
+    rng = np.random.default_rng(semente)
+    cursos = list(cursos or CURSOS_PADRAO)
+    modalidades = list(modalidades or MODALIDADES_PADRAO)
+    formatos = list(formatos) or ["digitos"]
+
+    inicio = pd.Timestamp("2024-03-01 08:00:00")
+    segundos = np.sort(rng.integers(0, 120 * 24 * 3600, size=linhas))
+    curso_idx = rng.integers(0, len(cursos), size=linhas)
+
+    dados = {
+        "Carimbo de data/hora": (inicio + pd.to_timedelta(segundos, unit="s")).strftime("%d/%m/%Y %H:%M:%S"),
+        "Nome completo": [f"Participante {i + 1}" for i in range(linhas)],
+        "Selecione o curso": np.array(cursos, dtype=object)[curso_idx],
+        "Modalidade (maior carga horária)": np.array(modalidades, dtype=object)[rng.integers(0, len(modalidades), size=linhas)],
+    }
+
+    # probabilidades das notas 1..5 por curso (tendência sorteada por curso)
+    tendencia = rng.dirichlet([1, 1.5, 3, 5, 4], size=len(cursos))
+    acumulada = np.cumsum(tendencia, axis=1)[curso_idx]
+    for q in range(perguntas):
+        titulo = f"{q + 1}. {TEMAS_PERGUNTA[q % len(TEMAS_PERGUNTA)]}?"
+        notas = (rng.random(linhas)[:, None] > acumulada).sum(axis=1) + 1
+        notas = np.minimum(notas, 5)
+        notas[rng.random(linhas) < fracao_vazias] = 0
+        dados[titulo] = _formatar_notas(notas, formatos[q % len(formatos)])
+
+    for a in range(abertas):
+        titulo = TITULOS_ABERTAS[a % len(TITULOS_ABERTAS)]
+        if a >= len(TITULOS_ABERTAS):
+            titulo += f" ({a // len(TITULOS_ABERTAS) + 1})"
+        textos = np.array(_textos_livres(rng, linhas, *palavras), dtype=object)
+        textos[rng.random(linhas) < fracao_vazias * 4] = None  # abertas ficam mais em branco
+        dados[titulo] = textos
+
+    return pd.DataFrame(dados)
+
+
+def salvar_respostas(df, caminho):
+    """Grava como .csv (UTF-8) ou .xlsx, conforme a extensão."""
+    if caminho.lower().endswith(".xlsx"):
+        df.to_excel(caminho, index=False, sheet_name="Respostas ao formulário 1")
+    else:
+        df.to_csv(caminho, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera respostas sintéticas (formato Google Forms) para o Modo SME.")
+    parser.add_argument("arquivo", help="arquivo de saída (.csv ou .xlsx)")
+    parser.add_argument("--linhas", type=int, default=1000)
+    parser.add_argument("--perguntas", type=int, default=20, help="nº de perguntas 1–5")
+    parser.add_argument("--formatos", nargs="+", default=list(FORMATOS_NOTA), choices=FORMATOS_NOTA,
+                        help="formatos de nota, em rodízio entre as perguntas")
+    parser.add_argument("--abertas", type=int, default=2, help="nº de perguntas abertas")
+    parser.add_argument("--palavras", type=int, nargs=2, default=[5, 30], metavar=("MIN", "MAX"),
+                        help="palavras por resposta aberta")
+    parser.add_argument("--vazias", type=float, default=0.05, help="fração de respostas em branco")
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    df = gerar_respostas(args.linhas, args.perguntas, args.formatos, args.abertas, tuple(args.palavras),
+                         fracao_vazias=args.vazias, semente=args.semente)
+    salvar_respostas(df, args.arquivo)
+    print(f"{len(df)} linhas × {len(df.columns)} colunas → {args.arquivo}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
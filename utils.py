@@ -7,14 +7,15 @@ import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
-import sqlite3
-import unicodedata
+
+from cache_local import png_grafico
 
 # =========================
 # Constantes globais
 # =========================
 
 CATEGORIAS_VALIDAS = ["Socialização", "Linguagem", "Cognição", "Auto cuidado", "Desenvolvimento Motor"]
+RESPOSTAS_PORTAGE = ["Sim", "Às vezes", "Não"]
 
 EDM_DOMINIOS = [
     "fina",        # Motricidade Fina
@@ -64,6 +65,48 @@ EXPECTED_COLS = [
 ]
 
 
+# =========================
+# Contagem de respostas (Portage)
+# =========================
+
+def mapa_colunas_categorias(colunas, categorias) -> pd.DataFrame:
+    """Pares (coluna, categoria) das colunas que começam com o nome de cada categoria."""
+    pares = [(col, cat) for cat in categorias for col in colunas if str(col).startswith(cat)]
+    return pd.DataFrame(pares, columns=["coluna", "categoria"])
+
+
+def contar_respostas_categorias(df: pd.DataFrame, categorias, limpar: bool = False) -> pd.DataFrame:
+    """
+    Contagem de "Sim" / "Às vezes" / "Não" por categoria (linhas = categorias), numa única passada:
+    as colunas de pergunta viram uma coluna longa (melt) de respostas categóricas,
+    contadas por pergunta e somadas por categoria pelo mapa coluna → categoria.
+      - limpar: ignora espaços nas pontas e compara o texto (str) da resposta
+    """
+    categorias = list(categorias)
+    mapa = mapa_colunas_categorias(df.columns, categorias)
+    if mapa.empty:
+        return pd.DataFrame(0, index=categorias, columns=RESPOSTAS_PORTAGE, dtype="int64")
+
+    colunas = list(dict.fromkeys(mapa["coluna"]))
+    longo = df[colunas].melt(var_name="coluna", value_name="resposta")
+    respostas = longo["resposta"]
+    if limpar:
+        respostas = respostas.dropna().astype(str).str.strip().reindex(respostas.index)
+    longo["resposta"] = pd.Categorical(respostas, categories=RESPOSTAS_PORTAGE)
+    longo["coluna"] = pd.Categorical(longo["coluna"], categories=colunas)
+
+    por_coluna = longo.groupby(["coluna", "resposta"], observed=False).size().unstack("resposta")
+    por_categoria = (
+        mapa.join(por_coluna, on="coluna")
+        .groupby("categoria", sort=False)[RESPOSTAS_PORTAGE].sum()
+        .reindex(categorias, fill_value=0)
+        .astype("int64")
+    )
+    por_categoria.index.name = None
+    por_categoria.columns = pd.Index(RESPOSTAS_PORTAGE)
+    return por_categoria
+
+
 # =========================
 # Gráficos simples
 # =========================
@@ -76,18 +119,10 @@ def gerar_grafico_respostas(df: pd.DataFrame, categoria_selecionada: str = "Toda
     fig, ax = plt.subplots(figsize=(largura, altura))
 
     categorias = CATEGORIAS_VALIDAS if categoria_selecionada == "Todas" else [categoria_selecionada]
-    contagem_respostas = {"Sim": 0, "Às vezes": 0, "Não": 0}
-
-    for categoria in categorias:
-        colunas_categoria = [col for col in df.columns if str(col).startswith(categoria)]
-        for col in colunas_categoria:
-            respostas = df[col].dropna().astype(str).str.strip()
-            contagem_respostas["Sim"] += (respostas == "Sim").sum()
-            contagem_respostas["Às vezes"] += (respostas == "Às vezes").sum()
-            contagem_respostas["Não"] += (respostas == "Não").sum()
+    contagem_respostas = contar_respostas_categorias(df, categorias, limpar=True).sum()
 
     cores = ["#2E7D32", "#FFC107", "#D32F2F"]
-    ax.bar(list(contagem_respostas.keys()), list(contagem_respostas.values()), color=cores)
+    ax.bar(contagem_respostas.index.tolist(), contagem_respostas.values.tolist(), color=cores)
     ax.set_title(f"Contagem de Respostas - {categoria_selecionada}")
     ax.set_ylabel("Quantidade")
     return fig, ax
@@ -135,64 +170,84 @@ def quebrar_rotulo(texto, limite: int = 15) -> str:
 # Análise geral (AH/SD)
 # =========================
 
-def analisar_todos_os_alunos():
-    st.subheader("📊 Análise Geral de Todos os Alunos")
-    conn = sqlite3.connect("respostas_ahsd.db")
-    c = conn.cursor()
-    c.execute("SELECT aluno, bloco, resposta FROM respostas")
-    dados = c.fetchall()
-    conn.close()
+def desenhar_radar_blocos(medias_blocos, titulo, escala=5):
+    """
+    Radar das médias (0–4) por bloco do questionário AH/SD.
+    'medias_blocos' pode ser dict {bloco: média} ou Series indexada por bloco.
+    """
+    medias = dict(medias_blocos)
+    labels = list(medias.keys())
+    valores = list(medias.values())
+    labels_plot = labels + [labels[0]]
+    valores_plot = valores + [valores[0]]
+    angles = np.linspace(0, 2 * np.pi, len(labels), endpoint=False).tolist()
+    angles += angles[:1]
 
-    if not dados:
-        st.info("Ainda não há respostas registradas.")
-        return
+    fig, ax = plt.subplots(figsize=(escala, escala * 0.8), subplot_kw=dict(polar=True))
+    ax.plot(angles, valores_plot, linewidth=2, linestyle='solid', marker='o')
+    ax.fill(angles, valores_plot, alpha=0.25)
+    ax.set_yticks([0, 1, 2, 3, 4])
+    ax.set_yticklabels(['0', '1', '2', '3', '4'], fontsize=8)
+    ax.set_ylim(0, 4)
+    ax.set_xticks(angles)
+    ax.set_xticklabels(labels_plot, fontsize=9)
+    ax.set_title(titulo, size=13, pad=10)
+    return fig
 
-    df = pd.DataFrame(dados, columns=["Aluno", "Bloco", "Resposta"])
 
-    # Remove o bloco "Descritivo" da análise
-    df = df[df["Bloco"] != "Descritivo"]
+def png_radar_blocos(medias_blocos, titulo, escala=5):
+    """PNG do radar por bloco, memoizado pelo cache compartilhado de gráficos."""
+    return png_grafico(
+        "ahsd_radar", medias_blocos, escala, escala * 0.8,
+        lambda: desenhar_radar_blocos(medias_blocos, titulo, escala),
+        opcoes=titulo,
+    )
 
-    mapa_respostas = {"Nunca": 0, "Raramente": 1, "Às vezes": 2, "As vezes": 2, "Frequentemente": 3, "Sempre": 4}
-    mapa_diagnostico = {"Sim": 4, "Não": 0, "Altas": 4, "Alta": 4, "Média": 2, "Medias": 2, "Médias": 2, "Baixa": 0, "Baixas": 0}
 
-    df["RespostaNum"] = df["Resposta"].apply(lambda x: unicodedata.normalize("NFKD", str(x).strip()).encode("ASCII", "ignore").decode("utf-8"))
-    df["RespostaNum"] = df["RespostaNum"].map(mapa_respostas).fillna(df["RespostaNum"].map(mapa_diagnostico))
-    df["RespostaNum"] = pd.to_numeric(df["RespostaNum"], errors="coerce")
+def analisar_todos_os_alunos():
+    st.subheader("📊 Análise Geral de Todos os Alunos")
+    # importado aqui: utils também roda nos processos dos relatórios CMAE, que não usam o banco AH/SD
+    from banco_ahsd import conectar
+
+    # Médias calculadas no banco (GROUP BY sobre os pontos gravados na importação):
+    # só volta uma linha por bloco e uma por aluno, não as respostas
+    conn = conectar()
+    media_blocos = pd.read_sql_query("""
+        SELECT b.nome AS Bloco, AVG(r.pontos) AS media
+        FROM respostas r JOIN blocos b ON b.id = r.bloco_id
+        WHERE b.nome <> 'Descritivo'
+        GROUP BY r.bloco_id
+        ORDER BY b.nome
+    """, conn, index_col="Bloco")["media"]
+    ranking = pd.read_sql_query("""
+        SELECT a.nome AS Aluno, AVG(r.pontos) AS media
+        FROM respostas r JOIN alunos a ON a.id = r.aluno_id JOIN blocos b ON b.id = r.bloco_id
+        WHERE b.nome <> 'Descritivo'
+        GROUP BY r.aluno_id
+        ORDER BY media IS NULL, media DESC, a.nome
+    """, conn)
+
+    if ranking.empty:
+        st.info("Ainda não há respostas registradas.")
+        return
 
-    # Média por bloco (geral)
+    # Média por bloco (geral), sem o bloco "Descritivo"
     st.subheader("📚 Média Geral por Bloco")
-    media_blocos = df.groupby("Bloco", dropna=False)["RespostaNum"].mean().round(2)
+    media_blocos = media_blocos.round(2)
     st.bar_chart(media_blocos)
 
     # Média geral por aluno
     st.subheader("🏅 Ranking de Alunos por Média Geral")
-    ranking = df.groupby("Aluno", dropna=False)["RespostaNum"].mean().sort_values(ascending=False).round(2)
-    st.dataframe(ranking.reset_index().rename(columns={"RespostaNum": "Média Geral"}), use_container_width=True)
+    ranking["media"] = ranking["media"].round(2)
+    st.dataframe(ranking.rename(columns={"media": "Média Geral"}), use_container_width=True)
 
     # Radar da média por bloco (todos os alunos)
     st.subheader("📈 Radar da Média Geral por Bloco")
     if len(media_blocos) > 1:
-        labels = list(media_blocos.index)
-        valores = list(media_blocos.values)
-        labels_plot = labels + [labels[0]]
-        valores_plot = valores + [valores[0]]
-        angles = np.linspace(0, 2 * np.pi, len(labels), endpoint=False).tolist()
-        angles += angles[:1]
-
         escala = st.slider("📐 Escala visual do gráfico", 3, 8, 5)
         col1, col2, col3 = st.columns([1, 6, 1])
         with col2:
-            fig, ax = plt.subplots(figsize=(escala, escala * 0.8), subplot_kw=dict(polar=True))
-            ax.plot(angles, valores_plot, linewidth=2, linestyle='solid', marker='o')
-            ax.fill(angles, valores_plot, alpha=0.25)
-            ax.set_yticks([0, 1, 2, 3, 4])
-            ax.set_yticklabels(['0', '1', '2', '3', '4'], fontsize=8)
-            ax.set_ylim(0, 4)
-            ax.set_xticks(angles)
-            ax.set_xticklabels(labels_plot, fontsize=9)
-            ax.set_title('Radar – Média Geral por Bloco', size=13, pad=10)
-            st.pyplot(fig)
-            plt.close(fig)
+            st.image(png_radar_blocos(media_blocos, 'Radar – Média Geral por Bloco', escala))
     else:
         st.info("Não há dados suficientes para exibir o gráfico radar.")
 